@@ -0,0 +1,222 @@
+# backend/allowances.py
+"""
+Fotografia diária dos orçamentos: saldo de abertura e meta do dia.
+
+`ver orçamentos`, `ver hoje` e o retorno depois de cada gasto calculavam, a
+cada mensagem, o saldo do mês de cada orçamento a partir das transações
+(uma consulta por categoria) e o dia corrente com `datetime.now()` do
+servidor, às vezes com início de mês em UTC e dia do mês no horário local.
+
+Agora o cron diário grava `daily_allowances/{uid}_{AAAA-MM-DD}` com, para o
+dia local do usuário:
+
+- `dayStart`/`dayEnd`/`monthStart`: os limites do dia e do mês em UTC,
+  calculados uma única vez no fuso do usuário;
+- `daysRemaining`: dias até o fim do mês, contando hoje;
+- `spentBeforeToday`: gasto do mês por categoria até o início de hoje;
+- `budgets`: para cada orçamento do mês, o saldo de abertura e a meta diária.
+
+Durante o dia os comandos só somam a isso o gasto de hoje (uma consulta a
+partir de `dayStart`). A meta do dia é fixa: não encolhe a cada gasto.
+
+O fuso é o campo `timezone` (nome IANA, ex. "America/Manaus") do documento
+`users/{uid}`; sem ele vale `DEFAULT_TIMEZONE`. Se a fotografia do dia ainda
+não existe (usuário em fuso à frente do horário do cron), o primeiro comando
+a calcula e grava.
+
+Orçamentos alterados durante o dia usam o valor novo (o saldo de abertura
+sai de `spentBeforeToday`). Lançamentos retroativos feitos pelo dashboard
+só entram na fotografia do dia seguinte.
+"""
+
+import calendar
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from cachetools import LRUCache
+from clients import FieldFilter, firestore
+from tracing import span
+
+ALLOWANCES_COLLECTION = 'daily_allowances'
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "America/Sao_Paulo")
+ALLOWANCE_WORKERS = int(os.getenv("ALLOWANCE_WORKERS", "8"))
+ALLOWANCE_CHUNK_SIZE = int(os.getenv("ALLOWANCE_CHUNK_SIZE", "50"))
+
+
+def user_zone(name: str | None) -> ZoneInfo:
+    """O fuso do usuário; nomes ausentes ou inválidos caem em DEFAULT_TIMEZONE."""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"Fuso horário inválido: {name!r}; usando {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def _local_midnight(day: date, zone: ZoneInfo) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=zone).astimezone(timezone.utc)
+
+
+def local_day(now: datetime, zone: ZoneInfo) -> dict:
+    """Limites (em UTC) do dia e do mês locais que contêm `now`."""
+    today = now.astimezone(zone).date()
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    return {
+        'date': today.isoformat(),
+        'month': today.month,
+        'year': today.year,
+        'dayStart': _local_midnight(today, zone),
+        'dayEnd': _local_midnight(today + timedelta(days=1), zone),
+        'monthStart': _local_midnight(today.replace(day=1), zone),
+        'daysInMonth': days_in_month,
+        'daysRemaining': days_in_month - today.day + 1,
+    }
+
+
+def snapshot_doc_id(firebase_uid: str, day: str) -> str:
+    return f"{firebase_uid}_{day}"
+
+
+def load_timezones(db, firebase_uids: list[str]) -> dict[str, str | None]:
+    """Lê o campo `timezone` de `users/{uid}` numa única chamada."""
+    refs = [db.collection('users').document(uid) for uid in firebase_uids]
+    with span('firestore.get_all', collection='users', docs=len(refs)):
+        return {doc.id: (doc.to_dict() or {}).get('timezone') if doc.exists else None
+                for doc in db.get_all(refs, field_paths=['timezone'])}
+
+
+def category_allowance(snapshot: dict, category_name: str, budget_amount: float) -> tuple[float, float]:
+    """(saldo de abertura, meta diária) de um orçamento, pela fotografia do dia."""
+    opening = budget_amount - snapshot['spentBeforeToday'].get(category_name, 0)
+    days = snapshot['daysRemaining']
+    return opening, opening / days if days > 0 else 0
+
+
+def compute_snapshot(db, firebase_uid: str, zone_name: str | None, now: datetime) -> dict:
+    """Calcula a fotografia do dia local de um usuário (duas leituras)."""
+    zone = user_zone(zone_name)
+    day = local_day(now, zone)
+
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('userId', '==', firebase_uid))
+         .where(filter=FieldFilter('type', '==', 'expense'))
+         .where(filter=FieldFilter('createdAt', '>=', day['monthStart']))
+         .where(filter=FieldFilter('createdAt', '<', day['dayStart']))
+         .select(['category', 'amount']))
+    spent = {}
+    with span('firestore.query', collection='transactions', range='month_before_today'):
+        for doc in q.stream():
+            t = doc.to_dict()
+            category = t.get('category') or 'Outros'
+            spent[category] = spent.get(category, 0) + t.get('amount', 0)
+
+    budgets_q = (db.collection('budgets')
+                 .where(filter=FieldFilter('userId', '==', firebase_uid))
+                 .where(filter=FieldFilter('month', '==', day['month']))
+                 .where(filter=FieldFilter('year', '==', day['year'])))
+    with span('firestore.query', collection='budgets', filters=['month', 'year']):
+        budgets = [doc.to_dict() for doc in budgets_q.stream()]
+
+    snapshot = {'userId': firebase_uid, 'timezone': zone.key, **day, 'spentBeforeToday': spent}
+    snapshot['budgets'] = []
+    for budget in sorted(budgets, key=lambda b: b.get('categoryName', '')):
+        if budget.get('amount', 0) <= 0:
+            continue
+        opening, daily = category_allowance(snapshot, budget['categoryName'], budget['amount'])
+        snapshot['budgets'].append({'categoryName': budget['categoryName'], 'amount': budget['amount'],
+                                    'openingRemaining': opening, 'dailyAllowance': daily})
+    return snapshot
+
+
+def build_snapshots(db, firebase_uids: list[str], now: datetime | None = None) -> int:
+    """
+    Calcula e grava a fotografia do dia de todos os usuários, em blocos de
+    ALLOWANCE_CHUNK_SIZE processados por ALLOWANCE_WORKERS threads, um lote
+    por bloco. Devolve quantas foram gravadas.
+    """
+    now = now or datetime.now(timezone.utc)
+    zones = load_timezones(db, firebase_uids) if firebase_uids else {}
+    written = 0
+
+    def compute(firebase_uid):
+        try:
+            return compute_snapshot(db, firebase_uid, zones.get(firebase_uid), now)
+        except Exception as e:
+            print(f"Erro ao calcular a meta diária do usuário {firebase_uid}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=ALLOWANCE_WORKERS) as executor:
+        for i in range(0, len(firebase_uids), ALLOWANCE_CHUNK_SIZE):
+            chunk = firebase_uids[i:i + ALLOWANCE_CHUNK_SIZE]
+            # copy_context: os spans das threads continuam no trace do cron
+            futures = [executor.submit(contextvars.copy_context().run, compute, uid) for uid in chunk]
+            batch = db.batch()
+            count = 0
+            for future in futures:
+                snapshot = future.result()
+                if snapshot is None:
+                    continue
+                doc_id = snapshot_doc_id(snapshot['userId'], snapshot['date'])
+                batch.set(db.collection(ALLOWANCES_COLLECTION).document(doc_id), {**snapshot, 'computedAt': firestore.SERVER_TIMESTAMP})
+                count += 1
+            with span('firestore.commit', collection=ALLOWANCES_COLLECTION, writes=count):
+                batch.commit()
+            written += count
+    return written
+
+
+class AllowanceSnapshots:
+    """
+    Fotografias do dia em memória, por usuário, até o fim do dia local
+    (`dayEnd`). Um acerto não faz nenhuma leitura, nem a do fuso.
+    """
+
+    def __init__(self, db, maxsize: int = 4096):
+        self.db = db
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, firebase_uid: str, now: datetime | None = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            snapshot = self._cache.get(firebase_uid)
+        if snapshot is not None and snapshot['dayStart'] <= now < snapshot['dayEnd']:
+            return snapshot
+
+        zone_name = load_timezones(self.db, [firebase_uid]).get(firebase_uid)
+        zone = user_zone(zone_name)
+        day = local_day(now, zone)
+        ref = self.db.collection(ALLOWANCES_COLLECTION).document(snapshot_doc_id(firebase_uid, day['date']))
+        with span('firestore.get', collection=ALLOWANCES_COLLECTION):
+            doc = ref.get()
+        snapshot = doc.to_dict() if doc.exists else None
+        if snapshot is None or snapshot.get('timezone') != zone.key:
+            snapshot = compute_snapshot(self.db, firebase_uid, zone_name, now)
+            with span('firestore.set', collection=ALLOWANCES_COLLECTION):
+                ref.set({**snapshot, 'computedAt': firestore.SERVER_TIMESTAMP})
+        with self._lock:
+            self._cache[firebase_uid] = snapshot
+        return snapshot
+
+    def spent_today(self, snapshot: dict, category_name: str | None = None) -> tuple[dict[str, float], set[str]]:
+        """
+        Gasto de hoje (desde `dayStart`) por categoria: o delta sobre a
+        fotografia. Devolve também os IDs das transações somadas.
+        """
+        q = (self.db.collection('transactions')
+             .where(filter=FieldFilter('userId', '==', snapshot['userId']))
+             .where(filter=FieldFilter('type', '==', 'expense')))
+        if category_name is not None:
+            q = q.where(filter=FieldFilter('category', '==', category_name))
+        q = q.where(filter=FieldFilter('createdAt', '>=', snapshot['dayStart'])).select(['category', 'amount'])
+        spent, transaction_ids = {}, set()
+        with span('firestore.query', collection='transactions', range='day'):
+            for doc in q.stream():
+                t = doc.to_dict()
+                category = t.get('category') or 'Outros'
+                spent[category] = spent.get(category, 0) + t.get('amount', 0)
+                transaction_ids.add(doc.id)
+        return spent, transaction_ids
@@ -0,0 +1,225 @@
+# backend/archive.py
+"""
+Arquivamento das transações antigas em armazenamento frio.
+
+Meses anteriores ao horizonte (`ARCHIVE_HORIZON_MONTHS`, padrão 12) são
+compactados, um mês por vez e do mais antigo para o mais novo:
+
+1. UMA consulta por intervalo traz todas as transações do mês (de todos os
+   usuários), agrupadas por usuário em memória;
+2. as linhas de cada usuário vão para um blob NDJSON comprimido com gzip,
+   `transactions/{uid}/{ano}-{mês}.ndjson.gz`, no bucket `ARCHIVE_BUCKET`
+   do Cloud Storage;
+3. um resumo `monthly_summaries/{uid}_{ano}_{mês}` guarda os totais por
+   tipo, categoria e conta;
+4. só então as transações são apagadas do Firestore, em lotes.
+
+Se o job for interrompido no meio, rodar de novo é seguro: o blob existente
+é mesclado (por id) com as linhas que restaram antes de ser regravado.
+
+Sem `ARCHIVE_BUCKET` o job se recusa a rodar: no Vercel o disco local some
+com a instância, e apagar as linhas depois de gravar o blob ali perderia as
+transações. Para desenvolvimento e testes, `ARCHIVE_DIR` aponta
+explicitamente um diretório local.
+
+Para períodos arquivados, as leituras devem usar `monthly_totals`, que lê o
+resumo em vez das linhas. O dashboard (ReportsPage, Dashboard) ainda lê só
+`transactions`, por isso o cron `/api/archive` não está agendado no
+vercel.json: meses arquivados sumiriam das telas de histórico.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+from clients import FieldFilter, firestore
+from tracing import span
+
+SUMMARIES_COLLECTION = 'monthly_summaries'
+ARCHIVE_HORIZON_MONTHS = int(os.getenv("ARCHIVE_HORIZON_MONTHS", "12"))
+ARCHIVE_MAX_MONTHS_PER_RUN = int(os.getenv("ARCHIVE_MAX_MONTHS_PER_RUN", "3"))
+ARCHIVE_BUCKET = os.getenv("ARCHIVE_BUCKET")
+# Só desenvolvimento e testes: diretório local, usado apenas se definido
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+# Previsões leem 3 meses de histórico + o mês atual; o horizonte não pode ser menor
+MIN_HORIZON_MONTHS = 4
+DELETE_BATCH_SIZE = 500
+
+
+def summary_doc_id(firebase_uid: str, year: int, month: int) -> str:
+    return f"{firebase_uid}_{year}_{month:02d}"
+
+
+def archive_path(firebase_uid: str, year: int, month: int) -> str:
+    return f"transactions/{firebase_uid}/{year}-{month:02d}.ndjson.gz"
+
+
+def add_months(when: datetime, months: int) -> datetime:
+    index = when.year * 12 + when.month - 1 + months
+    return when.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+# --- ARMAZENAMENTO ---
+class LocalArchiveStore:
+    """Blobs como arquivos num diretório local (desenvolvimento e testes)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def read(self, path: str) -> bytes | None:
+        try:
+            with open(os.path.join(self.directory, path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, path: str, data: bytes):
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+
+class GCSArchiveStore:
+    """Blobs num bucket do Cloud Storage."""
+
+    def __init__(self, bucket_name: str):
+        from google.cloud import storage
+        self.bucket = storage.Client().bucket(bucket_name)
+
+    def read(self, path: str) -> bytes | None:
+        blob = self.bucket.blob(path)
+        return blob.download_as_bytes() if blob.exists() else None
+
+    def write(self, path: str, data: bytes):
+        self.bucket.blob(path).upload_from_string(data, content_type='application/gzip')
+
+
+def get_archive_store():
+    if ARCHIVE_BUCKET:
+        return GCSArchiveStore(ARCHIVE_BUCKET)
+    if ARCHIVE_DIR:
+        return LocalArchiveStore(ARCHIVE_DIR)
+    raise RuntimeError("ARCHIVE_BUCKET não definido: sem armazenamento durável, o arquivamento apagaria as transações "
+                       "(defina ARCHIVE_DIR para usar um diretório local em desenvolvimento)")
+
+
+def encode_rows(rows: dict[str, dict]) -> bytes:
+    lines = (json.dumps({'id': doc_id, **data}, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v), ensure_ascii=False)
+             for doc_id, data in sorted(rows.items()))
+    return gzip.compress(("\n".join(lines) + "\n").encode('utf-8'))
+
+
+def decode_rows(blob: bytes) -> dict[str, dict]:
+    rows = {}
+    for line in gzip.decompress(blob).decode('utf-8').splitlines():
+        if line:
+            row = json.loads(line)
+            rows[row.pop('id')] = row
+    return rows
+
+
+# --- RESUMOS ---
+def summarize(rows: dict[str, dict]) -> dict:
+    """Totais por tipo, por tipo e categoria e o saldo líquido por conta."""
+    summary = {'count': len(rows), 'income': 0.0, 'expense': 0.0, 'byCategory': {}, 'byAccount': {}}
+    for row in rows.values():
+        entry_type, amount = row.get('type'), row.get('amount', 0)
+        if entry_type not in ('income', 'expense'):
+            continue
+        summary[entry_type] += amount
+        by_category = summary['byCategory'].setdefault(entry_type, {})
+        category = row.get('category') or 'Outros'
+        by_category[category] = by_category.get(category, 0) + amount
+        if row.get('accountId'):
+            sign = 1 if entry_type == 'income' else -1
+            summary['byAccount'][row['accountId']] = summary['byAccount'].get(row['accountId'], 0) + sign * amount
+    return summary
+
+
+def monthly_totals(db, firebase_uid: str, year: int, month: int) -> dict:
+    """
+    Totais de um mês do usuário: do resumo, se o mês já foi arquivado;
+    senão, calculados a partir das transações.
+    """
+    with span('firestore.get', collection=SUMMARIES_COLLECTION):
+        summary_doc = db.collection(SUMMARIES_COLLECTION).document(summary_doc_id(firebase_uid, year, month)).get()
+    if summary_doc.exists:
+        return summary_doc.to_dict()
+
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('userId', '==', firebase_uid))
+         .where(filter=FieldFilter('createdAt', '>=', start))
+         .where(filter=FieldFilter('createdAt', '<', add_months(start, 1))))
+    with span('firestore.query', collection='transactions', range='month'):
+        return summarize({doc.id: doc.to_dict() for doc in q.stream()})
+
+
+# --- JOB ---
+def archive_month(db, store, month_start: datetime) -> dict[str, int]:
+    """Arquiva um mês de todos os usuários. Devolve firebase_uid -> linhas arquivadas."""
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('createdAt', '>=', month_start))
+         .where(filter=FieldFilter('createdAt', '<', add_months(month_start, 1))))
+    with span('firestore.query', collection='transactions', range='archive_month'):
+        docs = list(q.stream())
+
+    by_user = {}
+    for doc in docs:
+        data = doc.to_dict()
+        by_user.setdefault(data.get('userId') or '', {})[doc.id] = data
+
+    archived = {}
+    for firebase_uid, rows in by_user.items():
+        if not firebase_uid:
+            continue
+        path = archive_path(firebase_uid, month_start.year, month_start.month)
+        previous = store.read(path)
+        all_rows = {**decode_rows(previous), **rows} if previous else rows
+        with span('archive.write', path=path, rows=len(all_rows)):
+            store.write(path, encode_rows(all_rows))
+
+        summary = summarize(all_rows)
+        summary.update({'userId': firebase_uid, 'year': month_start.year, 'month': month_start.month,
+                        'archivePath': path, 'archivedAt': firestore.SERVER_TIMESTAMP})
+        db.collection(SUMMARIES_COLLECTION).document(summary_doc_id(firebase_uid, month_start.year, month_start.month)).set(summary)
+
+        # Apaga só depois que o blob e o resumo estão gravados
+        doc_ids = list(rows)
+        for i in range(0, len(doc_ids), DELETE_BATCH_SIZE):
+            batch = db.batch()
+            for doc_id in doc_ids[i:i + DELETE_BATCH_SIZE]:
+                batch.delete(db.collection('transactions').document(doc_id))
+            with span('firestore.commit', collection='transactions', deletes=len(doc_ids[i:i + DELETE_BATCH_SIZE])):
+                batch.commit()
+        archived[firebase_uid] = len(rows)
+    return archived
+
+
+def run_archive(db, store=None, now: datetime | None = None, horizon_months: int = ARCHIVE_HORIZON_MONTHS,
+                max_months: int = ARCHIVE_MAX_MONTHS_PER_RUN) -> list[tuple[str, int]]:
+    """
+    Arquiva até `max_months` meses anteriores ao horizonte, a partir do mais
+    antigo que ainda tem transações. Devolve [(ano-mês, linhas arquivadas)].
+    """
+    if horizon_months < MIN_HORIZON_MONTHS:
+        raise ValueError(f"ARCHIVE_HORIZON_MONTHS deve ser pelo menos {MIN_HORIZON_MONTHS}")
+    store = store or get_archive_store()
+    now = now or datetime.now(timezone.utc)
+    cutoff = add_months(now.replace(hour=0, minute=0, second=0, microsecond=0), -horizon_months)
+
+    oldest = next(db.collection('transactions').order_by('createdAt').limit(1).stream(), None)
+    if oldest is None:
+        return []
+    month_start = oldest.to_dict()['createdAt'].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    results = []
+    while month_start < cutoff and len(results) < max_months:
+        archived = archive_month(db, store, month_start)
+        results.append((month_start.strftime('%Y-%m'), sum(archived.values())))
+        month_start = add_months(month_start, 1)
+    return results
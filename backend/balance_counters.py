@@ -0,0 +1,104 @@
+# backend/balance_counters.py
+"""
+Contador distribuído (opcional) para o saldo das contas.
+
+Uma conta entra no modo distribuído quando o documento `accounts/{id}` tem
+o campo `balanceShards: N`. A partir daí cada lançamento incrementa um dos
+N documentos `accounts/{id}/balance_shards/{0..N-1}` escolhido ao acaso, em
+vez do próprio documento da conta, fugindo do limite de ~1 escrita/s por
+documento do Firestore.
+
+O saldo real é sempre `balance` (do documento da conta) + a soma dos shards.
+Assim os incrementos que o dashboard faz direto em `balance` continuam
+válidos, e `fold` pode consolidar os shards de volta em `balance`.
+
+`overlay(account_id)`, se definido, soma ao saldo lido o que ainda não foi
+gravado no Firestore (os lançamentos no journal, ver journal.py).
+"""
+
+import random
+import threading
+
+from cachetools import TTLCache
+from clients import firestore
+from tracing import span
+
+SHARDS_FIELD = 'balanceShards'
+SHARDS_COLLECTION = 'balance_shards'
+
+
+def shard_count(account: dict | None) -> int:
+    return int((account or {}).get(SHARDS_FIELD) or 0)
+
+
+class BalanceCounters:
+    """Leitura e escrita de saldos, transparente para contas com ou sem shards."""
+
+    def __init__(self, db, cache_ttl: float = 30, cache_size: int = 4096):
+        self.db = db
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self.overlay = None
+
+    def _shards_ref(self, account_id: str):
+        return self.db.collection('accounts').document(account_id).collection(SHARDS_COLLECTION)
+
+    def increment(self, batch, account_id: str, account: dict | None, delta: float):
+        """Adiciona ao lote o incremento de saldo da conta."""
+        shards = shard_count(account)
+        if not shards:
+            batch.update(self.db.collection('accounts').document(account_id), {'balance': firestore.firestore.Increment(delta)})
+            return
+
+        shard_ref = self._shards_ref(account_id).document(str(random.randrange(shards)))
+        # set+merge cria o shard na primeira escrita, sem precisar pré-alocar
+        batch.set(shard_ref, {'balance': firestore.firestore.Increment(delta)}, merge=True)
+
+    def ledger_listener(self, firebase_uid: str, entries: list, result, changed: set):
+        """
+        Descarta a soma em cache das contas lançadas, depois do commit: antes
+        dele, uma leitura concorrente voltaria a guardar a soma antiga.
+        """
+        for account_id in {entry.account_id for entry in entries if entry.account_id}:
+            self.invalidate(account_id)
+
+    def invalidate(self, account_id: str):
+        with self._lock:
+            self._cache.pop(account_id, None)
+
+    def read(self, account_id: str, account: dict) -> float:
+        """Saldo atual da conta. Para contas com shards, soma e guarda em cache."""
+        base = account.get('balance', 0)
+        if self.overlay is not None:
+            base += self.overlay(account_id)
+        if not shard_count(account):
+            return base
+
+        with self._lock:
+            cached = self._cache.get(account_id)
+        if cached is None:
+            with span('firestore.query', collection=SHARDS_COLLECTION):
+                cached = sum(doc.to_dict().get('balance', 0) for doc in self._shards_ref(account_id).stream())
+            with self._lock:
+                self._cache[account_id] = cached
+        return base + cached
+
+    def fold(self, account_id: str) -> float:
+        """
+        Consolida os shards em `balance` num único lote (usado pelo cron).
+        Só usa incrementos, então escritas concorrentes não se perdem.
+        """
+        shard_docs = list(self._shards_ref(account_id).stream())
+        total = sum(doc.to_dict().get('balance', 0) for doc in shard_docs)
+        if not total:
+            return 0
+
+        batch = self.db.batch()
+        for doc in shard_docs:
+            value = doc.to_dict().get('balance', 0)
+            if value:
+                batch.update(doc.reference, {'balance': firestore.firestore.Increment(-value)})
+        batch.update(self.db.collection('accounts').document(account_id), {'balance': firestore.firestore.Increment(total)})
+        batch.commit()
+        self.invalidate(account_id)
+        return total
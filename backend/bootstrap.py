@@ -0,0 +1,137 @@
+# backend/bootstrap.py
+"""
+Carga inicial do dashboard numa única resposta (`GET /api/bootstrap`).
+
+No primeiro carregamento o dashboard dispara consultas separadas para
+categorias, contas, transações, orçamentos, metas e contas a pagar, cada
+componente na sua vez. Aqui o backend faz essas leituras em paralelo e
+devolve só o necessário para a primeira tela:
+
+- contas com o saldo (incluindo os shards, ver balance_counters.py);
+- categorias;
+- orçamentos do mês com o gasto até agora;
+- metas ativas;
+- as próximas contas a pagar pendentes;
+- totais do mês (renda, despesa, despesa por categoria);
+- a previsão de fim de mês, se o cron já a calculou.
+
+Datas saem em ISO 8601 e os campos mantêm os nomes do Firestore.
+"""
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from clients import FieldFilter
+from tracing import span
+
+BOOTSTRAP_WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", "6"))
+BOOTSTRAP_UPCOMING_BILLS = int(os.getenv("BOOTSTRAP_UPCOMING_BILLS", "5"))
+
+ACCOUNT_FIELDS = ('accountName', 'isDefault', 'isReserve')
+CATEGORY_FIELDS = ('name', 'type')
+GOAL_FIELDS = ('goalName', 'targetAmount', 'savedAmount', 'targetDate', 'status')
+BILL_FIELDS = ('description', 'amount', 'categoryName', 'dueDate', 'isRecurring')
+
+
+def _compact(doc_id: str, data: dict, fields: tuple) -> dict:
+    item = {'id': doc_id}
+    for field in fields:
+        value = data.get(field)
+        if value is not None:
+            item[field] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+def month_aggregates(transactions: list[dict]) -> dict:
+    totals = {'income': 0.0, 'expense': 0.0, 'expenseByCategory': {}, 'count': len(transactions)}
+    for t in transactions:
+        entry_type, amount = t.get('type'), t.get('amount', 0)
+        if entry_type not in ('income', 'expense'):
+            continue
+        totals[entry_type] += amount
+        if entry_type == 'expense':
+            category = t.get('category') or 'Outros'
+            totals['expenseByCategory'][category] = totals['expenseByCategory'].get(category, 0) + amount
+    totals['income'] = round(totals['income'], 2)
+    totals['expense'] = round(totals['expense'], 2)
+    totals['balance'] = round(totals['income'] - totals['expense'], 2)
+    totals['expenseByCategory'] = {k: round(v, 2) for k, v in totals['expenseByCategory'].items()}
+    return totals
+
+
+def build_bootstrap(db, firebase_uid: str, fetch_user_docs, balances, now: datetime | None = None,
+                    workers: int = BOOTSTRAP_WORKERS) -> dict:
+    """
+    Monta a carga inicial do usuário. `fetch_user_docs` é o de bot.py, para
+    aproveitar a réplica e o cache das coleções pequenas.
+    """
+    from forecasting import FORECASTS_COLLECTION, forecast_doc_id
+
+    now = now or datetime.now(timezone.utc)
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    def month_transactions():
+        q = (db.collection('transactions')
+             .where(filter=FieldFilter('userId', '==', firebase_uid))
+             .where(filter=FieldFilter('createdAt', '>=', start_of_month))
+             .select(['type', 'amount', 'category']))
+        with span('firestore.query', collection='transactions', range='month'):
+            return [doc.to_dict() for doc in q.stream()]
+
+    def forecast():
+        with span('firestore.get', collection=FORECASTS_COLLECTION):
+            doc = db.collection(FORECASTS_COLLECTION).document(forecast_doc_id(firebase_uid, now)).get()
+        return doc.to_dict() if doc.exists else None
+
+    loaders = {
+        'accounts': lambda: fetch_user_docs('accounts', firebase_uid),
+        'categories': lambda: fetch_user_docs('categories', firebase_uid),
+        'budgets': lambda: fetch_user_docs('budgets', firebase_uid, month=now.month, year=now.year),
+        'goals': lambda: fetch_user_docs('goals', firebase_uid),
+        'bills': lambda: fetch_user_docs('scheduled_transactions', firebase_uid, status='pending'),
+        'transactions': month_transactions,
+        'forecast': forecast,
+    }
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # copy_context: os spans das threads continuam no trace da requisição
+        futures = {name: executor.submit(contextvars.copy_context().run, loader) for name, loader in loaders.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    accounts = []
+    for doc in results['accounts']:
+        account = doc.to_dict()
+        item = _compact(doc.id, account, ACCOUNT_FIELDS)
+        item['balance'] = round(balances.read(doc.id, account), 2)
+        accounts.append(item)
+
+    aggregates = month_aggregates(results['transactions'])
+    budgets = []
+    for doc in results['budgets']:
+        budget = doc.to_dict()
+        if budget.get('amount', 0) <= 0:
+            continue
+        spent = aggregates['expenseByCategory'].get(budget['categoryName'], 0)
+        budgets.append({'id': doc.id, 'categoryName': budget['categoryName'], 'amount': budget['amount'],
+                        'spent': spent, 'remaining': round(budget['amount'] - spent, 2)})
+
+    goals = [_compact(doc.id, doc.to_dict(), GOAL_FIELDS) for doc in results['goals']
+             if doc.to_dict().get('status', 'active') == 'active']
+
+    pending = sorted((doc for doc in results['bills'] if doc.to_dict().get('dueDate')), key=lambda d: d.to_dict()['dueDate'])
+    bills = [_compact(doc.id, doc.to_dict(), BILL_FIELDS) for doc in pending[:BOOTSTRAP_UPCOMING_BILLS]]
+
+    forecast_doc = results['forecast']
+    return {
+        'generatedAt': now.isoformat(),
+        'month': {'year': now.year, 'month': now.month, **aggregates},
+        'accounts': sorted(accounts, key=lambda a: (not a.get('isDefault'), a.get('accountName', ''))),
+        'categories': sorted((_compact(doc.id, doc.to_dict(), CATEGORY_FIELDS) for doc in results['categories']),
+                             key=lambda c: (c.get('type', ''), c.get('name', ''))),
+        'budgets': sorted(budgets, key=lambda b: b['categoryName']),
+        'goals': goals,
+        'upcomingBills': bills,
+        'forecast': {k: forecast_doc[k] for k in ('predictedExpenses', 'predictedIncomes', 'predictedBalance') if k in forecast_doc}
+                    if forecast_doc else None,
+    }
@@ -1,56 +1,201 @@
 # backend/bot.py (Versão Final com Teclado Interativo)
 
+from __future__ import annotations
+
 import os
-import re
-import asyncio
-import json
-import unicodedata
-from datetime import datetime, timezone
-from dateutil.relativedelta import relativedelta
-import calendar
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-from google.cloud.firestore_v1.base_query import FieldFilter
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 from flask import Flask, request
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, MessageHandler, filters, ContextTypes, CallbackQueryHandler, CommandHandler
 from flask_cors import CORS
 import secrets
 from flask import jsonify
 from functools import wraps
+from cachetools import LRUCache
+from clients import FieldFilter, auth, db, firestore
+from profiling import profiled
+from tracing import span, traced
+from replicas import CachedDoc, ReplicaManager
+from cache import MemoryBackend, UserCache, build_backend
+from data_versions import DataVersions, ReportCache, render_version
+from http_cache import HTTPCache
+from balance_counters import SHARDS_FIELD, BalanceCounters
+from ledger import GoalChange, LedgerEntry, LedgerWriter
+from digests import DIGESTS_COLLECTION, PERIOD_LABELS, build_digests
+from search_index import SearchIndex, months_back
+from allowances import AllowanceSnapshots, build_snapshots, category_allowance
+from jobs import JobCoordinator, build_lease_store
+from archive import monthly_totals
+from command_parser import CategoryIndex, normalize_text, parse_amount, parse_command, parse_quick_transaction, split_amount
+
+# `telegram`, `firebase_admin`, `google.cloud.firestore` e `dateutil` são
+# importados sob demanda (ver clients.py e get_ptb_app): rotas como o cron,
+# a API e o /favicon.ico não pagam pela inicialização do Telegram.
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
 # --- 1. CONFIGURAÇÃO INICIAL ---
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 CRON_SECRET = os.getenv("CRON_SECRET")
+# Réplicas em memória via on_snapshot (apenas para o deploy de longa duração)
+FIRESTORE_REPLICAS = os.getenv("FIRESTORE_REPLICAS", "").lower() in ("1", "true", "yes")
+REPLICA_TTL_SECONDS = float(os.getenv("REPLICA_TTL_SECONDS", "900"))
+# Agregados mensais gravados junto com cada lançamento
+LEDGER_ROLLUPS = os.getenv("LEDGER_ROLLUPS", "").lower() in ("1", "true", "yes")
+# Janela dos lembretes de contas a vencer (cron /api/reminders)
+REMINDER_DAYS_AHEAD = int(os.getenv("REMINDER_DAYS_AHEAD", "3"))
+# Estados de conversa (ex.: aguardando o e-mail de registro) expiram, e o
+# webhook descarta periodicamente os `user_data` vazios ou expirados do PTB
+CONVERSATION_STATE_TTL_SECONDS = float(os.getenv("CONVERSATION_STATE_TTL_SECONDS", "3600"))
+CONVERSATION_PRUNE_INTERVAL_SECONDS = float(os.getenv("CONVERSATION_PRUNE_INTERVAL_SECONDS", "60"))
+# Journal local dos lançamentos (write-behind, ver journal.py); vazio = desligado
+LEDGER_JOURNAL_PATH = os.getenv("LEDGER_JOURNAL_PATH", "")
+LEDGER_JOURNAL_DRAIN_SECONDS = float(os.getenv("LEDGER_JOURNAL_DRAIN_SECONDS", "30"))
+
+# Nenhum destes objetos toca no Firestore ao ser construído
+replicas = ReplicaManager(db, ttl_seconds=REPLICA_TTL_SECONDS) if FIRESTORE_REPLICAS else None
+balances = BalanceCounters(db)
+ledger = LedgerWriter(db, balances, rollups=LEDGER_ROLLUPS)
+ledger.listeners.append(balances.ledger_listener)
+search_index = SearchIndex(db)
+ledger.hooks.append(search_index.ledger_hook)
+# Cache compartilhado entre workers (CACHE_BACKEND; desligado por padrão)
+user_cache = UserCache(build_backend())
+ledger.listeners.append(lambda firebase_uid, entries, result, changed: user_cache.bump(firebase_uid, *changed))
+# Versão dos dados por usuário (no Firestore) e relatórios prontos por versão
+data_versions = DataVersions(db)
+ledger.hooks.append(data_versions.ledger_hook)
+ledger.listeners.append(data_versions.ledger_listener)
+reports = ReportCache(data_versions, UserCache(user_cache.backend or MemoryBackend(maxsize=4096)))
+http_cache = HTTPCache(data_versions)
+# Leases dos crons, para invocações sobrepostas não repetirem trabalho (ver jobs.py)
+jobs = JobCoordinator(build_lease_store(db))
+# Saldo de abertura e meta do dia dos orçamentos, no fuso de cada usuário
+allowance_snapshots = AllowanceSnapshots(db)
+if LEDGER_JOURNAL_PATH:
+    from journal import LedgerJournal
+    ledger.journal = LedgerJournal(LEDGER_JOURNAL_PATH, ledger)
+    balances.overlay = ledger.journal.pending_balance
 
-firebase_creds_json_str = os.getenv("FIREBASE_CREDENTIALS_JSON")
-if not firebase_creds_json_str:
-    cred = credentials.Certificate("firebase-credentials.json")
-else:
-    firebase_creds_dict = json.loads(firebase_creds_json_str)
-    cred = credentials.Certificate(firebase_creds_dict)
+# --- 2. FUNÇÕES AUXILIARES ---
+# A normalização de texto e a gramática dos comandos ficam em command_parser.py
 
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+def local_today(firebase_uid: str) -> date:
+    """A data de hoje no fuso do usuário (ver allowances.py)."""
+    return date.fromisoformat(allowance_snapshots.get(firebase_uid)['date'])
 
-# --- 2. FUNÇÕES AUXILIARES ---
-def normalize_text(text: str) -> str:
-    """Remove acentos e converte para minúsculas."""
-    if not text: return ""
-    text = unicodedata.normalize('NFD', text)
-    text = text.encode('ascii', 'ignore')
-    text = text.decode("utf-8")
-    return text.lower()
+def spent_today_by_category(firebase_uid: str, snapshot: dict, category_name: str | None = None) -> dict[str, float]:
+    """
+    Gasto de hoje por categoria, desde o início do dia local da fotografia,
+    incluindo as despesas ainda no journal (aceitas, mas não gravadas). Uma
+    despesa gravada entre a consulta e a leitura do journal aparece nos dois
+    e conta uma vez só (pelo ID da transação).
+    """
+    spent, seen = allowance_snapshots.spent_today(snapshot, category_name)
+    if ledger.journal is not None:
+        for transaction_id, entry in ledger.journal.pending_entries(firebase_uid):
+            if transaction_id in seen:
+                continue
+            if entry.type == 'expense' and entry.created_at >= snapshot['dayStart'] and category_name in (None, entry.category):
+                spent[entry.category] = spent.get(entry.category, 0) + entry.amount
+    return spent
+
+def fetch_user_docs(collection: str, firebase_uid: str, **filters) -> list:
+    """
+    Lê os documentos do usuário numa coleção com filtros de igualdade.
+    Usa a réplica em memória quando ativa e capaz de servir a consulta;
+    depois o cache compartilhado (ver cache.py); por fim o Firestore.
+    """
+    replica = replicas.get(firebase_uid) if replicas else None
+    docs = replica.docs(collection, filters) if replica else None
+    if docs is not None:
+        return docs
+
+    def load():
+        q = db.collection(collection).where(filter=FieldFilter('userId', '==', firebase_uid))
+        for field, value in filters.items():
+            q = q.where(filter=FieldFilter(field, '==', value))
+        with span('firestore.query', collection=collection, filters=sorted(filters)):
+            return [[doc.id, doc.to_dict()] for doc in q.stream()]
+
+    suffix = ",".join(f"{field}={value}" for field, value in sorted(filters.items()))
+    version = render_version()
+    if version is not None:
+        # Relatório guardado por versão: os dados precisam ser dessa versão (ver data_versions.py)
+        suffix += f"@v{version}"
+    return [CachedDoc(doc_id, data) for doc_id, data in user_cache.get_or_load(firebase_uid, collection, suffix, load)]
+
+# Trie de categorias por (usuário, tipo). Só é reconstruída quando a lista de
+# categorias lida do Firestore muda.
+_category_indexes = LRUCache(maxsize=1024)
+
+def get_category_index(firebase_uid: str, category_type: str) -> CategoryIndex:
+    """Devolve o índice de categorias do usuário para o tipo ('income' ou 'expense')."""
+    docs = fetch_user_docs('categories', firebase_uid, type=category_type)
+    names = tuple(doc.to_dict()['name'].strip() for doc in docs)
+
+    cached = _category_indexes.get((firebase_uid, category_type))
+    if cached and cached.names == list(names):
+        return cached
+    index = CategoryIndex(names)
+    _category_indexes[(firebase_uid, category_type)] = index
+    return index
 
 # --- 3. LÓGICA DE USUÁRIOS ---
+# O PTB guarda um `user_data` em memória para todo usuário que toca em
+# `context.user_data` e nunca o descarta. O estado da conversa leva a hora em
+# que foi definido; ver `prune_conversation_state`.
+def set_conversation_state(context: ContextTypes.DEFAULT_TYPE, state: str):
+    context.user_data['state'] = state
+    context.user_data['state_at'] = time.time()
+
+def clear_conversation_state(context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.pop('state', None)
+    context.user_data.pop('state_at', None)
+
+def get_conversation_state(context: ContextTypes.DEFAULT_TYPE) -> str | None:
+    """O estado atual da conversa, ou None se não houver ou se já expirou."""
+    state = context.user_data.get('state')
+    if state and time.time() - context.user_data.get('state_at', 0) > CONVERSATION_STATE_TTL_SECONDS:
+        clear_conversation_state(context)
+        return None
+    return state
+
+# Filas internas do PTB para a persistence. Sem persistence configurada,
+# ninguém as esvazia e elas guardam o id de todo chat que já mandou um update.
+PTB_PERSISTENCE_QUEUES = (
+    '_chat_ids_to_be_updated_in_persistence', '_user_ids_to_be_updated_in_persistence',
+    '_chat_ids_to_be_deleted_in_persistence', '_user_ids_to_be_deleted_in_persistence',
+)
+
+async def prune_conversation_state(application) -> int:
+    """Descarta os `user_data` vazios ou com estado expirado. Roda no loop do bot."""
+    now = time.time()
+    stale = [user_id for user_id, data in application.user_data.items()
+             if not data or now - data.get('state_at', 0) > CONVERSATION_STATE_TTL_SECONDS]
+    for user_id in stale:
+        application.drop_user_data(user_id)
+    if application.persistence is None:
+        for name in PTB_PERSISTENCE_QUEUES:
+            getattr(application, name, set()).clear()
+    return len(stale)
+
 async def get_firebase_user_id(chat_id: int) -> str | None:
     """Busca no Firestore o UID do Firebase correspondente a um chat_id do Telegram."""
-    user_ref = db.collection('telegram_users').document(str(chat_id)).get()
+    firebase_uid = user_cache.get_value(f"chat:{chat_id}")
+    if firebase_uid:
+        return firebase_uid
+    with span('firestore.get', collection='telegram_users'):
+        user_ref = db.collection('telegram_users').document(str(chat_id)).get()
     if user_ref.exists:
-        return user_ref.to_dict().get('firebase_uid')
+        firebase_uid = user_ref.to_dict().get('firebase_uid')
+        if firebase_uid:
+            user_cache.set_value(f"chat:{chat_id}", firebase_uid)
+        return firebase_uid
     return None
 
 async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -64,8 +209,10 @@ async def register_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'user_email': email,
             'createdAt': firestore.SERVER_TIMESTAMP,
         }
-        db.collection('telegram_users').document(str(chat_id)).set(user_link_data)
-        context.user_data.pop('state', None)
+        with span('firestore.set', collection='telegram_users'):
+            db.collection('telegram_users').document(str(chat_id)).set(user_link_data)
+        user_cache.delete_value(f"chat:{chat_id}")
+        clear_conversation_state(context)
         await update.message.reply_text("✅ Conta vinculada com sucesso! Agora você já pode usar todos os comandos. Envie '?' para ver o manual.")
     except auth.UserNotFoundError:
         await update.message.reply_text("❌ E-mail não encontrado. Verifique se você já se cadastrou no dashboard web e tente novamente.")
@@ -100,6 +247,12 @@ A seguir, a lista de comandos simplificados.
 > *Gasto Rápido:* `* <valor> <categoria> [descrição]`
 > *Renda Rápida:* `*+ <valor> <origem>` ou `*renda <valor> <origem>`
 
+---
+*🔎 BUSCAR*
+---
+> *`buscar <termo> [ano]`*
+> _Soma as transações cuja descrição ou categoria contém o termo (ex.: `buscar ifood 2026`)._
+
 ---
 *📊 CONSULTAR INFORMAÇÕES*
 ---
@@ -123,12 +276,48 @@ A seguir, a lista de comandos simplificados.
 > *`ver hoje`*
 > _Mostra o que você ainda pode gastar hoje com base nos seus orçamentos._
 
+> *`ver resumo`*
+> _Mostra seu último resumo semanal ou mensal._
+
+> *`ver previsão`*
+> _Mostra quanto você deve gastar até o fim do mês, por categoria._
+
 ---
 > *Para ver este manual novamente:*
 > `?` ou `ajuda`
     """
     await update.message.reply_text(manual_text.strip(), parse_mode='Markdown')
 
+def search_months(args: list) -> tuple[list[str], list[tuple[int, int]], str]:
+    """Separa um ano opcional no fim dos termos: `ifood 2025` busca 2025 inteiro; sem ano, os últimos 12 meses."""
+    now = datetime.now(timezone.utc)
+    if args and args[-1].isdigit() and len(args[-1]) == 4:
+        year = int(args[-1])
+        last_month = now.month if year == now.year else 12
+        return args[:-1], [(year, m) for m in range(last_month, 0, -1)], f"em {year}"
+    return args, months_back(now, 12), "nos últimos 12 meses"
+
+async def process_search(update: Update, context: ContextTypes.DEFAULT_TYPE, text_parts: list, firebase_uid: str):
+    """`buscar <termo> [ano]`: soma as transações cuja descrição ou categoria contém os termos."""
+    terms, months, period_label = search_months(text_parts)
+    if not terms:
+        await update.message.reply_text("Formato inválido. Use: `buscar <termo> [ano]`", parse_mode='Markdown')
+        return
+    try:
+        result = search_index.search(firebase_uid, " ".join(terms), months)
+        if not result.transaction_ids:
+            await update.message.reply_text(f"🔎 Nenhuma transação com '{' '.join(terms)}' {period_label}.")
+            return
+        reply_message = f"🔎 *'{' '.join(terms)}' {period_label}:*\n\n"
+        reply_message += f"- {len(result.transaction_ids)} transação(ões)\n"
+        reply_message += f"- Gastos: R$ {result.total_expense:.2f}\n"
+        if result.total_income:
+            reply_message += f"- Rendas: R$ {result.total_income:.2f}\n"
+        await update.message.reply_text(reply_message, parse_mode='Markdown')
+    except Exception as e:
+        print(f"Erro na busca: {e}")
+        await update.message.reply_text("❌ Ocorreu um erro ao buscar suas transações.")
+
 async def process_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE, text_parts: list, firebase_uid: str):
     """Processa uma transferência entre contas de forma completa."""
     # Envia uma mensagem de feedback inicial que será editada depois
@@ -145,15 +334,14 @@ async def process_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE, t
 
         origem_str = " ".join(text_parts[da_index + 1:para_index])
         destino_str = " ".join(text_parts[para_index + 1:])
-        amount = float(valor_str.replace(',', '.'))
+        amount = parse_amount(valor_str)
 
         if not all([origem_str, destino_str, amount > 0]):
             await sent_message.edit_text("Formato inválido. Faltam informações.")
             return
 
         # Busca todas as contas do usuário de uma vez
-        accounts_query = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        accounts = {acc.id: acc.to_dict() for acc in accounts_query}
+        accounts = {acc.id: acc.to_dict() for acc in fetch_user_docs('accounts', firebase_uid)}
 
         from_account_tuple = next(((acc_id, acc) for acc_id, acc in accounts.items() if normalize_text(acc.get('accountName')) == normalize_text(origem_str)), None)
         to_account_tuple = next(((acc_id, acc) for acc_id, acc in accounts.items() if normalize_text(acc.get('accountName')) == normalize_text(destino_str)), None)
@@ -165,25 +353,15 @@ async def process_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         from_account_id, from_account = from_account_tuple
         to_account_id, to_account = to_account_tuple
 
-        if from_account.get('balance', 0) < amount:
+        if balances.read(from_account_id, from_account) < amount:
             await sent_message.edit_text(f"❌ Saldo insuficiente na conta de origem '{from_account.get('accountName')}'.")
             return
         
-        # Inicia um lote para garantir que todas as operações funcionem ou falhem juntas
-        batch = db.batch()
-        
-        # Cria a transação de despesa (saída)
-        batch.set(db.collection("transactions").document(), {'userId': firebase_uid, 'type': 'expense', 'amount': amount, 'category': 'transferência', 'description': f"Para: {to_account.get('accountName')}", 'createdAt': firestore.SERVER_TIMESTAMP, 'accountId': from_account_id})
-        
-        # Cria a transação de renda (entrada)
-        batch.set(db.collection("transactions").document(), {'userId': firebase_uid, 'type': 'income', 'amount': amount, 'category': 'transferência', 'description': f"De: {from_account.get('accountName')}", 'createdAt': firestore.SERVER_TIMESTAMP, 'accountId': to_account_id})
-        
-        # Atualiza os saldos das contas
-        batch.update(db.collection('accounts').document(from_account_id), {'balance': firestore.firestore.Increment(-amount)})
-        batch.update(db.collection('accounts').document(to_account_id), {'balance': firestore.firestore.Increment(amount)})
-        
-        # Executa todas as operações no banco de dados
-        batch.commit()
+        # Saída e entrada num único lote, junto com os saldos das duas contas
+        ledger.commit(firebase_uid, [
+            LedgerEntry('expense', amount, 'transferência', f"Para: {to_account.get('accountName')}", from_account_id),
+            LedgerEntry('income', amount, 'transferência', f"De: {from_account.get('accountName')}", to_account_id),
+        ], accounts=accounts)
         
         await sent_message.edit_text(text=f"✅ Transferência de R$ {amount:.2f} de '{from_account.get('accountName')}' para '{to_account.get('accountName')}' realizada com sucesso!")
 
@@ -197,6 +375,8 @@ async def process_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE, t
 
 async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, text_parts: list, firebase_uid: str):
     """Valida uma conta a pagar e inicia a conversa para seleção de conta."""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
     try:
         if not text_parts:
             await update.message.reply_text("Formato inválido. Use: `pagar <descrição da conta>`", parse_mode='Markdown')
@@ -205,16 +385,14 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, te
         description_input = " ".join(text_parts).strip()
         description_normalized = normalize_text(description_input)
         
-        q = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('status', '==', 'pending'))
-        pending_debts_docs = list(q.stream())
+        pending_debts_docs = fetch_user_docs('scheduled_transactions', firebase_uid, status='pending')
         found_debt = next((d for d in pending_debts_docs if normalize_text(d.to_dict().get('description', '')) == description_normalized), None)
         
         if not found_debt:
             await update.message.reply_text(f"❌ Conta pendente '{description_input}' não encontrada.")
             return
 
-        accounts_query = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        accounts = list(accounts_query)
+        accounts = fetch_user_docs('accounts', firebase_uid)
         if not accounts:
             await update.message.reply_text("Você precisa de criar uma conta no dashboard primeiro.")
             return
@@ -228,7 +406,8 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, te
             'createdAt': firestore.SERVER_TIMESTAMP
         }
         pending_ref = db.collection('pending_transactions').document()
-        pending_ref.set(pending_data)
+        with span('firestore.set', collection='pending_transactions'):
+            pending_ref.set(pending_data)
         
         # 2. Cria e envia o teclado com as contas e o ID pendente
         keyboard = []
@@ -245,44 +424,35 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, te
         
 async def process_expense(update: Update, context: ContextTypes.DEFAULT_TYPE, text_parts: list, firebase_uid: str):
     """Valida uma despesa e inicia a conversa para seleção de conta."""
-    try:
-        # --- Validação da Categoria (lógica que já tínhamos) ---
-        categories_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).stream()
-        
-        # LINHA CORRIGIDA ABAIXO
-        original_categories = [doc.to_dict()['name'].strip() for doc in categories_ref]
-        
-        valid_categories_normalized = [normalize_text(name) for name in original_categories]
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+    try:
+        # --- Validação da Categoria ---
+        categories = get_category_index(firebase_uid, 'expense')
 
-        if not original_categories:
+        if not categories:
             await update.message.reply_text("Você não tem nenhuma categoria de DESPESA cadastrada.")
             return
-        
-        expense_text = " ".join(text_parts)
-        match = re.match(r"^\s*(\d+[\.,]?\d*)\s+([\w\sáàâãéèêíïóôõöúçñ]+?)(?:\s+(.+))?$", expense_text)
+
+        match = split_amount(text_parts)
 
         if not match:
             await update.message.reply_text("Formato de gasto inválido. Use: <valor> <categoria> [descrição]")
             return
 
-        value_str, category_name_input, description = match.groups()
-        category_name_normalized = normalize_text(category_name_input.strip())
+        value_str, category_and_desc = match
+        correct_category_name, description = categories.resolve(category_and_desc)
 
-        if category_name_normalized not in valid_categories_normalized:
-            available_cats_text = "\n- ".join(original_categories)
-            error_message = f"❌ Categoria de DESPESA '{category_name_input}' não encontrada.\n\nCategorias disponíveis:\n- {available_cats_text}"
+        if correct_category_name is None:
+            available_cats_text = "\n- ".join(categories.names)
+            error_message = f"❌ Categoria de DESPESA '{category_and_desc[0]}' não encontrada.\n\nCategorias disponíveis:\n- {available_cats_text}"
             await update.message.reply_text(error_message)
             return
 
-        match_index = valid_categories_normalized.index(category_name_normalized)
-        correct_category_name = original_categories[match_index]
-        amount = float(value_str.replace(',', '.'))
-        description = description.strip() if description else None
+        amount = parse_amount(value_str)
         
         # --- Lógica de Conversa (NOVA) ---
-        accounts_query = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        accounts = list(accounts_query)
+        accounts = fetch_user_docs('accounts', firebase_uid)
 
         if not accounts:
             await update.message.reply_text("Você precisa criar uma conta no dashboard primeiro antes de registrar uma transação.")
@@ -298,13 +468,14 @@ async def process_expense(update: Update, context: ContextTypes.DEFAULT_TYPE, te
             'createdAt': firestore.SERVER_TIMESTAMP 
         }
         pending_ref = db.collection('pending_transactions').document()
-        pending_ref.set(pending_data)
+        with span('firestore.set', collection='pending_transactions'):
+            pending_ref.set(pending_data)
         
         # 2. Cria os botões com o ID da transação pendente no callback_data
         keyboard = []
         for acc_doc in accounts:
             acc = acc_doc.to_dict()
-            button_text = f"{acc.get('accountName')} (R$ {acc.get('balance', 0):.2f})"
+            button_text = f"{acc.get('accountName')} (R$ {balances.read(acc_doc.id, acc):.2f})"
             callback_data = f"account_{acc_doc.id}_{pending_ref.id}"
             button = InlineKeyboardButton(button_text, callback_data=callback_data)
             keyboard.append([button])
@@ -321,49 +492,34 @@ async def process_expense(update: Update, context: ContextTypes.DEFAULT_TYPE, te
 
 async def process_income(update: Update, context: ContextTypes.DEFAULT_TYPE, text_parts: list, firebase_uid: str):
     """Valida uma renda e inicia a conversa para seleção de conta."""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
     try:
-        # --- Validação da Categoria de Renda (lógica que já tínhamos) ---
-        categories_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'income')).stream()
-        
-        # LINHA CORRIGIDA ABAIXO
-        original_categories = [doc.to_dict()['name'].strip() for doc in categories_ref]
-        
-        valid_categories_normalized = [normalize_text(name) for name in original_categories]
-        if not original_categories:
+        # --- Validação da Categoria de Renda ---
+        categories = get_category_index(firebase_uid, 'income')
+        if not categories:
             await update.message.reply_text("Você não tem nenhuma categoria de RENDA cadastrada.")
             return
-            
+
         if len(text_parts) < 2:
             await update.message.reply_text("Formato de renda inválido. Use: + <valor> <origem> [descrição]")
             return
-            
+
         value_str = text_parts[0]
         potential_source_and_desc = text_parts[1:]
-        found_category_original = None
-        category_word_count = 0
-
-        for i in range(len(potential_source_and_desc), 0, -1):
-            potential_category_input = " ".join(potential_source_and_desc[:i])
-            potential_category_normalized = normalize_text(potential_category_input)
-            if potential_category_normalized in valid_categories_normalized:
-                match_index = valid_categories_normalized.index(potential_category_normalized)
-                found_category_original = original_categories[match_index]
-                category_word_count = i
-                break
-        
+        found_category_original, description = categories.resolve(potential_source_and_desc)
+
         if not found_category_original:
             input_source = " ".join(potential_source_and_desc)
-            available_cats_text = "\n- ".join(original_categories)
+            available_cats_text = "\n- ".join(categories.names)
             error_message = f"❌ Origem de RENDA '{input_source}' não encontrada.\n\nCategorias de renda disponíveis:\n- {available_cats_text}"
             await update.message.reply_text(error_message)
             return
 
-        description = " ".join(potential_source_and_desc[category_word_count:]).strip() or None
-        amount = float(value_str.replace(',', '.'))
+        amount = parse_amount(value_str)
         
         # --- Lógica de Conversa (NOVA) ---
-        accounts_query = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        accounts = list(accounts_query)
+        accounts = fetch_user_docs('accounts', firebase_uid)
 
         if not accounts:
             await update.message.reply_text("Você precisa criar uma conta no dashboard primeiro antes de registrar uma transação.")
@@ -379,13 +535,14 @@ async def process_income(update: Update, context: ContextTypes.DEFAULT_TYPE, tex
             'createdAt': firestore.SERVER_TIMESTAMP
         }
         pending_ref = db.collection('pending_transactions').document()
-        pending_ref.set(pending_data)
+        with span('firestore.set', collection='pending_transactions'):
+            pending_ref.set(pending_data)
         
         # 2. Cria os botões com o ID da transação pendente no callback_data
         keyboard = []
         for acc_doc in accounts:
             acc = acc_doc.to_dict()
-            button_text = f"{acc.get('accountName')} (R$ {acc.get('balance', 0):.2f})"
+            button_text = f"{acc.get('accountName')} (R$ {balances.read(acc_doc.id, acc):.2f})"
             callback_data = f"account_{acc_doc.id}_{pending_ref.id}"
             button = InlineKeyboardButton(button_text, callback_data=callback_data)
             keyboard.append([button])
@@ -420,7 +577,8 @@ async def handle_account_selection(update: Update, context: ContextTypes.DEFAULT
         pending_transaction_id = callback_parts[2]
 
         pending_doc_ref = db.collection('pending_transactions').document(pending_transaction_id)
-        pending_transaction_doc = pending_doc_ref.get()
+        with span('firestore.get', collection='pending_transactions'):
+            pending_transaction_doc = pending_doc_ref.get()
 
         if not pending_transaction_doc.exists:
             await message_to_edit.edit_text(text="🤔 Esta operação já foi concluída ou expirou.")
@@ -433,26 +591,15 @@ async def handle_account_selection(update: Update, context: ContextTypes.DEFAULT
             return
 
         transaction_type = pending_transaction.get('type')
-        batch = db.batch()
-        
-        accounts_query = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        accounts = {acc.id: acc.to_dict() for acc in accounts_query}
+        accounts = {acc.id: acc.to_dict() for acc in fetch_user_docs('accounts', firebase_uid)}
+        selected_account = accounts.get(selected_account_id)
 
         if transaction_type == 'expense':
-            account_doc_ref = db.collection('accounts').document(selected_account_id)
-            new_trans_ref = db.collection("transactions").document()
-
-            final_transaction = {
-                'userId': firebase_uid, 'createdAt': firestore.SERVER_TIMESTAMP, 'accountId': selected_account_id,
-                'type': 'expense', 'amount': pending_transaction['amount'], 'category': pending_transaction['category'],
-                'description': pending_transaction.get('description')
-            }
-            batch.set(new_trans_ref, final_transaction)
-            
-            batch.update(account_doc_ref, {'balance': firestore.firestore.Increment(-pending_transaction['amount'])})
-            
-            batch.commit()
-            pending_doc_ref.delete()
+            ledger.commit(firebase_uid, [
+                LedgerEntry('expense', pending_transaction['amount'], pending_transaction['category'], pending_transaction.get('description'), selected_account_id),
+            ], accounts=accounts)
+            with span('firestore.delete', collection='pending_transactions'):
+                pending_doc_ref.delete()
             
             # --- CHAMADA DA NOVA FUNÇÃO DE FEEDBACK ---
             await send_budget_feedback(
@@ -463,34 +610,43 @@ async def handle_account_selection(update: Update, context: ContextTypes.DEFAULT
             )
             # -----------------------------------------
 
+        elif transaction_type == 'income':
+            result = ledger.commit(firebase_uid, [
+                LedgerEntry('income', pending_transaction['amount'], pending_transaction['category'], pending_transaction.get('description'), selected_account_id),
+            ], accounts=accounts)
+            with span('firestore.delete', collection='pending_transactions'):
+                pending_doc_ref.delete()
+
+            new_balance = result.balances.get(selected_account_id)
+            balance_text = f" Saldo atual: R$ {new_balance:.2f}." if new_balance is not None else ""
+            await message_to_edit.edit_text(text=f"💰 Renda de R$ {pending_transaction['amount']:.2f} em '{pending_transaction['category']}' registrada!{balance_text}")
 
         # --- LÓGICA PARA PAGAMENTOS ---
         elif transaction_type == 'payment':
             debt = pending_transaction['debt_doc']
             debt_id = pending_transaction['debt_id']
-            source_account = accounts.get(selected_account_id)
 
-            if not source_account or source_account.get('balance', 0) < debt.get('amount', 0):
-                await message_to_edit.edit_text(text=f"❌ Saldo insuficiente na conta '{source_account.get('accountName')}'.")
+            if not selected_account or balances.read(selected_account_id, selected_account) < debt.get('amount', 0):
+                account_name = selected_account.get('accountName') if selected_account else selected_account_id
+                await message_to_edit.edit_text(text=f"❌ Saldo insuficiente na conta '{account_name}'.")
                 return
 
             desc = f"Pagamento de: {debt.get('description')}"
-            batch.set(db.collection("transactions").document(), {'userId': firebase_uid, 'amount': debt.get('amount'), 'category': debt.get('categoryName'), 'description': desc, 'createdAt': firestore.SERVER_TIMESTAMP, 'type': 'expense', 'accountId': selected_account_id})
-            batch.update(db.collection('scheduled_transactions').document(debt_id), {'status': 'paid'})
-            batch.update(db.collection('accounts').document(selected_account_id), {'balance': firestore.firestore.Increment(-debt.get('amount', 0))})
+            ledger.commit(firebase_uid, [
+                LedgerEntry('expense', debt.get('amount', 0), debt.get('categoryName'), desc, selected_account_id),
+            ], accounts=accounts, scheduled_status={debt_id: 'paid'})
+            with span('firestore.delete', collection='pending_transactions'):
+                pending_doc_ref.delete()
 
-            await message_to_edit.edit_text(text=f"✅ Pagamento de '{debt.get('description')}' registado a partir de '{source_account.get('accountName')}'!")
+            await message_to_edit.edit_text(text=f"✅ Pagamento de '{debt.get('description')}' registado a partir de '{selected_account.get('accountName')}'!")
 
-        # 4. Efetiva as mudanças e limpa a transação pendente
-        batch.commit()
-        pending_doc_ref.delete()
-    
     except Exception as e:
         print(f"Erro ao finalizar transação: {e}")
         await message_to_edit.edit_text(text="❌ Ocorreu um erro ao salvar sua transação.")
         # Se deu erro, mas o documento pendente foi lido, tenta apagá-lo para não deixar lixo
         if pending_doc_ref:
-            pending_doc_ref.delete()
+            with span('firestore.delete', collection='pending_transactions'):
+                pending_doc_ref.delete()
 
 # Substitua esta função em: backend/bot.py
 
@@ -503,8 +659,7 @@ async def process_default_transaction(update: Update, context: ContextTypes.DEFA
     sent_message = await update.message.reply_text("⏳ Processando transação rápida...")
 
     try:
-        accounts_ref = db.collection('accounts').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('isDefault', '==', True)).limit(1).stream()
-        default_account_doc = next(accounts_ref, None)
+        default_account_doc = next(iter(fetch_user_docs('accounts', firebase_uid, isDefault=True)), None)
 
         if not default_account_doc:
             await sent_message.edit_text("❌ Nenhuma conta padrão definida. Por favor, defina uma no seu dashboard web.")
@@ -513,86 +668,57 @@ async def process_default_transaction(update: Update, context: ContextTypes.DEFA
         default_account = default_account_doc.to_dict()
         default_account_id = default_account_doc.id
 
-        text_after_star = text[1:].lstrip()
-        is_income = text_after_star.startswith('+') or text_after_star.lower().startswith('renda')
+        is_income, parts = parse_quick_transaction(text)
         value_str = ''
         
         if is_income:
             # --- Lógica de Renda (sem alterações) ---
             transaction_type = 'income'
-            if text_after_star.startswith('+'): clean_text = text_after_star[1:].strip()
-            else: clean_text = text_after_star[len('renda'):].strip()
-            
-            parts = clean_text.split()
             error_format_msg = "Formato inválido. Use: `*+ <valor> <origem>` ou `*renda <valor> <origem>`"
             if len(parts) < 2:
                 await sent_message.edit_text(error_format_msg, parse_mode='Markdown')
                 return
             
             value_str = parts[0]
-            amount = float(value_str.replace(',', '.'))
+            amount = parse_amount(value_str)
             potential_source_and_desc = parts[1:]
             
-            categories_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'income')).stream()
-            original_categories = {normalize_text(cat.to_dict()['name'].strip()): cat.to_dict()['name'].strip() for cat in categories_ref}
-                        
-            found_category_original = None
-            category_word_count = 0
-            for i in range(len(potential_source_and_desc), 0, -1):
-                potential_category_input = " ".join(potential_source_and_desc[:i])
-                if normalize_text(potential_category_input) in original_categories:
-                    found_category_original = original_categories[normalize_text(potential_category_input)]
-                    category_word_count = i
-                    break
+            categories = get_category_index(firebase_uid, 'income')
+            correct_category_name, description = categories.resolve(potential_source_and_desc)
             
-            if not found_category_original:
+            if not correct_category_name:
                 await sent_message.edit_text(f"❌ Origem de RENDA '{' '.join(potential_source_and_desc)}' não encontrada.")
                 return
-            correct_category_name = found_category_original
-            description = " ".join(potential_source_and_desc[category_word_count:]).strip() or None
 
             # Salva a transação de renda
-            batch = db.batch()
-            new_trans_ref = db.collection("transactions").document()
-            batch.set(new_trans_ref, {'userId': firebase_uid, 'type': 'income', 'amount': amount, 'category': correct_category_name, 'description': description, 'createdAt': firestore.SERVER_TIMESTAMP, 'accountId': default_account_id})
-            account_doc_ref = db.collection('accounts').document(default_account_id)
-            batch.update(account_doc_ref, {'balance': firestore.firestore.Increment(amount)})
-            batch.commit()
+            ledger.commit(firebase_uid, [
+                LedgerEntry('income', amount, correct_category_name, description, default_account_id),
+            ], accounts={default_account_id: default_account})
             
             await sent_message.edit_text(f"✅ Renda rápida registrada na sua conta padrão '{default_account.get('accountName')}'!")
 
         else: # É despesa
             transaction_type = 'expense'
-            clean_text = text_after_star
             error_format_msg = "Formato de gasto inválido. Use: `*<valor> <categoria> [descrição]`"
 
-            match = re.match(r"^\s*(\d+[\.,]?\d*)\s+([\w\sáàâãéèêíïóôõöúçñ]+?)(?:\s+(.+))?$", clean_text)
+            match = split_amount(parts)
             if not match:
                 await sent_message.edit_text(error_format_msg, parse_mode='Markdown')
                 return
                 
-            value_str, category_name_input, description = match.groups()
-            amount = float(value_str.replace(',', '.'))
-            description = description.strip() if description else None
-            
-            categories_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).stream()
-            
-            # LINHA CORRIGIDA ABAIXO
-            original_categories = {normalize_text(cat.to_dict()['name'].strip()): cat.to_dict()['name'].strip() for cat in categories_ref}
+            value_str, category_and_desc = match
+            amount = parse_amount(value_str)
             
-            category_name_normalized = normalize_text(category_name_input.strip())
-            if category_name_normalized not in original_categories:
-                await sent_message.edit_text(f"❌ Categoria de DESPESA '{category_name_input}' não encontrada.")
+            categories = get_category_index(firebase_uid, 'expense')
+            correct_category_name, description = categories.resolve(category_and_desc)
+            if correct_category_name is None:
+                await sent_message.edit_text(f"❌ Categoria de DESPESA '{category_and_desc[0]}' não encontrada.")
                 return
-            correct_category_name = original_categories[category_name_normalized]
 
             # Salva a transação de despesa
-            batch = db.batch()
-            new_trans_ref = db.collection("transactions").document()
-            batch.set(new_trans_ref, {'userId': firebase_uid, 'type': 'expense', 'amount': amount, 'category': correct_category_name, 'description': description, 'createdAt': firestore.SERVER_TIMESTAMP, 'accountId': default_account_id})
-            account_doc_ref = db.collection('accounts').document(default_account_id)
-            batch.update(account_doc_ref, {'balance': firestore.firestore.Increment(-amount)})
-            batch.commit()
+            ledger.commit(firebase_uid, [
+                LedgerEntry('expense', amount, correct_category_name, description, default_account_id),
+            ], accounts={default_account_id: default_account})
             
             # --- CHAMADA DA NOVA FUNÇÃO DE FEEDBACK ---
             await send_budget_feedback(
@@ -621,8 +747,7 @@ async def process_saving(update: Update, context: ContextTypes.DEFAULT_TYPE, tex
         goal_name_input = " ".join(text_parts[1:]).strip()
         goal_name_normalized = normalize_text(goal_name_input)
         
-        goals_ref = db.collection('goals').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()        
-        user_goals = list(goals_ref)
+        user_goals = fetch_user_docs('goals', firebase_uid)
         
         found_goal = None
         for goal_doc in user_goals:
@@ -637,28 +762,16 @@ async def process_saving(update: Update, context: ContextTypes.DEFAULT_TYPE, tex
             await update.message.reply_text(error_message)
             return
 
-        amount = float(value_str.replace(',', '.'))
-        goal_doc_ref = db.collection('goals').document(found_goal.id)
-        
-        # Ação 1: Atualiza o valor na meta (SEM AWAIT)
-        goal_doc_ref.update({
-            'savedAmount': firestore.firestore.Increment(amount)
-        })
+        amount = parse_amount(value_str)
+        goal = found_goal.to_dict()
 
-        # Ação 2: Cria uma transação de despesa correspondente
-        saving_expense_data = {
-            'type': 'expense',
-            'amount': amount,
-            'category': found_goal.to_dict().get('goalName'),
-            'description': f"Contribuição para a meta: {found_goal.to_dict().get('goalName')}",
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'userId': firebase_uid
-        }
-        db.collection('transactions').add(saving_expense_data)
-        
-        # Busca os dados atualizados para a mensagem de confirmação (SEM AWAIT)
-        updated_goal_doc = goal_doc_ref.get()
-        updated_data = updated_goal_doc.to_dict()
+        # Incremento da meta + despesa correspondente no mesmo lote; o
+        # progresso da confirmação vem do resultado, sem reler a meta.
+        result = ledger.commit(firebase_uid, [
+            LedgerEntry('expense', amount, goal.get('goalName'), f"Contribuição para a meta: {goal.get('goalName')}"),
+        ], goal_changes=[GoalChange(found_goal.id, amount)], goals={found_goal.id: goal})
+
+        updated_data = result.goals[found_goal.id]
         saved = updated_data.get('savedAmount', 0)
         target = updated_data.get('targetAmount', 0)
         progress = (saved / target) * 100 if target > 0 else 100
@@ -696,12 +809,11 @@ async def process_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE,
              await update.message.reply_text("Formato inválido. Faltam informações. Use: sacar <valor> <meta> para <categoria>")
              return
 
-        amount = float(value_str.replace(',', '.'))
+        amount = parse_amount(value_str)
         
         # 2. Valida a meta de poupança
         goal_name_normalized = normalize_text(goal_name_input)
-        goals_ref = db.collection('goals').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()
-        user_goals = list(goals_ref)
+        user_goals = fetch_user_docs('goals', firebase_uid)
         found_goal = next((g for g in user_goals if normalize_text(g.to_dict().get('goalName', '')) == goal_name_normalized), None)
 
         if not found_goal:
@@ -715,36 +827,24 @@ async def process_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE,
             return
 
         # 3. Valida a categoria de renda
-        income_category_normalized = normalize_text(income_category_input)
-        categories_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'income')).stream()
-        income_categories = list(categories_ref)
-        found_income_category = next((c for c in income_categories if normalize_text(c.to_dict().get('name', '')) == income_category_normalized), None)
+        income_categories = get_category_index(firebase_uid, 'income')
+        found_income_category = income_categories.get(income_category_input)
         
         if not found_income_category:
-            available_cats_text = "\n- ".join([c.to_dict().get('name') for c in income_categories])
+            available_cats_text = "\n- ".join(income_categories.names)
             await update.message.reply_text(f"❌ Categoria de renda '{income_category_input}' não encontrada.\n\nCategorias de renda disponíveis:\n- {available_cats_text}")
             return
 
-        # 4. Executa as operações no banco de dados
-        # Ação A: Subtrai o valor da meta usando 'increment' com valor negativo
-        goal_doc_ref = db.collection('goals').document(found_goal.id)
-        goal_doc_ref.update({'savedAmount': firestore.firestore.Increment(-amount)})
-        
-        # Ação B: Adiciona uma nova transação de RENDA
-        income_transaction_data = {
-            'type': 'income',
-            'amount': amount,
-            'category': found_income_category.to_dict().get('name'),
-            'description': f"Saque da meta: {found_goal.to_dict().get('goalName')}",
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'userId': firebase_uid
-        }
-        db.collection('transactions').add(income_transaction_data)
+        # 4. Executa as operações no banco de dados: decremento da meta e
+        # a nova transação de RENDA no mesmo lote
+        ledger.commit(firebase_uid, [
+            LedgerEntry('income', amount, found_income_category, f"Saque da meta: {found_goal.to_dict().get('goalName')}"),
+        ], goal_changes=[GoalChange(found_goal.id, -amount)], goals={found_goal.id: found_goal.to_dict()})
 
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
             message_id=sent_message.message_id,
-            text=f"✅ Saque de R$ {amount:.2f} da meta '{found_goal.to_dict().get('goalName')}' realizado e adicionado à renda '{found_income_category.to_dict().get('name')}'."
+            text=f"✅ Saque de R$ {amount:.2f} da meta '{found_goal.to_dict().get('goalName')}' realizado e adicionado à renda '{found_income_category}'."
         )
 
     except ValueError:
@@ -759,159 +859,155 @@ async def process_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
         
  
+def render_categories(firebase_uid: str) -> tuple[str, str | None]:
+    """Texto de `ver categorias`: as categorias de renda e despesa."""
+    docs = fetch_user_docs('categories', firebase_uid)
+
+    if not docs:
+        return "Você ainda não cadastrou nenhuma categoria no dashboard.", None
+
+    income_cats = []
+    expense_cats = []
+    for doc in docs:
+        cat = doc.to_dict()
+        if cat.get('type') == 'income':
+            income_cats.append(cat.get('name'))
+        else:
+            expense_cats.append(cat.get('name'))
+
+    reply_message = "*Categorias de Renda:*\n"
+    reply_message += "- " + "\n- ".join(sorted(income_cats)) if income_cats else "_Nenhuma cadastrada._\n"
+    reply_message += "\n"
+    reply_message += "*Categorias de Despesa:*\n"
+    reply_message += "- " + "\n- ".join(sorted(expense_cats)) if expense_cats else "_Nenhuma cadastrada._\n"
+    return reply_message.strip(), 'Markdown'
+
 async def list_categories(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str):
     """Lista todas as categorias de renda e despesa."""
     try:
-        q = db.collection('categories').where(filter=FieldFilter('userId', '==', firebase_uid))
-        docs = list(q.stream())
-        
-        if not docs:
-            await update.message.reply_text("Você ainda não cadastrou nenhuma categoria no dashboard.")
-            return
-
-        income_cats = []
-        expense_cats = []
-        for doc in docs:
-            cat = doc.to_dict()
-            if cat.get('type') == 'income':
-                income_cats.append(cat.get('name'))
-            else:
-                expense_cats.append(cat.get('name'))
-
-        reply_message = "*Categorias de Renda:*\n"
-        reply_message += "- " + "\n- ".join(sorted(income_cats)) if income_cats else "_Nenhuma cadastrada._\n"
-        reply_message += "\n"
-        reply_message += "*Categorias de Despesa:*\n"
-        reply_message += "- " + "\n- ".join(sorted(expense_cats)) if expense_cats else "_Nenhuma cadastrada._\n"
-            
-        await update.message.reply_text(reply_message.strip(), parse_mode='Markdown')
+        text, parse_mode = reports.get_or_render(firebase_uid, 'categorias', [], lambda: render_categories(firebase_uid),
+                                                 today=datetime.now(timezone.utc).date())
+        await update.message.reply_text(text, parse_mode=parse_mode)
         
     except Exception as e:
         print(f"Erro ao listar categorias: {e}")
         await update.message.reply_text("❌ Ocorreu um erro ao buscar as categorias.")
 
+def render_scheduled_transactions(firebase_uid: str, status_filter: str | None) -> tuple[str, str | None]:
+    """Texto de `ver contas [pagas|pendentes]`: as contas a pagar do mês."""
+    from dateutil.relativedelta import relativedelta
+    today = datetime.now(timezone.utc)
+    start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end_of_month = start_of_month + relativedelta(months=1) - relativedelta(seconds=1)
+
+    q = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('dueDate', '>=', start_of_month)).where(filter=FieldFilter('dueDate', '<=', end_of_month))
+    
+    if status_filter:
+        q = q.where(filter=FieldFilter('status', '==', status_filter))
+
+    with span('firestore.query', collection='scheduled_transactions', range='month'):
+        accounts = list(q.stream())
+    if not accounts:
+        return "Nenhuma conta encontrada para este mês com os filtros aplicados.", None
+
+    title = "Contas do Mês"
+    if status_filter == 'paid': title = "Contas Pagas do Mês"
+    if status_filter == 'pending': title = "Contas Pendentes do Mês"
+    
+    reply_message = f"*{title}:*\n\n"
+    for doc in sorted(accounts, key=lambda x: x.to_dict()['dueDate']):
+        account = doc.to_dict()
+        status_icon = "✅" if account.get('status') == 'paid' else "⏳"
+        due_date = account['dueDate'].strftime('%d/%m')
+        reply_message += f"{status_icon} *{account.get('description')}* - R$ {account.get('amount'):.2f} (Vence: {due_date})\n"
+    return reply_message, 'Markdown'
+
 async def list_scheduled_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, parts: list):
     """Lista as contas do mês, podendo filtrar por 'pagas' ou 'pendentes'."""
     try:
         status_filter = None
         if parts and parts[0].lower() in ['pagas', 'pendentes']:
             status_filter = 'paid' if parts[0].lower() == 'pagas' else 'pending'
-        
-        today = datetime.now(timezone.utc)
-        start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        end_of_month = start_of_month + relativedelta(months=1) - relativedelta(seconds=1)
-
-        q = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('dueDate', '>=', start_of_month)).where(filter=FieldFilter('dueDate', '<=', end_of_month))
-        
-        if status_filter:
-            q = q.where(filter=FieldFilter('status', '==', status_filter))
-
-        docs = q.stream()
-        
-        accounts = list(docs)
-        if not accounts:
-            await update.message.reply_text("Nenhuma conta encontrada para este mês com os filtros aplicados.")
-            return
 
-        title = "Contas do Mês"
-        if status_filter == 'paid': title = "Contas Pagas do Mês"
-        if status_filter == 'pending': title = "Contas Pendentes do Mês"
-        
-        reply_message = f"*{title}:*\n\n"
-        for doc in sorted(accounts, key=lambda x: x.to_dict()['dueDate']):
-            account = doc.to_dict()
-            status_icon = "✅" if account.get('status') == 'paid' else "⏳"
-            due_date = account['dueDate'].strftime('%d/%m')
-            reply_message += f"{status_icon} *{account.get('description')}* - R$ {account.get('amount'):.2f} (Vence: {due_date})\n"
-            
-        await update.message.reply_text(reply_message, parse_mode='Markdown')
+        text, parse_mode = reports.get_or_render(firebase_uid, 'contas', [status_filter or ''],
+                                                 lambda: render_scheduled_transactions(firebase_uid, status_filter),
+                                                 today=datetime.now(timezone.utc).date())
+        await update.message.reply_text(text, parse_mode=parse_mode)
 
     except Exception as e:
         print(f"Erro ao listar contas: {e}")
         await update.message.reply_text("❌ Ocorreu um erro ao buscar as contas. Pode ser necessário criar um índice no Firestore (verifique os logs).")
                
 
+def render_budgets(firebase_uid: str, category_filter: str) -> tuple[str, str | None]:
+    """Texto de `ver orçamentos [categoria]`: saldo e médias seguras de cada orçamento do mês."""
+    snapshot = allowance_snapshots.get(firebase_uid)
+    filters = {'categoryName': category_filter} if category_filter else {}
+
+    budgets_docs = [b for b in fetch_user_docs('budgets', firebase_uid, month=snapshot['month'], year=snapshot['year'], **filters) if b.to_dict().get('amount', 0) > 0]
+
+    if not budgets_docs:
+        reply = f"Nenhum orçamento encontrado para '{category_filter}' este mês." if category_filter else "Nenhum orçamento definido para este mês."
+        return reply, None
+
+    spent_today = spent_today_by_category(firebase_uid, snapshot)
+    reply_message = "*Resumo dos Orçamentos do Mês:*\n\n"
+    
+    for budget_doc in budgets_docs:
+        budget = budget_doc.to_dict()
+        category_name = budget['categoryName']
+        budget_amount = budget['amount']
+
+        opening_remaining, _ = category_allowance(snapshot, category_name, budget_amount)
+        remaining_budget = opening_remaining - spent_today.get(category_name, 0)
+        days_remaining = snapshot['daysRemaining']
+        daily_avg = remaining_budget / days_remaining if days_remaining > 0 else 0
+        weekly_avg = daily_avg * 7
+
+        reply_message += f"*{category_name.capitalize()}:*\n"
+        reply_message += f"  - Saldo: R$ {remaining_budget:.2f} / R$ {budget_amount:.2f}\n"
+        reply_message += f"  - Média Diária Segura: R$ {daily_avg:.2f}\n"
+        reply_message += f"  - Média Semanal Segura: R$ {weekly_avg:.2f}\n\n"
+    return reply_message, 'Markdown'
+
 async def list_budgets(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, parts: list):
     """Lista os orçamentos do mês, de forma geral ou para uma categoria específica."""
     try:
-        today = datetime.now()
-        current_month = today.month
-        current_year = today.year
-
-        q_budget = db.collection('budgets').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('month', '==', current_month)).where(filter=FieldFilter('year', '==', current_year)).where(filter=FieldFilter('amount', '>', 0))
-        
         category_filter_parts = [p for p in parts if p != '?']
         category_filter = " ".join(category_filter_parts).strip().lower()
 
-        if category_filter:
-            q_budget = q_budget.where(filter=FieldFilter('categoryName', '==', category_filter))
-
-        budgets_docs = list(q_budget.stream())
-
-        if not budgets_docs:
-            reply = f"Nenhum orçamento encontrado para '{category_filter}' este mês." if category_filter else "Nenhum orçamento definido para este mês."
-            await update.message.reply_text(reply)
-            return
-
-        reply_message = "*Resumo dos Orçamentos do Mês:*\n\n"
-        
-        for budget_doc in budgets_docs:
-            budget = budget_doc.to_dict()
-            category_name = budget['categoryName']
-            budget_amount = budget['amount']
-
-            start_of_month = datetime(current_year, current_month, 1, tzinfo=timezone.utc)
-            expenses_query = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('category', '==', category_name)).where(filter=FieldFilter('createdAt', '>=', start_of_month)).stream()
-            total_spent = sum(doc.to_dict().get('amount', 0) for doc in expenses_query)
-            
-            remaining_budget = budget_amount - total_spent
-            total_days_in_month = calendar.monthrange(current_year, current_month)[1]
-            days_remaining = total_days_in_month - today.day + 1
-            daily_avg = remaining_budget / days_remaining if days_remaining > 0 else 0
-            weekly_avg = daily_avg * 7
-
-            reply_message += f"*{category_name.capitalize()}:*\n"
-            reply_message += f"  - Saldo: R$ {remaining_budget:.2f} / R$ {budget_amount:.2f}\n"
-            reply_message += f"  - Média Diária Segura: R$ {daily_avg:.2f}\n"
-            reply_message += f"  - Média Semanal Segura: R$ {weekly_avg:.2f}\n\n"
-
-        await update.message.reply_text(reply_message, parse_mode='Markdown')
+        text, parse_mode = reports.get_or_render(firebase_uid, 'orcamentos', [category_filter],
+                                                 lambda: render_budgets(firebase_uid, category_filter),
+                                                 today=local_today(firebase_uid))
+        await update.message.reply_text(text, parse_mode=parse_mode)
 
     except Exception as e:
         print(f"Erro ao listar orçamentos: {e}")
         await update.message.reply_text("❌ Ocorreu um erro ao buscar seus orçamentos.")
 
+def render_today_spending(firebase_uid: str, categorized: bool) -> tuple[str, str | None]:
+    """Texto de `ver gastos hoje [categorizado]`, no dia local do usuário."""
+    by_category = spent_today_by_category(firebase_uid, allowance_snapshots.get(firebase_uid))
+    total_spent_today = sum(by_category.values())
+
+    if total_spent_today == 0:
+        return "🎉 Nenhum gasto registrado hoje!", None
+
+    reply_message = f"*Total gasto hoje: R$ {total_spent_today:.2f}*\n"
+    if categorized:
+        reply_message += "\n*Detalhes por categoria:*\n"
+        for category, amount in sorted(by_category.items()):
+            reply_message += f"- {category.capitalize()}: R$ {amount:.2f}\n"
+    return reply_message, 'Markdown'
+
 async def report_today_spending(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, parts: list):
     """Informa o total gasto hoje, de forma geral ou por categoria."""
     try:
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        q = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('createdAt', '>=', today_start))
-        
-        docs = q.stream()
-        
-        total_spent_today = 0
-        by_category = {}
-        
-        for doc in docs:
-            transaction = doc.to_dict()
-            amount = transaction.get('amount', 0)
-            category = transaction.get('category', 'Outros')
-            total_spent_today += amount
-            by_category[category] = by_category.get(category, 0) + amount
-
-        if total_spent_today == 0:
-            await update.message.reply_text("🎉 Nenhum gasto registrado hoje!")
-            return
-
         categorized = 'categorizado' in parts or 'categoria' in parts
-        
-        reply_message = f"*Total gasto hoje: R$ {total_spent_today:.2f}*\n"
-        if categorized:
-            reply_message += "\n*Detalhes por categoria:*\n"
-            for category, amount in sorted(by_category.items()):
-                reply_message += f"- {category.capitalize()}: R$ {amount:.2f}\n"
-
-        await update.message.reply_text(reply_message, parse_mode='Markdown')
+        text, parse_mode = reports.get_or_render(firebase_uid, 'gastos hoje', ['categorizado' if categorized else ''],
+                                                 lambda: render_today_spending(firebase_uid, categorized),
+                                                 today=local_today(firebase_uid))
+        await update.message.reply_text(text, parse_mode=parse_mode)
         
     except Exception as e:
         print(f"Erro ao reportar gastos: {e}")
@@ -924,14 +1020,11 @@ async def send_budget_feedback(message_to_edit, firebase_uid: str, category_name
     editando uma mensagem anterior.
     """
     try:
-        # --- 1. Obter o Orçamento da Categoria ---
-        today = datetime.now(timezone.utc)
-        current_month = today.month
-        current_year = today.year
+        # --- 1. Obter o Orçamento da Categoria (no mês local do usuário) ---
+        snapshot = allowance_snapshots.get(firebase_uid)
 
         # Busca o orçamento para a categoria específica no mês/ano corrente
-        budget_query = db.collection('budgets').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('month', '==', current_month)).where(filter=FieldFilter('year', '==', current_year)).where(filter=FieldFilter('categoryName', '==', category_name)).limit(1).stream()
-        budget_doc = next(budget_query, None)
+        budget_doc = next(iter(fetch_user_docs('budgets', firebase_uid, month=snapshot['month'], year=snapshot['year'], categoryName=category_name)), None)
 
         # Se não houver orçamento > 0, envia mensagem simples e encerra.
         if not budget_doc or budget_doc.to_dict().get('amount', 0) == 0:
@@ -940,21 +1033,13 @@ async def send_budget_feedback(message_to_edit, firebase_uid: str, category_name
 
         budget_amount = budget_doc.to_dict().get('amount', 0)
 
-        # --- 2. Calcular o Total Gasto no Mês (INCLUINDO o gasto atual) ---
-        start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        expenses_query = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('category', '==', category_name)).where(filter=FieldFilter('createdAt', '>=', start_of_month)).stream()
-        total_spent_month = sum(doc.to_dict().get('amount', 0) for doc in expenses_query)
-
-        # --- 3. Calcular a Meta Diária (ANTES do gasto atual) ---
-        remaining_budget_before_this_expense = budget_amount - (total_spent_month - spent_amount)
-        total_days_in_month = calendar.monthrange(current_year, current_month)[1]
-        days_remaining_including_today = total_days_in_month - today.day + 1
-        daily_allowance = remaining_budget_before_this_expense / days_remaining_including_today if days_remaining_including_today > 0 else 0
+        # --- 2. Total Gasto HOJE (INCLUINDO o gasto atual); o resto do mês vem da fotografia do dia ---
+        total_spent_today = spent_today_by_category(firebase_uid, snapshot, category_name).get(category_name, 0)
+        total_spent_month = snapshot['spentBeforeToday'].get(category_name, 0) + total_spent_today
 
-        # --- 4. Calcular o Total Gasto HOJE (INCLUINDO o gasto atual) ---
-        today_start = today.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_expenses_query = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('category', '==', category_name)).where(filter=FieldFilter('createdAt', '>=', today_start)).stream()
-        total_spent_today = sum(doc.to_dict().get('amount', 0) for doc in today_expenses_query)
+        # --- 3. Meta Diária (fixa desde o início do dia) ---
+        _, daily_allowance = category_allowance(snapshot, category_name, budget_amount)
+        days_remaining_including_today = snapshot['daysRemaining']
 
         # --- 5. Montar a Mensagem de Feedback ---
         base_message = f"💸 Gasto de R$ {spent_amount:.2f} na categoria '{category_name}' registrado!\n"
@@ -1001,49 +1086,25 @@ async def send_budget_feedback(message_to_edit, firebase_uid: str, category_name
 async def report_daily_allowance(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, parts: list):
     """Informa quanto ainda pode ser gasto hoje com base nos orçamentos."""
     try:
-        # Reutiliza a lógica de 'list_budgets' para os cálculos
-        # (Em um projeto maior, essa lógica seria movida para uma função auxiliar separada)
-        today = datetime.now()
-        current_month = today.month
-        current_year = today.year
+        snapshot = allowance_snapshots.get(firebase_uid)
 
-        q_budget = db.collection('budgets').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('month', '==', current_month)).where(filter=FieldFilter('year', '==', current_year)).where(filter=FieldFilter('amount', '>', 0))
-        
         category_filter = " ".join(parts).strip().lower()
-        if category_filter:
-            q_budget = q_budget.where(filter=FieldFilter('categoryName', '==', category_filter))
+        filters = {'categoryName': category_filter} if category_filter else {}
 
-        budgets_docs = list(q_budget.stream())
+        budgets_docs = [b for b in fetch_user_docs('budgets', firebase_uid, month=snapshot['month'], year=snapshot['year'], **filters) if b.to_dict().get('amount', 0) > 0]
 
         if not budgets_docs:
             await update.message.reply_text("Nenhum orçamento ativo encontrado para hoje.")
             return
 
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        q_expenses = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('createdAt', '>=', today_start))
-        today_expenses_docs = list(q_expenses.stream())
-        
-        spent_today_by_cat = {}
-        for doc in today_expenses_docs:
-            transaction = doc.to_dict()
-            cat = transaction.get('category')
-            spent_today_by_cat[cat] = spent_today_by_cat.get(cat, 0) + transaction.get('amount', 0)
+        spent_today_by_cat = spent_today_by_category(firebase_uid, snapshot)
 
         reply_message = "*Balanço de Hoje com Base nos Orçamentos:*\n\n"
         
         for budget_doc in budgets_docs:
             budget = budget_doc.to_dict()
             category_name = budget['categoryName']
-            budget_amount = budget['amount']
-
-            start_of_month = datetime(current_year, current_month, 1)
-            expenses_query = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('type', '==', 'expense')).where(filter=FieldFilter('category', '==', category_name)).where(filter=FieldFilter('createdAt', '>=', start_of_month)).stream()
-            total_spent_month = sum(doc.to_dict().get('amount', 0) for doc in expenses_query)
-            
-            remaining_budget_month = budget_amount - total_spent_month
-            total_days_in_month = calendar.monthrange(current_year, current_month)[1]
-            days_remaining = total_days_in_month - today.day + 1
-            daily_allowance = remaining_budget_month / days_remaining if days_remaining > 0 else 0
+            _, daily_allowance = category_allowance(snapshot, category_name, budget['amount'])
             
             spent_today = spent_today_by_cat.get(category_name, 0)
             remaining_for_today = daily_allowance - spent_today
@@ -1064,7 +1125,7 @@ async def report_daily_allowance(update: Update, context: ContextTypes.DEFAULT_T
 
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str):
     """Limpa o estado da conversa."""
-    context.user_data.pop('state', None)
+    clear_conversation_state(context)
     await update.message.reply_text("Ok, cancelado.")
     
 # --- 5. ORQUESTRADOR PRINCIPAL ---
@@ -1078,7 +1139,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Lógica de registro para novo usuário (sem alterações)
     if not firebase_uid:
         # Se o bot já estiver esperando um e-mail para registro
-        if context.user_data.get('state') == 'awaiting_email':
+        if get_conversation_state(context) == 'awaiting_email':
             await register_user(update, context)
             return
 
@@ -1087,78 +1148,144 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Olá! Bem-vindo ao Oikonomos Bot. Para começar, preciso vincular seu chat do Telegram à sua conta. "
             "Por favor, envie o mesmo e-mail que você usa para acessar o dashboard web."
         )
-        context.user_data['state'] = 'awaiting_email'
+        set_conversation_state(context, 'awaiting_email')
         return
 
-    text = update.message.text.strip()
-    
-    # --- NOVA LÓGICA DE ROTEAMENTO ---
-    if text.startswith('*'):
-        await process_default_transaction(update, context, text, firebase_uid)
+    command = parse_command(update.message.text)
+    handler = COMMAND_HANDLERS[command.verb]
+    await handler(update, context, command, firebase_uid)
+
+async def handle_view(update: Update, context: ContextTypes.DEFAULT_TYPE, parts: list, firebase_uid: str):
+    """Despacha as consultas `ver <assunto> [args]`."""
+    if not parts:
+        await update.message.reply_text("Comando 'ver' incompleto. Use '?' para ver as opções.")
         return
-    # --------------------------------
 
-    parts = text.split()
-    command = parts[0].lower()
+    sub_command = parts[0].lower()
+    view = VIEW_HANDLERS.get(normalize_text(sub_command))
+    if not view:
+        await update.message.reply_text(f"Não reconheci o comando 'ver {sub_command}'. Use '?' para ver as opções.")
+        return
+    await view(update, context, firebase_uid, parts[1:])
 
-    if command in ['?', 'ajuda']:
-        await send_manual(update, context, firebase_uid)
-    
-    elif command == 'ver':
-        if len(parts) < 2:
-            await update.message.reply_text("Comando 'ver' incompleto. Use '?' para ver as opções.")
+async def view_digest(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, args: list):
+    """`ver resumo`: devolve o último resumo gravado pelo cron."""
+    try:
+        with span('firestore.get', collection=DIGESTS_COLLECTION):
+            digest_doc = db.collection(DIGESTS_COLLECTION).document(firebase_uid).get()
+        if not digest_doc.exists:
+            await update.message.reply_text("Ainda não há um resumo para você. Ele é gerado toda segunda-feira e no dia 1º de cada mês.")
             return
-        
-        sub_command = parts[1].lower()
-        args = parts[2:]
-        
-        if sub_command in ['orçamento', 'orçamentos']:
-            await list_budgets(update, context, firebase_uid, args)
-        elif sub_command == 'categorias':
-            await list_categories(update, context, firebase_uid)
-        elif sub_command == 'contas':
-            await list_scheduled_transactions(update, context, firebase_uid, args)
-        elif sub_command == 'gastos' and len(parts) > 2 and parts[2].lower() == 'hoje':
-            await report_today_spending(update, context, firebase_uid, parts[3:])
-        elif sub_command == 'hoje':
-            await report_daily_allowance(update, context, firebase_uid, args)
-        else:
-            await update.message.reply_text(f"Não reconheci o comando 'ver {sub_command}'. Use '?' para ver as opções.")
-
-    elif command.startswith('+'):
-        await process_income(update, context, [command.lstrip('+')] + parts[1:], firebase_uid)
-    elif command == 'guardar':
-        await process_saving(update, context, parts[1:], firebase_uid)
-    elif command == 'sacar':
-        await process_withdrawal(update, context, parts[1:], firebase_uid)
-    elif command == 'pagar':
-        await process_payment(update, context, parts[1:], firebase_uid)
-    elif command == 'transferir':
-        await process_transfer(update, context, parts[1:], firebase_uid)
-    else:
-        # Assume que é uma despesa como último recurso
-        await process_expense(update, context, parts, firebase_uid)
+        await update.message.reply_text(digest_doc.to_dict()['text'], parse_mode='Markdown')
+    except Exception as e:
+        print(f"Erro ao buscar resumo: {e}")
+        await update.message.reply_text("❌ Ocorreu um erro ao buscar seu resumo.")
+
+async def view_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, args: list):
+    """`ver previsão`: projeção de fim de mês calculada pelo cron diário."""
+    from forecasting import FORECASTS_COLLECTION, forecast_doc_id, format_forecast
+    try:
+        now = datetime.now(timezone.utc)
+        with span('firestore.get', collection=FORECASTS_COLLECTION):
+            forecast_doc = db.collection(FORECASTS_COLLECTION).document(forecast_doc_id(firebase_uid, now)).get()
+        if not forecast_doc.exists:
+            await update.message.reply_text("Ainda não há previsão para este mês. Ela é recalculada todos os dias de madrugada.")
+            return
+        await update.message.reply_text(format_forecast(forecast_doc.to_dict(), now), parse_mode='Markdown')
+    except Exception as e:
+        print(f"Erro ao buscar previsão: {e}")
+        await update.message.reply_text("❌ Ocorreu um erro ao buscar sua previsão.")
+
+async def view_today_spending(update: Update, context: ContextTypes.DEFAULT_TYPE, firebase_uid: str, args: list):
+    """`ver gastos hoje [categorizado]`"""
+    if not args or args[0].lower() != 'hoje':
+        await update.message.reply_text(f"Não reconheci o comando 'ver gastos {' '.join(args)}'. Use '?' para ver as opções.")
+        return
+    await report_today_spending(update, context, firebase_uid, args[1:])
+
+# Tabelas de despacho: verbo -> handler(update, context, command, firebase_uid).
+# O verbo None (nenhum verbo reconhecido) assume que é uma despesa como último recurso.
+COMMAND_HANDLERS = {
+    None: lambda u, c, cmd, uid: process_expense(u, c, cmd.args, uid),
+    '?': lambda u, c, cmd, uid: send_manual(u, c, uid),
+    'ajuda': lambda u, c, cmd, uid: send_manual(u, c, uid),
+    'ver': lambda u, c, cmd, uid: handle_view(u, c, cmd.args, uid),
+    '*': lambda u, c, cmd, uid: process_default_transaction(u, c, cmd.text, uid),
+    '+': lambda u, c, cmd, uid: process_income(u, c, cmd.args, uid),
+    'guardar': lambda u, c, cmd, uid: process_saving(u, c, cmd.args, uid),
+    'sacar': lambda u, c, cmd, uid: process_withdrawal(u, c, cmd.args, uid),
+    'pagar': lambda u, c, cmd, uid: process_payment(u, c, cmd.args, uid),
+    'transferir': lambda u, c, cmd, uid: process_transfer(u, c, cmd.args, uid),
+    'buscar': lambda u, c, cmd, uid: process_search(u, c, cmd.args, uid),
+}
+
+# Subcomandos de `ver`, com a chave já normalizada (sem acentos).
+VIEW_HANDLERS = {
+    'orcamento': list_budgets,
+    'orcamentos': list_budgets,
+    'categorias': lambda u, c, uid, args: list_categories(u, c, uid),
+    'contas': list_scheduled_transactions,
+    'gastos': view_today_spending,
+    'hoje': report_daily_allowance,
+    'resumo': view_digest,
+    'previsao': view_forecast,
+}
 
 # --- 6. SERVIDOR WEB E WEBHOOK ---
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
-ptb_app = Application.builder().token(TELEGRAM_TOKEN).build()
-ptb_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-ptb_app.add_handler(CallbackQueryHandler(handle_account_selection))
+_ptb_app = None
+# Webhooks simultâneos no processo frio não podem construir duas Applications
+_ptb_app_lock = threading.Lock()
+_last_prune = time.monotonic()
+
+def get_ptb_app():
+    """
+    Constrói e inicializa a Application do python-telegram-bot no primeiro
+    update recebido. Ela fica viva (com seu pool de conexões) no loop do bot
+    enquanto o processo existir.
+    """
+    global _ptb_app
+    if _ptb_app is not None:
+        return _ptb_app
+    with _ptb_app_lock:
+        if _ptb_app is None:
+            from telegram.ext import CallbackQueryHandler, MessageHandler, filters
+            from telegram_client import build_application, run_on_bot_loop
+            application = build_application(TELEGRAM_TOKEN, [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message),
+                CallbackQueryHandler(handle_account_selection),
+            ])
+            run_on_bot_loop(application.initialize())
+            _ptb_app = application
+    return _ptb_app
+
+def prune_user_data(ptb_app):
+    """Roda `prune_conversation_state` no máximo a cada CONVERSATION_PRUNE_INTERVAL_SECONDS."""
+    global _last_prune
+    from telegram_client import run_on_bot_loop
+    if time.monotonic() - _last_prune < CONVERSATION_PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = time.monotonic()
+    dropped = run_on_bot_loop(prune_conversation_state(ptb_app))
+    if dropped:
+        print(f"{dropped} estado(s) de conversa descartado(s)")
 
 @app.route("/")
 def index():
     return "Servidor do Oikonomos Bot (Multiusuário) está online!"
 
 @app.route("/api/bot", methods=['POST'])
+@profiled
+@traced
 def webhook():
-    async def handle_update():
-        update = Update.de_json(request.get_json(), ptb_app.bot)
-        await ptb_app.initialize()
-        await ptb_app.process_update(update)
-        await ptb_app.shutdown()
+    from telegram import Update
+    from telegram_client import run_on_bot_loop
     try:
-        asyncio.run(handle_update())
+        ptb_app = get_ptb_app()
+        update = Update.de_json(request.get_json(), ptb_app.bot)
+        run_on_bot_loop(ptb_app.process_update(update))
+        prune_user_data(ptb_app)
         return "ok", 200
     except Exception as e:
         print(f"Erro no webhook: {e}")
@@ -1172,14 +1299,69 @@ def favicon():
 
 # Substitua esta função em: backend/bot.py
 
+def closing_transaction_id(firebase_uid: str, month_start: datetime) -> str:
+    return f"closing_{firebase_uid}_{month_start.year}_{month_start.month:02d}"
+
+def close_month_for_user(firebase_uid: str, start_of_previous_month: datetime, closing_transaction_date: datetime) -> int:
+    """
+    Lança o saldo do mês anterior de um usuário. Devolve 1 se lançou, 0 se não
+    havia transações ou se o fecho já tinha sido lançado.
+
+    O ID da transação é fixo por usuário e mês e ela é criada com `create`:
+    um worker que assume o shard depois de uma queda (ou um dono antigo que
+    ainda não percebeu que perdeu o lease) não lança o fecho duas vezes,
+    qualquer que seja o cursor gravado.
+    """
+    from google.api_core.exceptions import AlreadyExists
+    print(f"Processando fecho para o usuário: {firebase_uid}")
+
+    # Totais do mês anterior: do resumo, se o mês já foi arquivado, ou das transações.
+    totals = monthly_totals(db, firebase_uid, start_of_previous_month.year, start_of_previous_month.month)
+
+    if not totals['count']:
+        print(f"Nenhuma transação encontrada para o usuário {firebase_uid} no mês anterior. Pulando.")
+        return 0
+
+    total_income = totals['income']
+    total_expense = totals['expense']
+    balance = total_income - total_expense
+
+    # Prepara a nova transação de balanço.
+    # A data da transação é o 1º dia do mês ATUAL.
+    if balance >= 0:
+        closing_entry = LedgerEntry('income', balance, 'saldo anterior', f"Saldo positivo de {start_of_previous_month.strftime('%B de %Y')}", created_at=closing_transaction_date)
+    else:
+        closing_entry = LedgerEntry('expense', abs(balance), 'dívida anterior', f"Saldo negativo de {start_of_previous_month.strftime('%B de %Y')}", created_at=closing_transaction_date)
+
+    try:
+        ledger.commit(firebase_uid, [closing_entry], transaction_ids=[closing_transaction_id(firebase_uid, start_of_previous_month)])
+    except AlreadyExists:
+        print(f"Fecho de {start_of_previous_month.strftime('%Y-%m')} já lançado para o usuário {firebase_uid}. Pulando.")
+        return 0
+    print(f"Transação de fecho de R$ {balance:.2f} criada para o usuário {firebase_uid} em {closing_transaction_date.strftime('%Y-%m-%d')}.")
+    return 1
+
 @app.route("/api/monthly-closing", methods=['GET'])
+@profiled
+@traced
 def run_monthly_closing():
+    """
+    Fecho do mês anterior para todos os usuários. Cada shard de usuários é
+    processado uma única vez por mês (ver jobs.py); `?run_key=` força outra
+    rodada com uma chave nova.
+    """
+    from dateutil.relativedelta import relativedelta
+    from notifications import chats_by_user
     # 1. Proteção: Verifica a senha secreta (sem alterações)
     auth_header = request.headers.get('Authorization')
     cron_secret = os.getenv("CRON_SECRET")
     if auth_header != f'Bearer {cron_secret}':
         return "Unauthorized", 401
 
+    # Os totais do mês vêm do Firestore: o journal precisa estar gravado
+    if not ledger.drain(LEDGER_JOURNAL_DRAIN_SECONDS):
+        return "Journal de lançamentos ainda não gravado", 503
+
     print("Iniciando processo de fecho de mês para todos os usuários...")
     try:
         # --- Lógica de Data Aprimorada ---
@@ -1193,121 +1375,266 @@ def run_monthly_closing():
         # É exatamente isso que você pediu!
         closing_transaction_date = today.replace(day=1, hour=12, minute=0, second=0, microsecond=0)
         
-        # Agora, calculamos o intervalo do mês ANTERIOR para buscar as transações.
-        # Ex: Se hoje é 1º de Agosto, o fim do mês anterior foi 31 de Julho.
-        end_of_previous_month = closing_transaction_date - relativedelta(seconds=1)
-        # E o início do mês anterior foi 1º de Julho.
-        start_of_previous_month = end_of_previous_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        # Agora, calculamos o mês ANTERIOR, cujo balanço será fechado.
+        # Ex: Se hoje é 1º de Agosto, o mês anterior é Julho.
+        start_of_previous_month = closing_transaction_date.replace(hour=0) - relativedelta(months=1)
         
         # --- Fim da Lógica de Data ---
 
-        all_users = db.collection('telegram_users').stream()
-        processed_users = 0
+        # O cursor é gravado a cada usuário; o ID fixo do fecho impede lançá-lo duas vezes
+        run_key = request.args.get('run_key') or today.strftime('%Y-%m')
+        report = jobs.run_sharded('monthly-closing', run_key, list(chats_by_user()),
+                                  lambda firebase_uid: close_month_for_user(firebase_uid, start_of_previous_month, closing_transaction_date),
+                                  durable=True)
 
-        for user_doc in all_users:
-            firebase_uid = user_doc.to_dict().get('firebase_uid')
-            if not firebase_uid:
-                continue
-
-            print(f"Processando fecho para o usuário: {firebase_uid}")
-            
-            # Busca as transações do usuário DENTRO do intervalo do mês anterior.
-            q = db.collection('transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('createdAt', '>=', start_of_previous_month)).where(filter=FieldFilter('createdAt', '<=', end_of_previous_month))
-            transactions_prev_month = list(q.stream())
-
-            if not transactions_prev_month:
-                print(f"Nenhuma transação encontrada para o usuário {firebase_uid} no mês anterior. Pulando.")
-                continue
-
-            # Calcula o balanço (sem alterações na lógica)
-            total_income = sum(doc.to_dict().get('amount', 0) for doc in transactions_prev_month if doc.to_dict().get('type') == 'income')
-            total_expense = sum(doc.to_dict().get('amount', 0) for doc in transactions_prev_month if doc.to_dict().get('type') == 'expense')
-            balance = total_income - total_expense
-            
-            # Prepara a nova transação de balanço
-            closing_transaction_data = {
-                "userId": firebase_uid,
-                # AQUI ESTÁ A CONFIRMAÇÃO: A data da transação é o 1º dia do mês ATUAL.
-                "createdAt": closing_transaction_date, 
-            }
-            if balance >= 0:
-                closing_transaction_data.update({
-                    'type': 'income',
-                    'amount': balance,
-                    'category': 'saldo anterior',
-                    'description': f"Saldo positivo de {end_of_previous_month.strftime('%B de %Y')}"
-                })
-            else:
-                closing_transaction_data.update({
-                    'type': 'expense',
-                    'amount': abs(balance),
-                    'category': 'dívida anterior',
-                    'description': f"Saldo negativo de {end_of_previous_month.strftime('%B de %Y')}"
-                })
-
-            db.collection('transactions').add(closing_transaction_data)
-            print(f"Transação de fecho de R$ {balance:.2f} criada para o usuário {firebase_uid} em {closing_transaction_date.strftime('%Y-%m-%d')}.")
-            processed_users += 1
-
-        final_message = f"OK. Fecho de mês processado para {processed_users} usuário(s)."
+        final_message = f"OK. Fecho de mês processado para {report.total('count')} usuário(s); {report.summary()}."
         print(final_message)
-        return final_message, 200
+        return final_message, 500 if report.failed else 200
 
     except Exception as e:
         print(f"Erro no Cron Job de fecho de mês: {e}")
         return f"Erro: {e}", 500
 
 
+def create_recurring_bills(firebase_uid: str, today: datetime) -> int:
+    """Cria a próxima ocorrência das contas recorrentes já pagas de um usuário. Devolve quantas criou."""
+    from dateutil.relativedelta import relativedelta
+
+    print(f"Verificando recorrências para o usuário: {firebase_uid}")
+    with span('firestore.query', collection='scheduled_transactions', filters=['isRecurring', 'status']):
+        query = list(db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('isRecurring', '==', True)).where(filter=FieldFilter('status', '==', 'paid')).stream())
+    
+    user_created_count = 0
+    for paid_doc in query:
+        paid_data = paid_doc.to_dict()
+        last_due_date = paid_data['dueDate']
+        next_due_date = last_due_date + relativedelta(months=1)
+        
+        if next_due_date.tzinfo is None: next_due_date = next_due_date.replace(tzinfo=timezone.utc)
+        while next_due_date < today: next_due_date += relativedelta(months=1)
+
+        next_month_start = next_due_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        next_month_query = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('description', '==', paid_data['description'])).where(filter=FieldFilter('categoryName', '==', paid_data['categoryName'])).where(filter=FieldFilter('dueDate', '>=', next_month_start)).limit(1).stream()                
+        
+        if not next(next_month_query, None):
+            new_scheduled_transaction = {"userId": firebase_uid, "description": paid_data['description'],"amount": paid_data['amount'],"categoryName": paid_data['categoryName'],"dueDate": next_due_date,"status": "pending","isRecurring": True}
+            db.collection('scheduled_transactions').add(new_scheduled_transaction)
+            user_created_count += 1
+    
+    if user_created_count > 0:
+        user_cache.bump(firebase_uid, 'scheduled_transactions')
+        data_versions.bump(firebase_uid)
+        print(f"Criadas {user_created_count} novas contas para o usuário {firebase_uid}")
+    return user_created_count
+
+def run_daily_maintenance(firebase_uids: list[str]) -> dict:
+    """Parte do cron diário que não é por usuário: saldos com shards, previsões e metas diárias."""
+    # Consolida em 'balance' os saldos das contas com contador distribuído,
+    # para o dashboard (que lê 'balance' direto) não ficar defasado.
+    sharded_accounts = db.collection('accounts').where(filter=FieldFilter(SHARDS_FIELD, '>', 0)).stream()
+    for account_doc in sharded_accounts:
+        if balances.fold(account_doc.id):
+            user_cache.bump(account_doc.to_dict().get('userId'), 'accounts')
+
+    # Previsões de fim de mês para todos os usuários (numpy só é importado aqui)
+    forecast_count = 0
+    try:
+        from forecasting import run_forecasts
+        forecast_count = run_forecasts(db)
+    except Exception as e:
+        print(f"Erro ao calcular previsões: {e}")
+
+    # Saldo de abertura e meta do dia dos orçamentos (ver allowances.py)
+    snapshot_count = 0
+    try:
+        snapshot_count = build_snapshots(db, firebase_uids)
+    except Exception as e:
+        print(f"Erro ao calcular as metas diárias: {e}")
+    return {'forecasts': forecast_count, 'snapshots': snapshot_count}
+
+
 # --- 7. FUNÇÃO AGENDADA (CRON JOB) ATUALIZADA ---
 @app.route("/api/cron", methods=['GET'])
+@profiled
+@traced
 def run_recurrence_check():
+    """
+    Cron diário. Os shards de usuários (contas recorrentes) e a unidade
+    `global` (run_daily_maintenance) rodam uma única vez por dia, mesmo com
+    invocações sobrepostas (ver jobs.py); `?run_key=` força outra rodada.
+    """
+    from notifications import chats_by_user
     auth_header = request.headers.get('Authorization')
     if auth_header != f'Bearer {CRON_SECRET}':
         return "Unauthorized", 401
 
     print("Iniciando verificação de recorrência para TODOS os usuários...")
     try:
-        all_users = db.collection('telegram_users').stream()
-        total_created_count = 0
-        
-        for user_doc in all_users:
-            firebase_uid = user_doc.to_dict().get('firebase_uid')
-            if not firebase_uid: continue
-
-            print(f"Verificando recorrências para o usuário: {firebase_uid}")
-            today = datetime.now(timezone.utc)
-            query = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('isRecurring', '==', True)).where(filter=FieldFilter('status', '==', 'paid')).stream()            
-            
-            user_created_count = 0
-            for paid_doc in query:
-                paid_data = paid_doc.to_dict()
-                last_due_date = paid_data['dueDate']
-                next_due_date = last_due_date + relativedelta(months=1)
-                
-                if next_due_date.tzinfo is None: next_due_date = next_due_date.replace(tzinfo=timezone.utc)
-                while next_due_date < today: next_due_date += relativedelta(months=1)
+        today = datetime.now(timezone.utc)
+        run_key = request.args.get('run_key') or today.date().isoformat()
+        firebase_uids = list(chats_by_user())
 
-                next_month_start = next_due_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                next_month_query = db.collection('scheduled_transactions').where(filter=FieldFilter('userId', '==', firebase_uid)).where(filter=FieldFilter('description', '==', paid_data['description'])).where(filter=FieldFilter('categoryName', '==', paid_data['categoryName'])).where(filter=FieldFilter('dueDate', '>=', next_month_start)).limit(1).stream()                
-                
-                if not next(next_month_query, None):
-                    new_scheduled_transaction = {"userId": firebase_uid, "description": paid_data['description'],"amount": paid_data['amount'],"categoryName": paid_data['categoryName'],"dueDate": next_due_date,"status": "pending","isRecurring": True}
-                    db.collection('scheduled_transactions').add(new_scheduled_transaction)
-                    user_created_count += 1
-            
-            if user_created_count > 0:
-                print(f"Criadas {user_created_count} novas contas para o usuário {firebase_uid}")
-            total_created_count += user_created_count
+        report = jobs.run_sharded('recurrence', run_key, firebase_uids,
+                                  lambda firebase_uid: create_recurring_bills(firebase_uid, today))
+        maintenance = jobs.run('recurrence', run_key, ['global'], lambda unit, lease: run_daily_maintenance(firebase_uids))
+        totals = maintenance.results.get('global', {})
 
-        final_message = f"OK. {total_created_count} novas contas criadas no total."
+        final_message = (f"OK. {report.total('count')} novas contas criadas no total; {totals.get('forecasts', 0)} previsões atualizadas; "
+                         f"{totals.get('snapshots', 0)} metas diárias calculadas; {report.summary()}.")
         print(final_message)
-        return final_message, 200
+        return final_message, 500 if report.failed or maintenance.failed else 200
 
     except Exception as e:
         print(f"Erro no Cron Job: {e}")
         return f"Erro: {e}", 500
     
+@app.route("/api/reminders", methods=['GET'])
+@profiled
+@traced
+def run_due_reminders():
+    """
+    Lembra cada usuário das contas pendentes que vencem nos próximos
+    REMINDER_DAYS_AHEAD dias: uma consulta por intervalo em toda a coleção,
+    agrupada por usuário em memória, e uma mensagem por chat.
+    """
+    auth_header = request.headers.get('Authorization')
+    if auth_header != f'Bearer {CRON_SECRET}':
+        return "Unauthorized", 401
+
+    from notifications import chats_by_user, send_bulk
+    from telegram_client import run_on_bot_loop
+    try:
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=REMINDER_DAYS_AHEAD + 1)
+        q = (db.collection('scheduled_transactions')
+             .where(filter=FieldFilter('status', '==', 'pending'))
+             .where(filter=FieldFilter('dueDate', '>=', start))
+             .where(filter=FieldFilter('dueDate', '<', end)))
+        with span('firestore.query', collection='scheduled_transactions', range='due_soon'):
+            due_docs = list(q.stream())
+
+        bills_by_user = {}
+        for doc in due_docs:
+            bill = doc.to_dict()
+            if bill.get('userId'):
+                bills_by_user.setdefault(bill['userId'], []).append(bill)
+        if not bills_by_user:
+            return "OK. Nenhuma conta a vencer.", 200
+
+        messages = []
+        for firebase_uid, chat_ids in chats_by_user(bills_by_user).items():
+            text = format_due_reminder(bills_by_user[firebase_uid])
+            messages.extend((chat_id, text) for chat_id in chat_ids)
+
+        sent, failed = run_on_bot_loop(send_bulk(get_ptb_app().bot, messages))
+        final_message = f"OK. {len(due_docs)} conta(s) a vencer; {sent} lembrete(s) enviado(s), {failed} falha(s)."
+        print(final_message)
+        return final_message, 200
+
+    except Exception as e:
+        print(f"Erro no Cron Job de lembretes: {e}")
+        return f"Erro: {e}", 500
+
+def format_due_reminder(bills: list) -> str:
+    bills = sorted(bills, key=lambda b: b['dueDate'])
+    lines = [f"🔔 *Contas a vencer nos próximos {REMINDER_DAYS_AHEAD} dias:*\n"]
+    for bill in bills:
+        lines.append(f"⏳ {bill.get('description', 'Sem descrição')} ({bill.get('categoryName', '')}): R$ {bill.get('amount', 0):.2f} — vence em {bill['dueDate'].strftime('%d/%m')}")
+    lines.append(f"\nTotal: R$ {sum(b.get('amount', 0) for b in bills):.2f}. Use `pagar <descrição>` para registrar o pagamento.")
+    return "\n".join(lines)
+
+@app.route("/api/digest", methods=['GET'])
+@profiled
+@traced
+def run_digest():
+    """Calcula, grava e envia o resumo `?period=weekly|monthly` de todos os usuários."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header != f'Bearer {CRON_SECRET}':
+        return "Unauthorized", 401
+
+    period = request.args.get('period', 'weekly')
+    if period not in PERIOD_LABELS:
+        return f"Período inválido: {period}", 400
+
+    from notifications import chats_by_user, send_bulk
+    from telegram_client import run_on_bot_loop
+    try:
+        chats = chats_by_user()
+        digests = build_digests(db, list(chats), period)
+        messages = [(chat_id, digests[uid]['text']) for uid, chat_ids in chats.items() if uid in digests for chat_id in chat_ids]
+        sent, failed = run_on_bot_loop(send_bulk(get_ptb_app().bot, messages))
+        final_message = f"OK. Resumo {PERIOD_LABELS[period]} calculado para {len(digests)} usuário(s); {sent} enviado(s), {failed} falha(s)."
+        print(final_message)
+        return final_message, 200
+
+    except Exception as e:
+        print(f"Erro no Cron Job de resumo: {e}")
+        return f"Erro: {e}", 500
+
+@app.route("/api/archive", methods=['GET'])
+@profiled
+@traced
+def run_archive_job():
+    """Move para o armazenamento frio os meses de transações anteriores ao horizonte."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header != f'Bearer {CRON_SECRET}':
+        return "Unauthorized", 401
+
+    from archive import run_archive
+    try:
+        results = run_archive(db)
+        for month, count in results:
+            print(f"Mês {month} arquivado: {count} transações.")
+        final_message = f"OK. {len(results)} mês(es) arquivado(s), {sum(count for _, count in results)} transações."
+        print(final_message)
+        return final_message, 200
+
+    except Exception as e:
+        print(f"Erro no Cron Job de arquivamento: {e}")
+        return f"Erro: {e}", 500
+
+@app.route("/api/reconcile", methods=['GET'])
+@profiled
+@traced
+def run_balance_reconciliation():
+    """
+    Confere o saldo de todas as contas com o livro-caixa, de forma incremental.
+    `?full=1` ignora os checkpoints; `?repair=1` corrige as divergências e
+    só é aceito junto com `full=1` (ver reconciliation.py).
+    """
+    auth_header = request.headers.get('Authorization')
+    if auth_header != f'Bearer {CRON_SECRET}':
+        return "Unauthorized", 401
+
+    repair = request.args.get('repair', '') in ('1', 'true')
+    full = request.args.get('full', '') in ('1', 'true')
+    if repair and not full:
+        return "repair=1 exige full=1", 400
+
+    # Sem isso o saldo lido incluiria lançamentos que o livro-caixa ainda não tem
+    if not ledger.drain(LEDGER_JOURNAL_DRAIN_SECONDS):
+        return "Journal de lançamentos ainda não gravado", 503
+
+    from reconciliation import BalanceReconciler
+    try:
+        discrepancies = BalanceReconciler(db, balances).run(repair=repair, full=full)
+        for result in discrepancies:
+            print(f"Conta {result.account_id} ({result.account_name}) do usuário {result.user_id}: saldo R$ {result.actual:.2f}, "
+                  f"livro-caixa R$ {result.expected:.2f} (diferença R$ {result.discrepancy:.2f}){' - corrigido' if repair else ''}")
+            if repair:
+                user_cache.bump(result.user_id, 'accounts')
+                data_versions.bump(result.user_id)
+        final_message = f"OK. {len(discrepancies)} conta(s) divergente(s){' corrigida(s)' if repair else ''}."
+        print(final_message)
+        return final_message, 200
+
+    except Exception as e:
+        print(f"Erro no Cron Job de conciliação: {e}")
+        return f"Erro: {e}", 500
+
 @app.route("/api/generate-api-key", methods=['POST'])
+@profiled
+@traced
 def generate_api_key():
     """
     Gera uma nova chave de API para um utilizador autenticado.
@@ -1330,7 +1657,10 @@ def generate_api_key():
 
         # 4. Salvar a chave no documento do utilizador na coleção 'users'
         user_doc_ref = db.collection('users').document(uid)
+        old_api_key = (user_doc_ref.get().to_dict() or {}).get('apiKey')
         user_doc_ref.set({'apiKey': new_api_key}, merge=True)
+        if old_api_key:
+            user_cache.delete_value(f"apikey:{old_api_key}")
 
         # 5. Retornar a nova chave para o frontend
         return jsonify({"apiKey": new_api_key}), 200
@@ -1350,27 +1680,47 @@ def require_api_key(f):
             return jsonify({"error": "Chave de API em falta no cabeçalho X-API-Key"}), 401
 
         # Procura o utilizador que possui esta chave de API
-        users_ref = db.collection('users').where(filter=FieldFilter('apiKey', '==', api_key)).limit(1).stream()
-        user_doc = next(users_ref, None)
+        uid = user_cache.get_value(f"apikey:{api_key}")
+        if not uid:
+            with span('firestore.query', collection='users', filters=['apiKey']):
+                user_doc = next(db.collection('users').where(filter=FieldFilter('apiKey', '==', api_key)).limit(1).stream(), None)
 
-        if not user_doc:
-            return jsonify({"error": "Chave de API inválida"}), 403
+            if not user_doc:
+                return jsonify({"error": "Chave de API inválida"}), 403
+            uid = user_doc.id
+            user_cache.set_value(f"apikey:{api_key}", uid)
 
         # Passa o UID do utilizador para a função da rota
-        uid = user_doc.id
         return f(uid, *args, **kwargs)
     return decorated_function
 
+# --- DECORADOR DE AUTENTICAÇÃO VIA ID TOKEN DO FIREBASE (dashboard) ---
+def require_id_token(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Cabeçalho de autorização em falta ou mal formatado"}), 401
+        try:
+            decoded_token = auth.verify_id_token(auth_header.split('Bearer ')[1])
+        except (auth.InvalidIdTokenError, ValueError):
+            return jsonify({"error": "ID Token inválido"}), 403
+        return f(decoded_token['uid'], *args, **kwargs)
+    return decorated_function
+
 # --- ENDPOINTS DA API PARA O CORVUS ---
 
 @app.route("/api/categories", methods=['GET'])
+@profiled
+@traced
 @require_api_key
+@http_cache.cached("private, no-cache")
 def get_categories(uid):
     """
     Devolve as categorias de despesa de um utilizador, validado pela chave de API.
     """
     try:
-        cats_ref = db.collection('categories').where(filter=FieldFilter('userId', '==', uid)).where(filter=FieldFilter('type', '==', 'expense')).stream()
+        cats_ref = fetch_user_docs('categories', uid, type='expense')
         
         # --- CORREÇÃO AQUI ---
         categories = []
@@ -1386,6 +1736,8 @@ def get_categories(uid):
         return jsonify({"error": "Não foi possível buscar as categorias"}), 500
 
 @app.route("/api/transaction", methods=['POST'])
+@profiled
+@traced
 @require_api_key
 def create_transaction(uid):
     """
@@ -1404,39 +1756,21 @@ def create_transaction(uid):
             return jsonify({"error": "O valor da transação deve ser positivo."}), 400
 
         # 1. Encontrar a conta padrão do utilizador
-        accounts_ref = db.collection('accounts').where(filter=FieldFilter('userId', '==', uid)).where(filter=FieldFilter('isDefault', '==', True)).limit(1).stream()
-        default_account_doc = next(accounts_ref, None)
+        accounts = fetch_user_docs('accounts', uid)
+        default_account_doc = next((acc for acc in accounts if acc.to_dict().get('isDefault')), None)
 
         if not default_account_doc:
             # Fallback: se não houver conta padrão, pega a primeira que encontrar
-            all_accounts_ref = db.collection('accounts').where(filter=FieldFilter('userId', '==', uid)).limit(1).stream()
-            default_account_doc = next(all_accounts_ref, None)
+            default_account_doc = next(iter(accounts), None)
             if not default_account_doc:
                 return jsonify({"error": "Nenhuma conta encontrada para este utilizador no Apollo."}), 404
         
         default_account_id = default_account_doc.id
 
-        # 2. Usar um batch para garantir a consistência dos dados
-        batch = db.batch()
-
-        # 3. Criar a nova transação
-        new_transaction_ref = db.collection("transactions").document()
-        batch.set(new_transaction_ref, {
-            "userId": uid,
-            "type": "expense",
-            "amount": amount,
-            "category": category,
-            "description": description,
-            "createdAt": firestore.SERVER_TIMESTAMP,
-            "accountId": default_account_id,
-        })
-
-        # 4. Atualizar o saldo da conta
-        account_doc_ref = db.collection('accounts').document(default_account_id)
-        batch.update(account_doc_ref, {'balance': firestore.firestore.Increment(-amount)})
-        
-        # 5. Executar as operações
-        batch.commit()
+        # 2. Criar a transação e atualizar o saldo da conta num único lote
+        ledger.commit(uid, [
+            LedgerEntry('expense', amount, category, description, default_account_id),
+        ], accounts={default_account_id: default_account_doc.to_dict()})
 
         return jsonify({"success": True, "message": "Transação criada com sucesso"}), 201
 
@@ -1444,6 +1778,47 @@ def create_transaction(uid):
         print(f"Erro ao criar transação via API: {e}")
         return jsonify({"error": "Ocorreu um erro interno ao criar a transação"}), 500
 
+@app.route("/api/search", methods=['GET'])
+@profiled
+@traced
+@require_api_key
+@http_cache.cached("private, max-age=60")
+def search_transactions(uid):
+    """
+    Busca textual nas transações: `?q=<termos>[&year=<ano>]`.
+    Devolve a contagem, os totais de renda e despesa e os IDs encontrados.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Parâmetro 'q' em falta."}), 400
+    try:
+        args = query.split() + ([request.args['year']] if request.args.get('year') else [])
+        terms, months, _ = search_months(args)
+        result = search_index.search(uid, " ".join(terms), months)
+        return jsonify(result.to_dict()), 200
+    except Exception as e:
+        print(f"Erro na busca via API: {e}")
+        return jsonify({"error": "Ocorreu um erro interno na busca"}), 500
+
+# --- ENDPOINT DE CARGA INICIAL DO DASHBOARD ---
+
+@app.route("/api/bootstrap", methods=['GET'])
+@profiled
+@traced
+@require_id_token
+@http_cache.cached("private, no-cache")
+def get_bootstrap(uid):
+    """
+    Tudo o que o dashboard precisa para a primeira tela, numa só resposta
+    (ver bootstrap.py). Autenticado pelo ID Token do Firebase.
+    """
+    from bootstrap import build_bootstrap
+    try:
+        return jsonify(build_bootstrap(db, uid, fetch_user_docs, balances)), 200
+    except Exception as e:
+        print(f"Erro ao montar a carga inicial do dashboard: {e}")
+        return jsonify({"error": "Ocorreu um erro interno ao carregar os dados"}), 500
+
 # --- 8. EXECUÇÃO LOCAL (Opcional) ---
 if __name__ == '__main__':
     print("Iniciando servidor Flask local para desenvolvimento em http://127.0.0.1:8000 ...")
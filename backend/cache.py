@@ -0,0 +1,403 @@
+# backend/cache.py
+"""
+Cache compartilhado das leituras por usuário, com backends intercambiáveis.
+
+Com vários workers (gunicorn, vários processos) um cache em memória só ajuda
+o próprio worker: cada um relê do Firestore as mesmas categorias, contas e
+chaves de API. Aqui a camada de cache tem três backends com a mesma
+interface (`get`, `set`, `add`, `incr`, `delete`):
+
+- `MemoryBackend`: LRU com TTL por item, dentro do processo;
+- `SQLiteBackend`: um arquivo SQLite em tmpfs (`/dev/shm`), compartilhado
+  pelos processos da mesma máquina;
+- `RedisBackend`: qualquer servidor que fale o protocolo do Redis (RESP),
+  compartilhado entre máquinas. Usa um cliente mínimo sobre socket, sem
+  dependência nova.
+
+Invalidação por versão: cada (usuário, escopo) tem um contador
+`v:{escopo}:{uid}` no próprio backend, e as entradas são gravadas sob
+`{escopo}:{uid}:{versão}:{sufixo}`. Uma escrita do backend chama `bump`,
+que incrementa o contador; as entradas antigas deixam de ser encontradas
+por qualquer processo e expiram sozinhas. Se o contador sumir (despejo,
+restart do Redis), ele renasce com o relógio em milissegundos, nunca com
+um valor já usado.
+
+Escritas feitas fora do backend (pelo dashboard) não passam por `bump`; para
+elas vale o TTL de cada escopo, curto para `accounts` (saldos).
+
+Configuração:
+- `CACHE_BACKEND`: `memory`, `sqlite`, `redis` ou vazio (padrão: desligado);
+- `CACHE_URL`: caminho do arquivo SQLite ou `redis://host:porta/db`;
+- `CACHE_TTL_SECONDS` (padrão 60), `CACHE_ACCOUNTS_TTL_SECONDS` (padrão 10)
+  e `CACHE_IDENTITY_TTL_SECONDS` (padrão 300, chat -> usuário e chave de API).
+
+Falhas do backend compartilhado nunca derrubam a requisição: contam como
+miss e a leitura vai direto ao Firestore.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from cachetools import LRUCache
+from tracing import span
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "").lower()
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_ACCOUNTS_TTL_SECONDS = float(os.getenv("CACHE_ACCOUNTS_TTL_SECONDS", "10"))
+CACHE_IDENTITY_TTL_SECONDS = float(os.getenv("CACHE_IDENTITY_TTL_SECONDS", "300"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "oik")
+# Depois de uma falha o backend é ignorado por este tempo (sem pagar timeouts)
+CACHE_RETRY_SECONDS = 5.0
+# Os contadores de versão vivem bem mais que as entradas
+VERSION_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_SQLITE_PATH = "/dev/shm/oikonomos-cache.sqlite" if os.path.isdir("/dev/shm") else "/tmp/oikonomos-cache.sqlite"
+
+SCOPE_TTLS = {
+    'accounts': CACHE_ACCOUNTS_TTL_SECONDS,
+    'identity': CACHE_IDENTITY_TTL_SECONDS,
+}
+
+
+# --- SERIALIZAÇÃO ---
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"tipo não serializável no cache: {type(value).__name__}")
+
+
+def _decode_hook(obj: dict):
+    if len(obj) == 1 and '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=_encode_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data: bytes):
+    return json.loads(data, object_hook=_decode_hook)
+
+
+# --- BACKENDS ---
+class MemoryBackend:
+    """LRU em memória com expiração por item (o TTLCache só tem um TTL global)."""
+
+    def __init__(self, maxsize: int = 16384):
+        self._items = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._items[key]
+                return None
+            return item[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Grava só se a chave não existir. Devolve se gravou."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                return False
+            self._items[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def incr(self, key: str) -> int | None:
+        """Incrementa um contador existente; None se a chave não existir."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                return None
+            value = int(item[1]) + 1
+            self._items[key] = (item[0], str(value).encode())
+            return value
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+
+class SQLiteBackend:
+    """
+    Tabela chave-valor num arquivo SQLite (de preferência em tmpfs), em modo
+    WAL: vários processos leem em paralelo e as escritas são curtas.
+    Uma conexão por thread.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # É um cache: perder as últimas escritas num crash não importa
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._conn().execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+        self._maybe_purge()
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires WHERE kv.expires < ?",
+            (key, value, now + ttl, now))
+        return cursor.rowcount > 0
+
+    def incr(self, key: str) -> int | None:
+        row = self._conn().execute(
+            "UPDATE kv SET value = CAST(CAST(value AS TEXT) AS INTEGER) + 1 WHERE key = ? AND expires >= ? RETURNING value",
+            (key, time.time())).fetchone()
+        return int(row[0]) if row else None
+
+    def delete(self, *keys: str):
+        self._conn().executemany("DELETE FROM kv WHERE key = ?", [(key,) for key in keys])
+
+    def _maybe_purge(self):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn().execute("DELETE FROM kv WHERE expires < ?", (time.time(),))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """
+    Cliente RESP mínimo (GET, SET PX/NX, INCR, DEL) sobre um socket por
+    thread. Funciona com Redis, Valkey, KeyDB ou qualquer servidor
+    compatível com o protocolo.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", timeout: float = 0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.file = sock, sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', str(self.db))
+
+    def _read_reply(self):
+        f = self._local.file
+        line = f.readline()
+        if not line:
+            raise ConnectionError("conexão fechada pelo servidor")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = f.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"resposta RESP inesperada: {line!r}")
+
+    def _call(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self._local.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def command(self, *args):
+        """Executa um comando, reconectando uma vez se o socket caiu."""
+        for attempt in (0, 1):
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+                return self._call(*args)
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = self._local.file = None
+
+    def get(self, key: str) -> bytes | None:
+        return self.command('GET', key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.command('SET', key, value, 'PX', int(ttl * 1000))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return self.command('SET', key, value, 'PX', int(ttl * 1000), 'NX') == 'OK'
+
+    def incr(self, key: str) -> int | None:
+        # INCR criaria a chave com 1; só incrementa se ela existir
+        if not self.command('EXISTS', key):
+            return None
+        return self.command('INCR', key)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.command('DEL', *keys)
+
+
+def build_backend(name: str = CACHE_BACKEND, url: str = CACHE_URL):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(url or DEFAULT_SQLITE_PATH)
+    if name == 'redis':
+        return RedisBackend(url or "redis://127.0.0.1:6379/0")
+    if name in ('', 'none', 'off'):
+        return None
+    raise ValueError(f"CACHE_BACKEND desconhecido: {name}")
+
+
+# --- CACHE POR USUÁRIO ---
+class UserCache:
+    """
+    Leituras por (usuário, escopo) com invalidação por versão.
+
+    `get_or_load(uid, 'categories', suffix, loader)` devolve o valor em cache
+    ou chama `loader()` e grava o resultado; `bump(uid, 'categories')` torna
+    obsoletas, em todos os processos, as entradas daquele escopo.
+    Sem backend (`CACHE_BACKEND` vazio) tudo vira chamada direta ao loader.
+    """
+
+    def __init__(self, backend=None, prefix: str = CACHE_PREFIX, default_ttl: float = CACHE_TTL_SECONDS,
+                 scope_ttls: dict | None = None):
+        self.backend = backend
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.scope_ttls = SCOPE_TTLS if scope_ttls is None else scope_ttls
+        self.hits = 0
+        self.misses = 0
+        self._error_logged = False
+        self._down_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _version_key(self, firebase_uid: str, scope: str) -> str:
+        return f"{self.prefix}:v:{scope}:{firebase_uid}"
+
+    def _backend_call(self, method: str, *args):
+        if self._down_until > time.monotonic():
+            return None
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            # Um aviso por processo; depois disso o erro só vira miss
+            if not self._error_logged:
+                print(f"Erro no backend de cache ({type(self.backend).__name__}.{method}): {e}")
+                self._error_logged = True
+            self._down_until = time.monotonic() + CACHE_RETRY_SECONDS
+            return None
+
+    def version(self, firebase_uid: str, scope: str) -> int | None:
+        """Versão atual do escopo do usuário, criada (a partir do relógio) se ainda não existir."""
+        key = self._version_key(firebase_uid, scope)
+        value = self._backend_call('get', key)
+        if value is None:
+            self._backend_call('add', key, str(time.time_ns() // 1_000_000).encode(), VERSION_TTL_SECONDS)
+            value = self._backend_call('get', key)
+        return int(value) if value is not None else None
+
+    def bump(self, firebase_uid: str, *scopes: str):
+        """Invalida os escopos do usuário em todos os processos que compartilham o backend."""
+        if not self.enabled:
+            return
+        for scope in scopes:
+            key = self._version_key(firebase_uid, scope)
+            if self._backend_call('incr', key) is None:
+                self._backend_call('add', key, str(time.time_ns() // 1_000_000).encode(), VERSION_TTL_SECONDS)
+
+    def get_or_load(self, firebase_uid: str, scope: str, suffix: str, loader, ttl: float | None = None):
+        if not self.enabled:
+            return loader()
+        version = self.version(firebase_uid, scope)
+        if version is None:
+            return loader()
+
+        key = f"{self.prefix}:{scope}:{firebase_uid}:{version}:{suffix}"
+        with span('cache.get', scope=scope, backend=type(self.backend).__name__) as s:
+            cached = self._backend_call('get', key)
+            s.set(hit=cached is not None)
+        if cached is not None:
+            self.hits += 1
+            return loads(cached)
+
+        self.misses += 1
+        value = loader()
+        try:
+            data = dumps(value)
+        except TypeError:
+            return value
+        self._backend_call('set', key, data, ttl or self.scope_ttls.get(scope, self.default_ttl))
+        return value
+
+    # Entradas sem versão (chat -> usuário, chave de API -> usuário)
+    def get_value(self, key: str):
+        if not self.enabled:
+            return None
+        cached = self._backend_call('get', f"{self.prefix}:{key}")
+        return loads(cached) if cached is not None else None
+
+    def set_value(self, key: str, value, ttl: float | None = None):
+        if self.enabled:
+            self._backend_call('set', f"{self.prefix}:{key}", dumps(value), ttl or self.scope_ttls.get('identity', self.default_ttl))
+
+    def delete_value(self, key: str):
+        if self.enabled:
+            self._backend_call('delete', f"{self.prefix}:{key}")
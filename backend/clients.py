@@ -0,0 +1,85 @@
+# backend/clients.py
+"""
+Construção preguiçosa dos clientes pesados (Firebase/Firestore).
+
+No Vercel cada cold start importa bot.py; importar `firebase_admin` e
+`google.cloud.firestore`, ler as credenciais e abrir o cliente gRPC no
+import fazia até o `/favicon.ico` pagar por isso. Aqui tudo é adiado para o
+primeiro uso de verdade, mantendo a mesma interface (`db.collection(...)`,
+`firestore.SERVER_TIMESTAMP`, `auth.get_user_by_email(...)`) para o resto
+do código.
+"""
+
+import importlib
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+_db = None
+
+
+def init_firebase():
+    """Inicializa o app padrão do Firebase (uma única vez por processo)."""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _lock:
+        if firebase_admin._apps:
+            return
+        firebase_creds_json_str = os.getenv("FIREBASE_CREDENTIALS_JSON")
+        if not firebase_creds_json_str:
+            cred = credentials.Certificate("firebase-credentials.json")
+        else:
+            firebase_creds_dict = json.loads(firebase_creds_json_str)
+            cred = credentials.Certificate(firebase_creds_dict)
+        firebase_admin.initialize_app(cred)
+
+
+def get_db():
+    """Devolve o cliente do Firestore, criando-o no primeiro uso."""
+    global _db
+    if _db is None:
+        init_firebase()
+        from firebase_admin import firestore as _firestore
+        with _lock:
+            if _db is None:
+                _db = _firestore.client()
+    return _db
+
+
+class LazyModule:
+    """Importa o módulo (e roda `before`, se houver) só no primeiro acesso a um atributo."""
+
+    def __init__(self, name: str, before=None):
+        self._name = name
+        self._before = before
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            if self._before:
+                self._before()
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+class LazyClient:
+    """Encaminha qualquer atributo para o objeto devolvido por `factory()`."""
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __getattr__(self, attr):
+        return getattr(self._factory(), attr)
+
+
+db = LazyClient(get_db)
+firestore = LazyModule('firebase_admin.firestore')
+auth = LazyModule('firebase_admin.auth', before=init_firebase)
+
+
+def FieldFilter(field_path: str, op_string: str, value):
+    """Mesmo construtor de `google.cloud.firestore_v1.base_query.FieldFilter`, importado sob demanda."""
+    from google.cloud.firestore_v1.base_query import FieldFilter as _FieldFilter
+    return _FieldFilter(field_path, op_string, value)
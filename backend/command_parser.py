@@ -0,0 +1,145 @@
+# backend/command_parser.py
+"""
+Gramática dos comandos de texto do bot, pré-compilada uma única vez no import.
+
+Tudo aqui é puro (sem Firestore nem Telegram), para que o roteamento de
+`handle_message` e a validação de categorias não paguem custo de compilação
+de regex ou normalização repetida a cada mensagem.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple
+
+# --- 1. PADRÕES PRÉ-COMPILADOS ---
+AMOUNT_PATTERN = re.compile(r"^\d+[\.,]?\d*$")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Verbos reconhecidos no início da mensagem. O '*' e o '+' são prefixos e
+# por isso são tratados à parte em `parse_command`.
+VERBS = frozenset({'?', 'ajuda', 'ver', 'guardar', 'sacar', 'pagar', 'transferir', 'buscar'})
+INCOME_WORD = 'renda'
+
+
+# --- 2. NORMALIZAÇÃO ---
+@lru_cache(maxsize=4096)
+def normalize_text(text: str) -> str:
+    """Remove acentos e converte para minúsculas (memoizado)."""
+    if not text: return ""
+    text = unicodedata.normalize('NFD', text)
+    text = text.encode('ascii', 'ignore')
+    text = text.decode("utf-8")
+    return text.lower()
+
+def tokenize(text: str) -> list[str]:
+    """Divide a mensagem em palavras, ignorando espaços repetidos."""
+    return text.split() if text else []
+
+def search_terms(text: str) -> list[str]:
+    """Termos de busca/indexação: palavras normalizadas com 2+ caracteres, sem repetição."""
+    return list(dict.fromkeys(w for w in WORD_PATTERN.findall(normalize_text(text or '')) if len(w) > 1))
+
+def parse_amount(value_str: str) -> float:
+    """Converte '12,50' ou '12.50' em float. Lança ValueError se inválido."""
+    return float(value_str.replace(',', '.'))
+
+
+# --- 3. COMANDO ---
+class ParsedCommand(NamedTuple):
+    verb: str | None
+    args: list[str]
+    text: str
+
+def parse_command(text: str) -> ParsedCommand:
+    """
+    Identifica o verbo de uma mensagem e separa os argumentos.
+
+    `verb` é um dos `VERBS`, '*' (transação rápida), '+' (renda) ou None,
+    que significa "despesa" (o último recurso do roteador).
+    """
+    text = text.strip()
+    if text.startswith('*'):
+        return ParsedCommand('*', tokenize(text[1:]), text)
+
+    parts = tokenize(text)
+    if not parts:
+        return ParsedCommand(None, [], text)
+
+    head = parts[0].lower()
+    if head.startswith('+'):
+        # Aceita tanto "+50 salário" quanto "+ 50 salário"
+        value = head[1:]
+        return ParsedCommand('+', ([value] if value else []) + parts[1:], text)
+    if head in VERBS:
+        return ParsedCommand(head, parts[1:], text)
+    return ParsedCommand(None, parts, text)
+
+def parse_quick_transaction(text: str) -> tuple[bool, list[str]]:
+    """
+    Separa uma transação rápida ('*...') em (é_renda, palavras sem o prefixo).
+    Aceita '*+ 50 salário', '*renda 50 salário' e '* 50 mercado'.
+    """
+    rest = text.strip()[1:].lstrip()
+    if rest.startswith('+'):
+        return True, tokenize(rest[1:])
+    if rest.lower().startswith(INCOME_WORD):
+        return True, tokenize(rest[len(INCOME_WORD):])
+    return False, tokenize(rest)
+
+def split_amount(words: list[str]) -> tuple[str, list[str]] | None:
+    """
+    Separa `<valor> <resto...>`. Devolve None se a primeira palavra não for
+    um valor ou se não houver nada depois dele.
+    """
+    if len(words) < 2 or not AMOUNT_PATTERN.match(words[0]):
+        return None
+    return words[0], words[1:]
+
+
+# --- 4. CATEGORIAS ---
+class CategoryIndex:
+    """
+    Trie de palavras normalizadas dos nomes de categoria.
+
+    `resolve` encontra a categoria mais longa no início de uma lista de
+    palavras numa única varredura da esquerda para a direita, e o que sobra
+    vira a descrição. Assim "Contas de Casa" vence "Contas" quando ambas
+    existem, sem testar todos os prefixos possíveis.
+    """
+    _NAME = object()
+
+    def __init__(self, names):
+        self.names = [name.strip() for name in names]
+        self.root = {}
+        for name in self.names:
+            node = self.root
+            for word in normalize_text(name).split():
+                node = node.setdefault(word, {})
+            node.setdefault(self._NAME, name)
+
+    def __bool__(self):
+        return bool(self.names)
+
+    def get(self, name: str) -> str | None:
+        """Busca exata (ignorando acentos e caixa)."""
+        found, consumed = self.match_prefix(name.split())
+        return found if consumed == len(name.split()) else None
+
+    def match_prefix(self, words: list[str]) -> tuple[str | None, int]:
+        """Devolve (nome original, nº de palavras consumidas) ou (None, 0)."""
+        node, found, consumed = self.root, None, 0
+        for i, word in enumerate(words):
+            node = node.get(normalize_text(word))
+            if node is None:
+                break
+            if self._NAME in node:
+                found, consumed = node[self._NAME], i + 1
+        return found, consumed
+
+    def resolve(self, words: list[str]) -> tuple[str | None, str | None]:
+        """Devolve (categoria, descrição restante ou None)."""
+        found, consumed = self.match_prefix(words)
+        if found is None:
+            return None, None
+        return found, " ".join(words[consumed:]).strip() or None
@@ -0,0 +1,135 @@
+# backend/data_versions.py
+"""
+Versão dos dados de cada usuário e cache dos relatórios do bot.
+
+`data_versions/{uid}` guarda um contador `version` que toda escrita nos
+dados do usuário incrementa: o LedgerWriter (no mesmo lote, via hook), os
+crons que criam contas a pagar ou corrigem saldos e o dashboard
+(src/utils/dataVersion.js), que é quem escreve categorias e orçamentos.
+
+`ReportCache` guarda o texto pronto de consultas como `ver orçamentos` sob
+(usuário, comando, argumentos, versão, dia). Enquanto nada muda, repetir a
+consulta custa uma leitura (o contador) em vez de todas as consultas do
+relatório. O dia entra na chave porque os relatórios dependem da data
+(dias restantes no mês, gastos de hoje).
+
+Durante `render()`, `render_version()` devolve a versão da chave do
+relatório. As leituras do relatório que passam pelo cache por usuário
+(`fetch_user_docs` em bot.py) a incluem na chave: aquele cache só é
+invalidado pelas escritas do backend, e sem isso um relatório montado
+com dados de antes de uma edição no dashboard ficaria guardado sob a
+versão nova. As rotas com ETag (ver http_cache.py) usam o mesmo
+`rendering(version)`, com a versão do ETag.
+
+`get_recent` aceita uma versão lida há até `DATA_VERSION_MAX_AGE_SECONDS`
+(usada pelos ETags da API, ver http_cache.py). As escritas feitas por este
+processo a descartam na hora.
+"""
+
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+from cachetools import TTLCache
+from clients import firestore
+from tracing import span
+
+VERSIONS_COLLECTION = 'data_versions'
+REPORT_CACHE_TTL_SECONDS = float(os.getenv("REPORT_CACHE_TTL_SECONDS", "3600"))
+DATA_VERSION_MAX_AGE_SECONDS = float(os.getenv("DATA_VERSION_MAX_AGE_SECONDS", "5"))
+
+_render_version = contextvars.ContextVar('render_version', default=None)
+
+
+def render_version() -> int | None:
+    """A versão do relatório sendo montado por `ReportCache.get_or_render`, se houver."""
+    return _render_version.get()
+
+
+@contextmanager
+def rendering(version: int):
+    """Marca o trecho como a montagem de uma resposta guardada sob `version`."""
+    token = _render_version.set(version)
+    try:
+        yield
+    finally:
+        _render_version.reset(token)
+
+
+class DataVersions:
+    """Leitura e incremento do contador de versão por usuário."""
+
+    def __init__(self, db, max_age: float = DATA_VERSION_MAX_AGE_SECONDS):
+        self.db = db
+        self._recent = TTLCache(maxsize=4096, ttl=max_age)
+        self._lock = threading.Lock()
+
+    def _ref(self, firebase_uid: str):
+        return self.db.collection(VERSIONS_COLLECTION).document(firebase_uid)
+
+    def _bump_data(self, firebase_uid: str) -> dict:
+        return {'userId': firebase_uid, 'version': firestore.firestore.Increment(1)}
+
+    def ledger_hook(self, batch, firebase_uid: str, entries: list, transaction_ids: list[str]):
+        self.add_bump(batch, firebase_uid)
+
+    def add_bump(self, batch, firebase_uid: str):
+        """Incremento dentro de um lote, atômico com as outras escritas."""
+        batch.set(self._ref(firebase_uid), self._bump_data(firebase_uid), merge=True)
+
+    def ledger_listener(self, firebase_uid: str, entries: list, result, changed: set):
+        self.forget(firebase_uid)
+
+    def bump(self, firebase_uid: str):
+        with span('firestore.set', collection=VERSIONS_COLLECTION):
+            self._ref(firebase_uid).set(self._bump_data(firebase_uid), merge=True)
+        self.forget(firebase_uid)
+
+    def forget(self, firebase_uid: str):
+        with self._lock:
+            self._recent.pop(firebase_uid, None)
+
+    def get(self, firebase_uid: str) -> int:
+        with span('firestore.get', collection=VERSIONS_COLLECTION):
+            doc = self._ref(firebase_uid).get()
+        version = int((doc.to_dict() or {}).get('version', 0)) if doc.exists else 0
+        with self._lock:
+            self._recent[firebase_uid] = version
+        return version
+
+    def get_recent(self, firebase_uid: str) -> int:
+        """Como `get`, mas aceita o valor lido há pouco (sem ir ao Firestore)."""
+        with self._lock:
+            version = self._recent.get(firebase_uid)
+        return version if version is not None else self.get(firebase_uid)
+
+
+class ReportCache:
+    """
+    Relatórios prontos (texto e parse_mode) por versão dos dados.
+
+    `cache` é um `UserCache` (cache.py): o backend compartilhado quando
+    configurado, ou um em memória.
+    """
+
+    def __init__(self, versions: DataVersions, cache, ttl: float = REPORT_CACHE_TTL_SECONDS):
+        self.versions = versions
+        self.cache = cache
+        self.ttl = ttl
+
+    def get_or_render(self, firebase_uid: str, command: str, args: list, render, today: date) -> tuple[str, str | None]:
+        """Devolve (texto, parse_mode) do cache ou chama `render()` e guarda o resultado."""
+        version = self.versions.get(firebase_uid)
+        key = f"report:{firebase_uid}:{command}:{' '.join(str(a) for a in args)}:{version}:{today.isoformat()}"
+        cached = self.cache.get_value(key)
+        if cached is not None:
+            self.cache.hits += 1
+            return tuple(cached)
+
+        self.cache.misses += 1
+        with rendering(version):
+            text, parse_mode = render()
+        self.cache.set_value(key, [text, parse_mode], self.ttl)
+        return text, parse_mode
@@ -0,0 +1,164 @@
+# backend/digests.py
+"""
+Resumos periódicos (semanal e mensal) de gastos.
+
+O cron calcula o resumo de todos os usuários de uma vez, em blocos
+processados em paralelo. Para cada usuário são três leituras: uma única
+varredura por intervalo nas transações (cobrindo o período e o mês corrente,
+para comparar com os orçamentos), os orçamentos do mês e as metas.
+
+O resultado fica em `digests/{firebase_uid}`, com o texto já formatado, para
+que `ver resumo` responda com uma única leitura de documento.
+"""
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from clients import FieldFilter, firestore
+from tracing import span
+
+DIGESTS_COLLECTION = 'digests'
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "8"))
+DIGEST_CHUNK_SIZE = int(os.getenv("DIGEST_CHUNK_SIZE", "50"))
+DIGEST_TOP_CATEGORIES = 5
+
+PERIOD_LABELS = {'weekly': 'semanal', 'monthly': 'mensal'}
+
+
+def period_bounds(period: str, now: datetime) -> tuple[datetime, datetime]:
+    """
+    Intervalo [início, fim) do período fechado mais recente:
+    a semana (segunda a domingo) ou o mês anterior a `now`.
+    """
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'weekly':
+        end = today - timedelta(days=today.weekday())
+        return end - timedelta(days=7), end
+    if period == 'monthly':
+        end = today.replace(day=1)
+        return (end - timedelta(days=1)).replace(day=1), end
+    raise ValueError(f"Período desconhecido: {period}")
+
+
+def compute_digest(db, firebase_uid: str, period: str, now: datetime) -> dict:
+    """Calcula o resumo de um usuário para o período fechado mais recente."""
+    start, end = period_bounds(period, now)
+    # Os orçamentos são mensais: compara com o gasto do mês até o fim do período
+    last_day = end - timedelta(microseconds=1)
+    month_start = last_day.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    scan_start = min(start, month_start)
+
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('userId', '==', firebase_uid))
+         .where(filter=FieldFilter('createdAt', '>=', scan_start))
+         .where(filter=FieldFilter('createdAt', '<', end)))
+    with span('firestore.query', collection='transactions', range=period):
+        transactions = [doc.to_dict() for doc in q.stream()]
+
+    totals = {'income': 0.0, 'expense': 0.0}
+    by_category = {}
+    month_spent = {}
+    for t in transactions:
+        amount = t.get('amount', 0)
+        created_at = t.get('createdAt')
+        category = t.get('category') or 'Outros'
+        if t.get('type') == 'expense' and created_at and created_at >= month_start:
+            month_spent[category] = month_spent.get(category, 0) + amount
+        if not created_at or created_at < start or t.get('type') not in totals:
+            continue
+        totals[t['type']] += amount
+        if t['type'] == 'expense':
+            by_category[category] = by_category.get(category, 0) + amount
+
+    budgets_q = (db.collection('budgets')
+                 .where(filter=FieldFilter('userId', '==', firebase_uid))
+                 .where(filter=FieldFilter('month', '==', last_day.month))
+                 .where(filter=FieldFilter('year', '==', last_day.year)))
+    with span('firestore.query', collection='budgets', filters=['month', 'year']):
+        budgets = [doc.to_dict() for doc in budgets_q.stream()]
+    over_budget = []
+    for budget in budgets:
+        spent = month_spent.get(budget.get('categoryName'), 0)
+        if budget.get('amount', 0) > 0 and spent > budget['amount']:
+            over_budget.append({'category': budget['categoryName'], 'budget': budget['amount'], 'spent': spent})
+
+    with span('firestore.query', collection='goals'):
+        goals = [doc.to_dict() for doc in db.collection('goals').where(filter=FieldFilter('userId', '==', firebase_uid)).stream()]
+
+    top = sorted(by_category.items(), key=lambda item: item[1], reverse=True)[:DIGEST_TOP_CATEGORIES]
+    digest = {
+        'userId': firebase_uid,
+        'period': period,
+        'periodStart': start,
+        'periodEnd': end,
+        'income': totals['income'],
+        'expense': totals['expense'],
+        'topCategories': [{'category': c, 'amount': a} for c, a in top],
+        'overBudget': over_budget,
+        'budgetMonth': {'month': last_day.month, 'year': last_day.year},
+        'goals': [{'goalName': g.get('goalName'), 'savedAmount': g.get('savedAmount', 0), 'targetAmount': g.get('targetAmount', 0)} for g in goals],
+    }
+    digest['text'] = format_digest(digest)
+    return digest
+
+
+def format_digest(digest: dict) -> str:
+    start, end = digest['periodStart'], digest['periodEnd'] - timedelta(days=1)
+    label = PERIOD_LABELS.get(digest['period'], digest['period'])
+    lines = [f"📊 *Resumo {label}* ({start.strftime('%d/%m')} a {end.strftime('%d/%m')})\n",
+             f"Entradas: R$ {digest['income']:.2f}",
+             f"Saídas: R$ {digest['expense']:.2f}",
+             f"Saldo do período: R$ {digest['income'] - digest['expense']:.2f}"]
+
+    if digest['topCategories']:
+        lines.append("\n*Maiores gastos:*")
+        for i, item in enumerate(digest['topCategories'], 1):
+            lines.append(f"{i}. {item['category'].capitalize()}: R$ {item['amount']:.2f}")
+
+    if digest['overBudget']:
+        lines.append("\n*🚨 Orçamentos estourados no mês:*")
+        for item in digest['overBudget']:
+            lines.append(f"- {item['category'].capitalize()}: R$ {item['spent']:.2f} de R$ {item['budget']:.2f}")
+
+    goals = [g for g in digest['goals'] if g['targetAmount']]
+    if goals:
+        lines.append("\n*🎯 Metas:*")
+        for goal in goals:
+            progress = goal['savedAmount'] / goal['targetAmount'] * 100
+            lines.append(f"- {goal['goalName']}: {progress:.0f}% (R$ {goal['savedAmount']:.2f} de R$ {goal['targetAmount']:.2f})")
+    return "\n".join(lines)
+
+
+def build_digests(db, firebase_uids: list[str], period: str, now: datetime | None = None) -> dict[str, dict]:
+    """
+    Calcula e grava os resumos de todos os usuários, em blocos de
+    DIGEST_CHUNK_SIZE processados por DIGEST_WORKERS threads. Cada bloco é
+    gravado num único lote. Devolve firebase_uid -> resumo.
+    """
+    now = now or datetime.now(timezone.utc)
+    digests = {}
+
+    def compute(firebase_uid):
+        try:
+            return firebase_uid, compute_digest(db, firebase_uid, period, now)
+        except Exception as e:
+            print(f"Erro ao calcular o resumo do usuário {firebase_uid}: {e}")
+            return firebase_uid, None
+
+    with ThreadPoolExecutor(max_workers=DIGEST_WORKERS) as executor:
+        for i in range(0, len(firebase_uids), DIGEST_CHUNK_SIZE):
+            chunk = firebase_uids[i:i + DIGEST_CHUNK_SIZE]
+            # copy_context: os spans das threads continuam no trace do cron
+            futures = [executor.submit(contextvars.copy_context().run, compute, uid) for uid in chunk]
+            batch = db.batch()
+            for future in futures:
+                firebase_uid, digest = future.result()
+                if digest is None:
+                    continue
+                digests[firebase_uid] = digest
+                batch.set(db.collection(DIGESTS_COLLECTION).document(firebase_uid), {**digest, 'createdAt': firestore.SERVER_TIMESTAMP})
+            with span('firestore.commit', collection=DIGESTS_COLLECTION, writes=len(chunk)):
+                batch.commit()
+    return digests
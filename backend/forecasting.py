@@ -0,0 +1,170 @@
+# backend/forecasting.py
+"""
+Previsão vetorizada do gasto de fim de mês, por usuário e categoria.
+
+Rodada pelo cron diário: UMA varredura por intervalo em `transactions`
+(do início do mês de 3 meses atrás até agora, só com os campos usados)
+vira colunas NumPy, e a partir daí nada é feito transação a transação:
+
+1. `np.unique` fatora as séries (usuário, categoria) e `np.bincount`
+   monta a matriz de gasto diário [séries x dias];
+2. os modelos são calculados para todas as séries de uma vez:
+   - ritmo (burn rate): gasto do mês / dias decorridos * dias do mês;
+   - média móvel ponderada dos últimos 28 dias (pesos lineares, os dias
+     mais recentes valem mais), projetada sobre os dias restantes;
+   - média mensal dos 3 meses anteriores (a mesma que o ForecastPage usa);
+3. a projeção final mistura ritmo e média móvel pela fração do mês já
+   decorrida: no começo do mês vale a média móvel, no fim o ritmo.
+
+O resultado vai em lote (BulkWriter) para `forecasts/{uid}_{ano}_{mês}_auto`,
+no mesmo formato dos documentos salvos pelo dashboard, mais os detalhes
+por categoria em `categories`.
+"""
+
+import calendar
+from datetime import datetime, timezone
+
+import numpy as np
+
+from clients import FieldFilter, firestore
+from tracing import span
+
+FORECASTS_COLLECTION = 'forecasts'
+HISTORY_MONTHS = 3
+WMA_DAYS = 28
+_SEP = '\x1f'
+
+
+def forecast_doc_id(firebase_uid: str, when: datetime) -> str:
+    return f"{firebase_uid}_{when.year}_{when.month:02d}_auto"
+
+
+def _months_before(month_start: datetime, months: int) -> datetime:
+    year, month = month_start.year, month_start.month - months
+    while month < 1:
+        year, month = year - 1, month + 12
+    return month_start.replace(year=year, month=month)
+
+
+def load_columns(db, since: datetime):
+    """Lê as transações a partir de `since` e devolve colunas NumPy."""
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('createdAt', '>=', since))
+         .select(['userId', 'type', 'category', 'amount', 'createdAt']))
+    with span('firestore.query', collection='transactions', range='forecast_history'):
+        rows = [(d.get('userId') or '', d.get('type') or '', d.get('category') or 'Outros',
+                 d.get('amount') or 0, d.get('createdAt'))
+                for d in (doc.to_dict() for doc in q.stream()) if d.get('createdAt')]
+    if not rows:
+        return None
+    users, types, categories, amounts, created = zip(*rows)
+    seconds = np.array([c.timestamp() for c in created]) - since.timestamp()
+    return {
+        'user': np.array(users),
+        'type': np.array(types),
+        'category': np.array(categories),
+        'amount': np.array(amounts, dtype=float),
+        'day': (seconds // 86400).astype(np.int64),
+    }
+
+
+def project(daily: np.ndarray, month_offset: int, elapsed: int, days_in_month: int) -> dict:
+    """
+    Aplica os modelos a todas as séries. `daily` é [séries x dias] desde o
+    início do histórico; `month_offset` é o índice do dia 1º do mês atual e
+    `elapsed` quantos dias completos do mês já passaram.
+    """
+    today = month_offset + elapsed
+    spent = daily[:, month_offset:].sum(axis=1)
+
+    burn = spent / elapsed * days_in_month if elapsed else spent
+
+    window = daily[:, max(0, today - WMA_DAYS):today]
+    weights = np.arange(1, window.shape[1] + 1, dtype=float)
+    wma_daily = window @ weights / weights.sum() if weights.size else np.zeros(len(daily))
+    wma = spent + wma_daily * (days_in_month - elapsed)
+
+    history = daily[:, :month_offset].sum(axis=1) / HISTORY_MONTHS
+
+    w = elapsed / days_in_month
+    projected = np.maximum(spent, w * burn + (1 - w) * wma)
+    return {'spent': spent, 'burn': burn, 'wma': wma, 'history': history, 'projected': projected}
+
+
+def run_forecasts(db, now: datetime | None = None) -> int:
+    """Calcula e grava as previsões do mês atual para todos os usuários. Devolve quantos."""
+    now = now or datetime.now(timezone.utc)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    since = _months_before(month_start, HISTORY_MONTHS)
+    days_in_month = calendar.monthrange(now.year, now.month)[1]
+    month_offset = (month_start - since).days
+    elapsed = (now - month_start).days
+    n_days = month_offset + days_in_month
+
+    columns = load_columns(db, since)
+    if columns is None:
+        return 0
+
+    with span('forecast.compute', transactions=len(columns['amount'])):
+        in_range = (columns['day'] >= 0) & (columns['day'] < n_days)
+        expense = in_range & (columns['type'] == 'expense')
+        income_now = in_range & (columns['type'] == 'income') & (columns['day'] >= month_offset)
+
+        # Séries (usuário, categoria) de despesa -> matriz de gasto diário
+        keys = np.char.add(np.char.add(columns['user'][expense], _SEP), columns['category'][expense])
+        series, series_idx = np.unique(keys, return_inverse=True)
+        flat = series_idx * n_days + columns['day'][expense]
+        daily = np.bincount(flat, weights=columns['amount'][expense], minlength=len(series) * n_days).reshape(len(series), n_days)
+        models = project(daily, month_offset, elapsed, days_in_month)
+
+        users, user_idx = np.unique(columns['user'][income_now], return_inverse=True)
+        income = dict(zip(users.tolist(), np.bincount(user_idx, weights=columns['amount'][income_now]).tolist()))
+
+    by_user = {}
+    for i, key in enumerate(series.tolist()):
+        firebase_uid, category = key.split(_SEP, 1)
+        if firebase_uid:
+            by_user.setdefault(firebase_uid, []).append((category, i))
+
+    writer = db.bulk_writer()
+    with span('firestore.bulk_write', collection=FORECASTS_COLLECTION, writes=len(by_user)):
+        for firebase_uid, items in by_user.items():
+            categories = sorted(
+                ({'category': category, 'spentToDate': round(float(models['spent'][i]), 2),
+                  'burnRate': round(float(models['burn'][i]), 2), 'weightedAverage': round(float(models['wma'][i]), 2),
+                  'historicalAverage': round(float(models['history'][i]), 2), 'projected': round(float(models['projected'][i]), 2)}
+                 for category, i in items),
+                key=lambda c: c['projected'], reverse=True)
+            total_income = round(income.get(firebase_uid, 0.0), 2)
+            total_expense = round(sum(c['projected'] for c in categories), 2)
+            writer.set(db.collection(FORECASTS_COLLECTION).document(forecast_doc_id(firebase_uid, month_start)), {
+                'userId': firebase_uid,
+                'forecastMonth': month_start,
+                'source': 'backend',
+                'predictedIncomes': [{'description': 'Rendas recebidas no mês', 'amount': total_income}] if total_income else [],
+                'predictedExpenses': [{'description': c['category'], 'amount': c['projected'], 'type': 'Projeção'} for c in categories if c['projected'] > 0],
+                'totalIncome': total_income,
+                'totalExpense': total_expense,
+                'predictedBalance': round(total_income - total_expense, 2),
+                'spentToDate': round(sum(c['spentToDate'] for c in categories), 2),
+                'categories': categories,
+                'createdAt': firestore.SERVER_TIMESTAMP,
+            })
+        writer.close()
+    return len(by_user)
+
+
+def format_forecast(forecast: dict, now: datetime) -> str:
+    days_left = calendar.monthrange(now.year, now.month)[1] - now.day
+    lines = [f"🔮 *Previsão para o fim do mês* ({days_left} dia(s) restantes)\n",
+             f"Gasto até agora: R$ {forecast.get('spentToDate', 0):.2f}",
+             f"Gasto previsto: R$ {forecast.get('totalExpense', 0):.2f}",
+             f"Rendas no mês: R$ {forecast.get('totalIncome', 0):.2f}",
+             f"Saldo previsto: R$ {forecast.get('predictedBalance', 0):.2f}"]
+    categories = forecast.get('categories', [])
+    if categories:
+        lines.append("\n*Por categoria (previsto / média dos últimos meses):*")
+        for c in categories[:8]:
+            marker = " ⚠️" if c['historicalAverage'] and c['projected'] > c['historicalAverage'] * 1.2 else ""
+            lines.append(f"- {c['category'].capitalize()}: R$ {c['projected']:.2f} / R$ {c['historicalAverage']:.2f}{marker}")
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+# backend/http_cache.py
+"""
+Cache HTTP e compressão para as rotas de leitura da API.
+
+`HTTPCache.cached(...)` decora uma rota que recebe o `uid` (depois de
+`require_api_key`) e:
+
+1. calcula um ETag forte a partir de (rota, parâmetros, usuário, versão dos
+   dados, dia), com a versão de `data_versions` (ver data_versions.py);
+2. se o cliente mandou o mesmo ETag em `If-None-Match`, responde 304 sem
+   executar a rota, ou seja, sem nenhuma consulta do relatório;
+3. senão executa a rota e, nas respostas 200, adiciona `ETag`,
+   `Cache-Control` e comprime o corpo com brotli (se o pacote estiver
+   instalado e o cliente aceitar) ou gzip, acima de `HTTP_COMPRESS_MIN_BYTES`.
+
+A versão é lida com `DataVersions.get_recent`, que guarda o valor por
+`DATA_VERSION_MAX_AGE_SECONDS` em memória. Um 304 pode, portanto, atrasar
+em até esse tempo uma escrita feita por outro processo ou pelo dashboard.
+
+A rota roda dentro de `rendering(versão do ETag)`: as leituras pelo cache
+por usuário (`fetch_user_docs`) ficam sob essa versão, e um corpo lido de
+antes de uma edição no dashboard não sai com o ETag novo.
+
+O `Cache-Control` é definido por rota no decorador e pode ser sobrescrito
+por `HTTP_CACHE_POLICIES`, um JSON {"/api/rota": "private, max-age=30"}.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from data_versions import rendering
+from flask import make_response, request
+
+try:
+    import brotli
+except ImportError:  # opcional: sem o pacote, só gzip
+    brotli = None
+
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_CACHE_POLICIES = json.loads(os.getenv("HTTP_CACHE_POLICIES", "{}"))
+# Sufixo do ETag por codificação: cada representação tem o seu ETag forte
+ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+
+def _accepted_encodings() -> set[str]:
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding() -> str | None:
+    accepted = _accepted_encodings()
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _strip_suffix(tag: str) -> str:
+    for suffix in ENCODING_SUFFIXES.values():
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def matching_etag(if_none_match: str, etag: str) -> str | None:
+    """
+    O ETag de `If-None-Match` que corresponde a `etag`, ignorando o sufixo
+    de codificação (o conteúdo é o mesmo), ou None.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+    return next((tag for tag in tags if _strip_suffix(tag) == etag), None)
+
+
+class HTTPCache:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def etag(self, uid: str, version: int) -> str:
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        day = datetime.now(timezone.utc).date().isoformat()
+        digest = hashlib.sha256(f"{request.path}?{params}|{uid}|{version}|{day}".encode()).hexdigest()[:32]
+        return f'"{digest}"'
+
+    def cached(self, cache_control: str = "private, no-cache"):
+        """
+        Decorador das rotas de leitura. `cache_control` é a política padrão
+        da rota (`no-cache` = o cliente guarda, mas revalida com o ETag).
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(uid, *args, **kwargs):
+                policy = HTTP_CACHE_POLICIES.get(request.path, cache_control)
+                version = self.versions.get_recent(uid)
+                etag = self.etag(uid, version)
+                matched = matching_etag(request.headers.get('If-None-Match', ''), etag)
+                if matched:
+                    response = make_response('', 304)
+                    response.headers['ETag'] = matched
+                    response.headers['Cache-Control'] = policy
+                    response.headers['Vary'] = 'Accept-Encoding'
+                    return response
+
+                with rendering(version):
+                    response = make_response(f(uid, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.headers['Cache-Control'] = policy
+                response.headers['Vary'] = 'Accept-Encoding'
+
+                encoding = choose_encoding()
+                body = response.get_data()
+                if encoding and len(body) >= HTTP_COMPRESS_MIN_BYTES:
+                    response.set_data(compress(body, encoding))
+                    response.headers['Content-Encoding'] = encoding
+                    etag = etag[:-1] + ENCODING_SUFFIXES[encoding] + '"'
+                response.headers['ETag'] = etag
+                return response
+            return decorated_function
+        return decorator
@@ -0,0 +1,297 @@
+# backend/jobs.py
+"""
+Coordenação dos crons por lease (arrendamento com prazo).
+
+Retentativas do Vercel, disparos manuais e execuções longas podiam pôr dois
+`/api/cron` ou `/api/monthly-closing` varrendo todos os usuários ao mesmo
+tempo: leituras em dobro e contas a pagar ou lançamentos de fecho
+duplicados. Aqui cada execução agendada (`run_key`, ex. o dia ou o mês) é
+dividida em unidades: os shards de usuários (`shard_of`) e, se preciso,
+uma unidade `global`. Cada unidade tem um documento de lease
+`job_leases/{job}_{run_key}_{unidade}`:
+
+- quem pega o lease (`owner`, `token`) processa a unidade; os outros
+  pulam para a próxima;
+- uma thread renova o lease (heartbeat) a cada `JOB_HEARTBEAT_SECONDS`,
+  gravando junto o cursor de progresso (o último usuário processado);
+- se o dono some (timeout da função, deploy), o lease vence depois de
+  `JOB_LEASE_SECONDS` e a próxima invocação assume a unidade a partir do
+  cursor;
+- ao terminar, o lease fica `done` e nenhuma outra invocação com o mesmo
+  `run_key` processa a unidade de novo.
+
+Um worker que perde o lease (renovação recusada: outro assumiu) para no
+próximo `checkpoint`. O `token` muda a cada aquisição, então uma
+renovação atrasada do dono antigo nunca vale para o novo.
+
+A troca de estado é sempre um ler-modificar-gravar atômico:
+`FirestoreLeaseStore` usa uma transação do Firestore; `FileLeaseStore`
+(`JOB_LEASE_BACKEND=file`) usa um arquivo JSON por lease sob `flock`, para
+testes e para o soak local (tools/soak.py), sem Firestore.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from cache import dumps, loads
+from clients import firestore
+from tracing import span
+
+JOB_LEASES_COLLECTION = 'job_leases'
+JOB_LEASE_BACKEND = os.getenv("JOB_LEASE_BACKEND", "firestore").lower()
+JOB_LEASE_DIR = os.getenv("JOB_LEASE_DIR", os.path.join(tempfile.gettempdir(), "oikonomos-job-leases"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_SHARDS = int(os.getenv("JOB_SHARDS", "4"))
+
+
+class LeaseLost(Exception):
+    """Outro worker assumiu a unidade; este deve parar."""
+
+
+def shard_of(firebase_uid: str, shards: int) -> int:
+    """Shard estável do usuário (não depende do processo, ao contrário de hash())."""
+    return int(hashlib.sha256(firebase_uid.encode()).hexdigest()[:8], 16) % shards
+
+
+# --- ARMAZENAMENTO ---
+class FirestoreLeaseStore:
+    def __init__(self, db):
+        self.db = db
+
+    def update(self, key: str, change) -> dict | None:
+        """
+        Aplica `change(estado atual ou None)` numa transação. Se `change`
+        devolve um estado, ele é gravado e devolvido; None não grava nada.
+        """
+        ref = self.db.collection(JOB_LEASES_COLLECTION).document(key)
+
+        @firestore.firestore.transactional
+        def run(transaction):
+            snapshot = ref.get(transaction=transaction)
+            state = change(snapshot.to_dict() if snapshot.exists else None)
+            if state is not None:
+                transaction.set(ref, state)
+            return state
+
+        with span('firestore.transaction', collection=JOB_LEASES_COLLECTION):
+            return run(self.db.transaction())
+
+
+class FileLeaseStore:
+    """Um arquivo JSON por lease, com a troca de estado sob `flock` exclusivo."""
+
+    def __init__(self, directory: str = JOB_LEASE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def update(self, key: str, change) -> dict | None:
+        import fcntl
+
+        path = os.path.join(self.directory, key.replace('/', '_') + '.json')
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path, 'rb') as f:
+                    current = loads(f.read())
+            except FileNotFoundError:
+                current = None
+            state = change(current)
+            if state is not None:
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(dumps(state))
+                os.replace(path + '.tmp', path)
+            return state
+
+
+def build_lease_store(db, backend: str = JOB_LEASE_BACKEND, directory: str = JOB_LEASE_DIR):
+    if backend == 'file':
+        return FileLeaseStore(directory)
+    if backend == 'firestore':
+        return FirestoreLeaseStore(db)
+    raise ValueError(f"JOB_LEASE_BACKEND desconhecido: {backend}")
+
+
+# --- LEASE ---
+class Lease:
+    """Lease de uma unidade, mantido por este worker até `complete` ou `release`."""
+
+    def __init__(self, store, key: str, owner: str, state: dict, ttl: float):
+        self.store = store
+        self.key = key
+        self.owner = owner
+        self.token = state['token']
+        self.cursor = state.get('cursor')
+        self.takeover = state.get('takeovers', 0) > 0
+        self.ttl = ttl
+        self.lost = False
+        self._lock = threading.Lock()
+
+    def _owned(self, state: dict | None) -> bool:
+        return bool(state) and state.get('owner') == self.owner and state.get('token') == self.token and state.get('status') == 'running'
+
+    def _write(self, **changes) -> bool:
+        def change(state):
+            if not self._owned(state):
+                return None
+            return {**state, **changes, 'cursor': self.cursor, 'heartbeatAt': datetime.now(timezone.utc)}
+
+        with self._lock:
+            if self.lost:
+                return False
+            if self.store.update(self.key, change) is None:
+                self.lost = True
+        return not self.lost
+
+    def renew(self) -> bool:
+        """Estende o prazo e grava o cursor atual. False se o lease foi perdido."""
+        return self._write(expiresAt=datetime.now(timezone.utc) + timedelta(seconds=self.ttl))
+
+    def checkpoint(self, cursor: str, durable: bool = False):
+        """
+        Registra o progresso. Com `durable`, grava já (para passos que não
+        podem ser repetidos); senão vai no próximo heartbeat.
+        """
+        self.cursor = cursor
+        if self.lost or (durable and not self.renew()):
+            raise LeaseLost(self.key)
+
+    def complete(self, result: dict) -> bool:
+        now = datetime.now(timezone.utc)
+        return self._write(status='done', result=result, completedAt=now, expiresAt=now)
+
+    def release(self, error: str) -> bool:
+        """Libera a unidade (sem concluí-la) para a próxima invocação assumir na hora."""
+        return self._write(error=error, expiresAt=datetime.now(timezone.utc))
+
+
+@dataclass
+class JobReport:
+    done: list[str] = field(default_factory=list)       # concluídas nesta invocação
+    finished: list[str] = field(default_factory=list)   # já concluídas antes
+    busy: list[str] = field(default_factory=list)       # com lease válido de outro worker
+    failed: list[str] = field(default_factory=list)     # erro ou lease perdido
+    results: dict[str, dict] = field(default_factory=dict)
+
+    def total(self, name: str) -> int:
+        return sum(result.get(name, 0) for result in self.results.values())
+
+    def summary(self) -> str:
+        return (f"unidades: {len(self.done)} processada(s), {len(self.finished)} já concluída(s), "
+                f"{len(self.busy)} com outro worker, {len(self.failed)} com falha")
+
+
+# --- COORDENADOR ---
+class JobCoordinator:
+    def __init__(self, store, lease_seconds: float = JOB_LEASE_SECONDS,
+                 heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+
+    def acquire(self, job: str, run_key: str, unit: str, owner: str) -> tuple[Lease | None, str]:
+        """Tenta pegar o lease da unidade. Devolve (lease, 'acquired'|'finished'|'busy')."""
+        key = f"{job}_{run_key}_{unit}"
+        outcome = ['acquired']
+
+        def change(state):
+            now = datetime.now(timezone.utc)
+            if state and state.get('status') == 'done':
+                outcome[0] = 'finished'
+                return None
+            if state and state.get('owner') != owner and state.get('expiresAt') and state['expiresAt'] > now:
+                outcome[0] = 'busy'
+                return None
+            new = dict(state or {'job': job, 'runKey': run_key, 'unit': unit, 'cursor': None,
+                                 'startedAt': now, 'token': 0, 'takeovers': 0})
+            if state:
+                new['takeovers'] = state.get('takeovers', 0) + 1
+            new.update(status='running', owner=owner, token=new.get('token', 0) + 1,
+                       expiresAt=now + timedelta(seconds=self.lease_seconds), heartbeatAt=now)
+            return new
+
+        state = self.store.update(key, change)
+        if state is None:
+            return None, outcome[0]
+        if state['takeovers']:
+            print(f"Lease {key} assumido por {owner} (cursor: {state.get('cursor')})")
+        return Lease(self.store, key, owner, state, self.lease_seconds), 'acquired'
+
+    def _heartbeat(self, lease: Lease, stop: threading.Event):
+        while not stop.wait(self.heartbeat_seconds):
+            try:
+                if not lease.renew():
+                    print(f"Lease {lease.key} perdido por {lease.owner}")
+                    return
+            except Exception as e:
+                # Uma falha isolada não derruba o worker: o prazo ainda cobre a próxima tentativa
+                print(f"Erro ao renovar o lease {lease.key}: {e}")
+
+    def run(self, job: str, run_key: str, units: list[str], process) -> JobReport:
+        """
+        Processa as unidades livres com `process(unit, lease) -> dict`,
+        pulando as concluídas e as que estão com outro worker.
+        """
+        owner = uuid.uuid4().hex[:12]
+        report = JobReport()
+        for unit in units:
+            lease, outcome = self.acquire(job, run_key, unit, owner)
+            if lease is None:
+                getattr(report, outcome).append(unit)
+                continue
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(lease, stop), daemon=True)
+            heartbeat.start()
+            try:
+                with span('job.unit', job=job, unit=unit, takeover=lease.takeover):
+                    result = process(unit, lease)
+                if lease.complete(result):
+                    report.done.append(unit)
+                    report.results[unit] = result
+                else:
+                    report.failed.append(unit)
+            except LeaseLost:
+                print(f"Unidade {unit} de {job} abandonada: lease perdido")
+                report.failed.append(unit)
+            except Exception as e:
+                print(f"Erro na unidade {unit} de {job}: {e}")
+                report.failed.append(unit)
+                try:
+                    lease.release(str(e))
+                except Exception as release_error:
+                    # O prazo vence sozinho e a próxima invocação assume
+                    print(f"Erro ao liberar o lease {lease.key}: {release_error}")
+            finally:
+                stop.set()
+                heartbeat.join()
+        return report
+
+    def run_sharded(self, job: str, run_key: str, firebase_uids, process_user,
+                    shards: int = JOB_SHARDS, durable: bool = False) -> JobReport:
+        """
+        Divide os usuários em `shards` e chama `process_user(uid) -> int` para
+        cada um, em ordem, retomando do cursor do lease. `durable` grava o
+        cursor a cada usuário (para passos que não podem ser repetidos, como o
+        fecho de mês). O resultado de cada shard tem `users` e `count` (soma).
+        """
+        by_shard = {str(i): [] for i in range(shards)}
+        for firebase_uid in set(firebase_uids):
+            by_shard[str(shard_of(firebase_uid, shards))].append(firebase_uid)
+
+        def process(unit, lease):
+            users = count = 0
+            for firebase_uid in sorted(by_shard[unit]):
+                if lease.cursor is not None and firebase_uid <= lease.cursor:
+                    continue
+                count += process_user(firebase_uid) or 0
+                users += 1
+                lease.checkpoint(firebase_uid, durable=durable)
+            return {'users': users, 'count': count}
+
+        return self.run(job, run_key, list(by_shard), process)
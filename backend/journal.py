@@ -0,0 +1,317 @@
+# backend/journal.py
+"""
+Journal local (write-behind) para os lançamentos do LedgerWriter.
+
+Pensado para o deploy de processo longo com disco persistente, não para as
+funções da Vercel (sem disco entre invocações). Com `LEDGER_JOURNAL_PATH`
+definido:
+
+1. `LedgerWriter.commit` monta o `LedgerRecord` (IDs das transações gerados
+   localmente), acrescenta uma linha JSON no arquivo, faz fsync e responde.
+   Um pico de latência do Firestore não segura mais a resposta do bot.
+2. Uma thread agrupa por `LEDGER_JOURNAL_FLUSH_SECONDS` o que chegou e grava
+   com `LedgerWriter.write_records`: um lote com um incremento líquido por
+   conta e por meta, até `LEDGER_JOURNAL_MAX_WRITES` escritas. A conta
+   inclui o que os hooks gravam por usuário e mês (índice de busca, versão
+   dos dados, agregados) e o marcador (ver `LedgerWriter.record_writes`).
+3. No mesmo lote vai `ledger_journals/{LEDGER_JOURNAL_ID}` com o último
+   `seq` aplicado. Depois do commit o arquivo ganha um checkpoint
+   `{"flushed": seq}`. Ao reiniciar, o que está depois do checkpoint é
+   reenviado, menos o que o marcador diz já ter sido aplicado (o processo
+   pode ter caído entre o commit e o checkpoint). Assim cada lançamento é
+   aplicado exatamente uma vez.
+
+Enquanto um lançamento não foi gravado, `pending_balance` o soma ao saldo
+lido (via `BalanceCounters.overlay`) e `pending_entries` o entrega às
+consultas do mês, com o ID da transação: quem também consultou o Firestore
+descarta os que a consulta já trouxe. Os registros saem da fila logo depois
+do commit, antes dos listeners. Relatórios em cache e o dashboard só o veem
+depois do flush, que incrementa a versão dos dados (ver data_versions.py).
+
+Se o flush falha por um erro passageiro (rede, Firestore indisponível), os
+registros continuam pendentes e são tentados de novo a cada
+`LEDGER_JOURNAL_RETRY_SECONDS`. Um erro que se repetiria sempre com os
+mesmos dados (ex. NOT_FOUND numa meta ou conta a pagar apagada pelo
+dashboard) não pode travar a fila de todos: o lote é dividido ao meio até
+isolar o registro com problema, que vai para `{LEDGER_JOURNAL_PATH}.dead`
+(uma linha JSON com o registro e o erro) e sai da fila. Esse registro não
+foi aplicado e precisa de correção manual.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+from clients import firestore
+from ledger import GoalChange, LedgerEntry, LedgerRecord
+from tracing import span
+
+JOURNALS_COLLECTION = 'ledger_journals'
+LEDGER_JOURNAL_FLUSH_SECONDS = float(os.getenv("LEDGER_JOURNAL_FLUSH_SECONDS", "0.2"))
+LEDGER_JOURNAL_RETRY_SECONDS = float(os.getenv("LEDGER_JOURNAL_RETRY_SECONDS", "2"))
+# O Firestore aceita 500 escritas por lote (contando hooks e marcador)
+LEDGER_JOURNAL_MAX_WRITES = int(os.getenv("LEDGER_JOURNAL_MAX_WRITES", "450"))
+LEDGER_JOURNAL_COMPACT_BYTES = int(os.getenv("LEDGER_JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+
+
+def default_journal_id(path: str) -> str:
+    """Um ID estável por máquina e arquivo, para o marcador no Firestore."""
+    digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    return f"{socket.gethostname()}-{digest}"
+
+
+def _encode(seq: int, record: LedgerRecord) -> dict:
+    entries = []
+    for entry in record.entries:
+        data = dict(entry.__dict__)
+        if isinstance(data['created_at'], datetime):
+            data['created_at'] = data['created_at'].isoformat()
+        entries.append(data)
+    return {
+        'seq': seq, 'uid': record.firebase_uid, 'entries': entries,
+        'ids': record.transaction_ids, 'shards': record.shards,
+        'goals': [change.__dict__ for change in record.goal_changes],
+        'scheduled': record.scheduled_status,
+    }
+
+
+def _decode(line: dict) -> LedgerRecord:
+    entries = []
+    for data in line['entries']:
+        if data.get('created_at'):
+            data['created_at'] = datetime.fromisoformat(data['created_at'])
+        entries.append(LedgerEntry(**data))
+    return LedgerRecord(
+        line['uid'], entries, line['ids'], shards=line.get('shards', {}),
+        goal_changes=[GoalChange(**change) for change in line.get('goals', [])],
+        scheduled_status=line.get('scheduled', {}),
+    )
+
+
+def is_permanent(error: Exception) -> bool:
+    """Erros que se repetiriam em toda tentativa com o mesmo registro."""
+    if isinstance(error, (KeyError, TypeError, ValueError)):
+        return True
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.NotFound, exceptions.InvalidArgument, exceptions.FailedPrecondition))
+
+
+class LedgerJournal:
+    """Arquivo append-only com os lançamentos aceitos e ainda não gravados."""
+
+    def __init__(self, path: str, writer, journal_id: str | None = None,
+                 flush_seconds: float = LEDGER_JOURNAL_FLUSH_SECONDS,
+                 max_writes: int = LEDGER_JOURNAL_MAX_WRITES,
+                 compact_bytes: int = LEDGER_JOURNAL_COMPACT_BYTES):
+        self.path = path
+        self.writer = writer
+        self.journal_id = journal_id or default_journal_id(path)
+        self.flush_seconds = flush_seconds
+        self.max_writes = max_writes
+        self.compact_bytes = compact_bytes
+        self.dead_letter_path = path + '.dead'
+
+        self._cond = threading.Condition()
+        self._pending: list[tuple[int, LedgerRecord]] = []
+        self._seq = 0
+        self._recovered = False
+        self._max_records = None  # limite do lote enquanto isola um registro com erro
+        self._thread = None
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._pending:
+            self._start()
+
+    def _load(self):
+        """Lê o arquivo, descarta uma última linha cortada e separa o que não foi gravado."""
+        if not os.path.exists(self.path):
+            return
+        records, flushed, good_bytes = {}, 0, 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                try:
+                    line = json.loads(raw)
+                except ValueError:
+                    break  # queda no meio de uma escrita: o resto não foi confirmado
+                if not raw.endswith(b'\n'):
+                    break
+                good_bytes += len(raw)
+                if 'flushed' in line:
+                    flushed = max(flushed, line['flushed'])
+                else:
+                    records[line['seq']] = line
+                self._seq = max(self._seq, line.get('seq', 0), line.get('flushed', 0))
+        if good_bytes < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_bytes)
+        self._pending = [(seq, _decode(line)) for seq, line in sorted(records.items()) if seq > flushed]
+        print(f"Journal {self.path}: {len(self._pending)} registro(s) pendente(s)")
+
+    def _recover(self):
+        """
+        Descarta o que o marcador no Firestore diz já ter sido aplicado. Roda
+        antes do primeiro append, para que um arquivo perdido não faça novos
+        `seq` colidirem com os já aplicados.
+        """
+        if self._recovered:
+            return
+        with span('firestore.get', collection=JOURNALS_COLLECTION):
+            doc = self.writer.db.collection(JOURNALS_COLLECTION).document(self.journal_id).get()
+        last_seq = (doc.to_dict() or {}).get('lastSeq', 0) if doc.exists else 0
+        with self._cond:
+            self._seq = max(self._seq, last_seq)
+            applied = [seq for seq, _ in self._pending if seq <= last_seq]
+            self._pending = [item for item in self._pending if item[0] > last_seq]
+        if applied:
+            self._checkpoint(max(applied))
+        self._recovered = True
+
+    def _write_line(self, data: dict):
+        self._file.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _checkpoint(self, seq: int):
+        with self._cond:
+            self._write_line({'flushed': seq})
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ledger-journal', daemon=True)
+            self._thread.start()
+
+    def append(self, record: LedgerRecord):
+        """Grava o registro no disco (com fsync) e o entrega ao flusher."""
+        self._recover()
+        with span('journal.append', entries=len(record.entries)):
+            with self._cond:
+                self._seq += 1
+                self._write_line(_encode(self._seq, record))
+                self._pending.append((self._seq, record))
+                self._start()
+                self._cond.notify_all()
+
+    def pending_balance(self, account_id: str) -> float:
+        with self._cond:
+            return sum(record.balance_deltas().get(account_id, 0) for _, record in self._pending)
+
+    def pending_entries(self, firebase_uid: str) -> list[tuple[str, LedgerEntry]]:
+        """(ID da transação, lançamento) do usuário ainda não gravados."""
+        with self._cond:
+            return [(transaction_id, entry) for _, record in self._pending if record.firebase_uid == firebase_uid
+                    for transaction_id, entry in zip(record.transaction_ids, record.entries)]
+
+    def drain(self, timeout: float = 30) -> bool:
+        """Espera até não haver nada pendente. False se o tempo acabar."""
+        with self._cond:
+            if self._pending:
+                self._start()
+            return self._cond.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def _next_chunk(self) -> list[tuple[int, LedgerRecord]]:
+        chunk, keys = [], set()
+        for item in self._pending:
+            if self._max_records is not None and len(chunk) >= self._max_records:
+                break
+            merged = keys | self.writer.record_writes(item[1])
+            # +1: o marcador do journal
+            if chunk and len(merged) + 1 > self.max_writes:
+                break
+            chunk.append(item)
+            keys = merged
+        return chunk
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            # Espera um pouco para juntar mais lançamentos no mesmo lote
+            time.sleep(self.flush_seconds)
+            try:
+                self._recover()
+                self.flush_once()
+            except Exception as e:
+                print(f"Erro ao gravar o journal {self.path}: {e}")
+                time.sleep(LEDGER_JOURNAL_RETRY_SECONDS)
+
+    def flush_once(self) -> int:
+        """Grava um lote com os registros mais antigos. Retorna quantos foram gravados."""
+        with self._cond:
+            chunk = self._next_chunk()
+        if not chunk:
+            return 0
+        last_seq = chunk[-1][0]
+        marker = self.writer.db.collection(JOURNALS_COLLECTION).document(self.journal_id)
+
+        def mark(batch):
+            batch.set(marker, {'lastSeq': last_seq, 'updatedAt': firestore.SERVER_TIMESTAMP})
+
+        committed = []
+
+        def done():
+            committed.append(True)
+            self._done(last_seq)
+
+        try:
+            with span('journal.flush', records=len(chunk)):
+                self.writer.write_records([record for _, record in chunk], before_commit=mark, after_commit=done)
+        except Exception as e:
+            if committed:
+                # Falhou um listener: o lote já foi gravado e não pode ser repetido
+                print(f"Erro depois de gravar {len(chunk)} registro(s) do journal {self.path}: {e}")
+                self._max_records = None
+                return len(chunk)
+            if not is_permanent(e):
+                raise
+            if len(chunk) > 1:
+                # Divide o lote; a próxima tentativa leva só a primeira metade
+                self._max_records = len(chunk) // 2
+                print(f"Erro ao gravar {len(chunk)} registro(s) do journal {self.path}: {e}; dividindo o lote")
+                return 0
+            self._dead_letter(chunk[0], e)
+            return 0
+        self._max_records = None
+        return len(chunk)
+
+    def _done(self, last_seq: int):
+        with self._cond:
+            self._write_line({'flushed': last_seq})
+            self._pending = [item for item in self._pending if item[0] > last_seq]
+            if not self._pending:
+                self._maybe_compact()
+            self._cond.notify_all()
+
+    def _dead_letter(self, item: tuple[int, LedgerRecord], error: Exception):
+        """Tira da fila um registro que nunca vai ser aceito, guardando-o para correção manual."""
+        seq, record = item
+        print(f"Registro {seq} do journal {self.path} (usuário {record.firebase_uid}) descartado: {error}; "
+              f"gravado em {self.dead_letter_path}")
+        line = {**_encode(seq, record), 'error': f"{type(error).__name__}: {error}",
+                'failedAt': datetime.now(timezone.utc).isoformat()}
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # O registro é o mais antigo pendente: tudo antes dele já foi gravado
+        self._max_records = None
+        self._done(seq)
+
+    def _maybe_compact(self):
+        """Sem nada pendente, troca um arquivo grande por um só com o checkpoint."""
+        if self._file.tell() < self.compact_bytes:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'flushed': self._seq}, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
@@ -0,0 +1,272 @@
+# backend/ledger.py
+"""
+Pipeline única de escrita no livro-caixa.
+
+Todo lançamento feito pelo bot ou pela API passa por `LedgerWriter.commit`,
+que monta UM lote atômico com as transações, os incrementos de saldo das
+contas, os incrementos das metas, as mudanças de status de contas a pagar e
+(opcionalmente) os agregados mensais. O estado resultante (saldos e progresso
+das metas) é calculado localmente a partir do estado lido antes da escrita,
+para que ninguém precise reler documentos só para montar a confirmação.
+
+Com um journal local (ver journal.py), `commit` só grava o lançamento no
+journal e devolve o resultado; o flusher do journal chama `write_records`
+com vários lançamentos de uma vez.
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+
+from balance_counters import SHARDS_FIELD, shard_count
+from clients import firestore
+from tracing import span
+
+ROLLUPS_COLLECTION = 'monthly_rollups'
+# Caracteres que quebram ou dividem um caminho de campo do Firestore
+_FIELD_PATH_CHARS = re.compile(r'[.`/\[\]*~]')
+
+
+@dataclass
+class LedgerEntry:
+    """Uma transação de renda ou despesa."""
+    type: str
+    amount: float
+    category: str
+    description: str | None = None
+    account_id: str | None = None
+    created_at: datetime | None = None  # None = SERVER_TIMESTAMP
+
+
+@dataclass
+class GoalChange:
+    """Incremento (ou decremento) de `savedAmount` de uma meta."""
+    goal_id: str
+    delta: float
+
+
+@dataclass
+class LedgerRecord:
+    """Um `commit` pronto para ser escrito: agora, ou depois pelo journal."""
+    firebase_uid: str
+    entries: list[LedgerEntry]
+    transaction_ids: list[str]
+    shards: dict[str, int] = field(default_factory=dict)  # conta -> balanceShards
+    goal_changes: list[GoalChange] = field(default_factory=list)
+    scheduled_status: dict[str, str] = field(default_factory=dict)
+    create: bool = False  # IDs fixos: as transações não podem existir ainda
+
+    def balance_deltas(self) -> dict[str, float]:
+        deltas = {}
+        for entry in self.entries:
+            if entry.account_id:
+                sign = 1 if entry.type == 'income' else -1
+                deltas[entry.account_id] = deltas.get(entry.account_id, 0) + sign * entry.amount
+        return deltas
+
+
+@dataclass
+class LedgerResult:
+    transaction_ids: list[str] = field(default_factory=list)
+    balances: dict[str, float] = field(default_factory=dict)
+    goals: dict[str, dict] = field(default_factory=dict)
+
+
+def rollup_doc_id(firebase_uid: str, when: datetime) -> str:
+    return f"{firebase_uid}_{when.year}_{when.month:02d}"
+
+
+def rollup_category_key(category: str | None) -> str:
+    """
+    Chave da categoria nos mapas `*ByCategory` dos agregados. Sem nome vira
+    'Outros'; `.`, `/`, crases e afins viram `_`, e nomes `__x__` (reservados
+    pelo Firestore) perdem os sublinhados. Nomes que só diferem nesses
+    caracteres somam na mesma chave.
+    """
+    key = _FIELD_PATH_CHARS.sub('_', (category or '').strip())
+    if key.startswith('__') and key.endswith('__'):
+        key = key.strip('_')
+    return key or 'Outros'
+
+
+class LedgerWriter:
+    """
+    Monta e executa os lotes de escrita do livro-caixa.
+
+    `hooks` recebe funções `hook(batch, firebase_uid, entries, transaction_ids)`
+    chamadas antes do commit, para que outros índices derivados entrem no
+    mesmo lote atômico. `listeners` recebe funções
+    `listener(firebase_uid, entries, result, changed)` chamadas depois do
+    commit; `changed` é o conjunto de coleções alteradas (para invalidar caches).
+    Com `journal`, hooks e listeners rodam no flush.
+    """
+
+    def __init__(self, db, balances, rollups: bool = False):
+        self.db = db
+        self.balances = balances
+        self.rollups = rollups
+        self.hooks = []
+        self.listeners = []
+        self.journal = None
+
+    def commit(self, firebase_uid: str, entries: list[LedgerEntry], accounts: dict | None = None,
+               goal_changes: list[GoalChange] = (), goals: dict | None = None,
+               scheduled_status: dict | None = None, transaction_ids: list[str] | None = None) -> LedgerResult:
+        """
+        Grava os lançamentos num único lote.
+
+        `accounts` e `goals` mapeiam id -> dados lidos antes da escrita; são
+        usados para escolher a representação do saldo e para calcular o
+        estado final devolvido em `LedgerResult`. `scheduled_status` mapeia
+        id de `scheduled_transactions` -> novo status.
+
+        `transaction_ids` fixa os IDs das transações, para lançamentos que não
+        podem ser repetidos (ex. o fecho do mês). Elas são gravadas com
+        `create`: se alguma já existe, o lote inteiro falha com `AlreadyExists`
+        e nada é aplicado. Esses lançamentos não passam pelo journal, porque
+        quem chama precisa saber na hora se já tinham sido gravados.
+        """
+        accounts = accounts or {}
+        goals = goals or {}
+        journal = self.journal if transaction_ids is None else None
+        if journal is not None:
+            # A data é a do aceite, não a do flush (que pode vir bem depois)
+            now = datetime.now(timezone.utc)
+            entries = [replace(entry, created_at=entry.created_at or now) for entry in entries]
+
+        record = LedgerRecord(
+            firebase_uid, list(entries),
+            # IDs gerados localmente: o journal precisa deles antes da escrita
+            list(transaction_ids) if transaction_ids is not None
+            else [self.db.collection('transactions').document().id for _ in entries],
+            goal_changes=list(goal_changes), scheduled_status=dict(scheduled_status or {}),
+            create=transaction_ids is not None,
+        )
+        result = LedgerResult(transaction_ids=list(record.transaction_ids))
+        for account_id, delta in record.balance_deltas().items():
+            account = accounts.get(account_id)
+            record.shards[account_id] = shard_count(account)
+            if account is not None:
+                result.balances[account_id] = self.balances.read(account_id, account) + delta
+        for change in goal_changes:
+            goal = dict(goals.get(change.goal_id, {}))
+            goal['savedAmount'] = goal.get('savedAmount', 0) + change.delta
+            result.goals[change.goal_id] = goal
+
+        if journal is not None:
+            journal.append(record)
+        else:
+            self.write_records([record])
+        return result
+
+    def write_records(self, records: list[LedgerRecord], before_commit=None, after_commit=None):
+        """
+        Grava os registros num único lote, com um incremento líquido por conta
+        e por meta. `before_commit(batch)` pode acrescentar escritas ao lote
+        (o journal grava ali o último registro aplicado). `after_commit()`
+        roda logo depois do commit, antes dos listeners (o journal tira ali os
+        registros da fila, para não serem contados duas vezes).
+        """
+        batch = self.db.batch()
+        by_user = {}
+        balance_deltas, shards, goal_deltas, scheduled_status = {}, {}, {}, {}
+        for record in records:
+            entries, transaction_ids, changed = by_user.setdefault(record.firebase_uid, ([], [], set()))
+            entries.extend(record.entries)
+            transaction_ids.extend(record.transaction_ids)
+            deltas = record.balance_deltas()
+            for account_id, delta in deltas.items():
+                balance_deltas[account_id] = balance_deltas.get(account_id, 0) + delta
+            shards.update(record.shards)
+            for change in record.goal_changes:
+                goal_deltas[change.goal_id] = goal_deltas.get(change.goal_id, 0) + change.delta
+            scheduled_status.update(record.scheduled_status)
+
+            changed.update(name for name, touched in (
+                ('transactions', record.entries), ('accounts', deltas),
+                ('goals', record.goal_changes), ('scheduled_transactions', record.scheduled_status),
+            ) if touched)
+
+        for record in records:
+            write = batch.create if record.create else batch.set
+            for entry, transaction_id in zip(record.entries, record.transaction_ids):
+                write(self.db.collection('transactions').document(transaction_id), self._transaction_data(record.firebase_uid, entry))
+
+        # Um único incremento por conta, mesmo com vários lançamentos nela
+        for account_id, delta in balance_deltas.items():
+            self.balances.increment(batch, account_id, {SHARDS_FIELD: shards.get(account_id, 0)}, delta)
+
+        for goal_id, delta in goal_deltas.items():
+            batch.update(self.db.collection('goals').document(goal_id), {'savedAmount': firestore.firestore.Increment(delta)})
+
+        for doc_id, status in scheduled_status.items():
+            batch.update(self.db.collection('scheduled_transactions').document(doc_id), {'status': status})
+
+        for firebase_uid, (entries, transaction_ids, _) in by_user.items():
+            if self.rollups:
+                self._add_rollups(batch, firebase_uid, entries)
+            for hook in self.hooks:
+                hook(batch, firebase_uid, entries, transaction_ids)
+
+        if before_commit:
+            before_commit(batch)
+
+        with span('firestore.commit', writes=sum(len(r.entries) for r in records), hooks=len(self.hooks), records=len(records)):
+            batch.commit()
+        if after_commit:
+            after_commit()
+
+        for firebase_uid, (entries, transaction_ids, changed) in by_user.items():
+            for listener in self.listeners:
+                listener(firebase_uid, entries, LedgerResult(transaction_ids=transaction_ids), changed)
+
+    def record_writes(self, record: LedgerRecord) -> set:
+        """
+        Os documentos que `write_records` grava por causa do registro, para o
+        journal limitar o tamanho do lote. Documentos repetidos entre registros
+        (a mesma conta, o mesmo mês do usuário) contam uma vez só. Cada hook e
+        os agregados contam um documento por mês do usuário (o índice de busca
+        grava um por mês; data_versions, um por usuário).
+        """
+        keys = {('transactions', transaction_id) for transaction_id in record.transaction_ids}
+        keys.update(('accounts', account_id) for account_id in record.balance_deltas())
+        keys.update(('goals', change.goal_id) for change in record.goal_changes)
+        keys.update(('scheduled_transactions', doc_id) for doc_id in record.scheduled_status)
+        per_month = len(self.hooks) + (1 if self.rollups else 0)
+        months = {(entry.created_at.year, entry.created_at.month) if entry.created_at else None
+                  for entry in record.entries} or {None}
+        keys.update(('derived', record.firebase_uid, month, i) for month in months for i in range(per_month))
+        return keys
+
+    def drain(self, timeout: float = 30) -> bool:
+        """Espera o journal (se houver) gravar tudo no Firestore. False se o tempo acabar."""
+        return self.journal.drain(timeout) if self.journal is not None else True
+
+    @staticmethod
+    def _transaction_data(firebase_uid: str, entry: LedgerEntry) -> dict:
+        data = {
+            'userId': firebase_uid, 'type': entry.type, 'amount': entry.amount,
+            'category': entry.category, 'description': entry.description,
+            'createdAt': entry.created_at or firestore.SERVER_TIMESTAMP,
+        }
+        if entry.account_id:
+            data['accountId'] = entry.account_id
+        return data
+
+    def _add_rollups(self, batch, firebase_uid: str, entries: list[LedgerEntry]):
+        """Agregados mensais por tipo e categoria (apenas dos lançamentos do backend)."""
+        by_month = {}
+        for entry in entries:
+            when = entry.created_at or datetime.now(timezone.utc)
+            totals = by_month.setdefault((when.year, when.month), {})
+            by_type = totals.setdefault(entry.type, {})
+            category = rollup_category_key(entry.category)
+            by_type[category] = by_type.get(category, 0) + entry.amount
+
+        for (year, month), totals in by_month.items():
+            data = {'userId': firebase_uid, 'year': year, 'month': month}
+            for entry_type, by_category in totals.items():
+                data[entry_type] = firestore.firestore.Increment(sum(by_category.values()))
+                data[f"{entry_type}ByCategory"] = {cat: firestore.firestore.Increment(amount) for cat, amount in by_category.items()}
+            ref = self.db.collection(ROLLUPS_COLLECTION).document(rollup_doc_id(firebase_uid, datetime(year, month, 1)))
+            batch.set(ref, data, merge=True)
@@ -0,0 +1,52 @@
+# backend/notifications.py
+"""
+Envio em massa de mensagens proativas (lembretes, resumos) pelos crons.
+
+As mensagens são montadas primeiro, com poucas leituras em lote, e só
+depois enviadas por `send_bulk`, que limita quantos envios ficam em voo ao
+mesmo tempo. Os limites de flood do Telegram continuam valendo por cima
+disso, no OutboundScheduler da Application.
+"""
+
+import asyncio
+import os
+
+from clients import db
+from tracing import span
+
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", "8"))
+
+
+def chats_by_user(firebase_uids=None) -> dict[str, list[int]]:
+    """
+    Lê `telegram_users` numa única consulta (só o campo `firebase_uid`) e
+    devolve firebase_uid -> chat_ids. Um usuário pode ter mais de um chat.
+    """
+    wanted = set(firebase_uids) if firebase_uids is not None else None
+    chats = {}
+    with span('firestore.query', collection='telegram_users', projection=['firebase_uid']):
+        for doc in db.collection('telegram_users').select(['firebase_uid']).stream():
+            firebase_uid = doc.to_dict().get('firebase_uid')
+            if not firebase_uid or (wanted is not None and firebase_uid not in wanted):
+                continue
+            chats.setdefault(firebase_uid, []).append(int(doc.id))
+    return chats
+
+
+async def send_bulk(bot, messages: list[tuple[int, str]], concurrency: int = OUTBOUND_CONCURRENCY,
+                    parse_mode: str | None = 'Markdown') -> tuple[int, int]:
+    """Envia (chat_id, texto) com no máximo `concurrency` envios simultâneos. Devolve (enviadas, falhas)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(chat_id, text):
+        async with semaphore:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+
+    results = await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages), return_exceptions=True)
+    failed = 0
+    for (chat_id, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            # Ex.: o usuário bloqueou o bot. Não impede os demais envios.
+            print(f"Falha ao enviar mensagem para o chat {chat_id}: {result}")
+            failed += 1
+    return len(messages) - failed, failed
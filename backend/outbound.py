@@ -0,0 +1,177 @@
+# backend/outbound.py
+"""
+Agendador de saída para a API do Telegram.
+
+Plugado na Application como `rate_limiter` (ver telegram_client.py), fica na
+frente de toda chamada do bot — `reply_text`, `edit_text`, `send_message` e
+as demais — e aplica:
+
+- token buckets por chat e global, abaixo dos limites de flood do Telegram
+  (~30 msg/s no total, ~1 msg/s sustentada por chat privado e 20 msg/min por
+  grupo), com uma pequena rajada por chat para o padrão "⏳" → resultado não
+  esperar;
+- novas tentativas em `RetryAfter` (HTTP 429), esperando o `retry_after`
+  informado pelo Telegram (mais um jitter crescente) e segurando o chat — ou
+  o bot inteiro, se o 429 não for de um chat — durante esse tempo;
+- coalescência de edições: se várias `editMessageText` da mesma mensagem
+  estão na fila esperando tokens, só a mais recente é enviada e as
+  anteriores recebem o resultado dela.
+
+Configuração:
+- `TELEGRAM_GLOBAL_RATE` (msg/s, padrão 30);
+- `TELEGRAM_CHAT_RATE` (msg/s por chat privado, padrão 1) e `TELEGRAM_CHAT_BURST` (padrão 5);
+- `TELEGRAM_GROUP_RATE` (msg/s por grupo, padrão 20/60);
+- `TELEGRAM_MAX_RETRIES` (padrão 3).
+"""
+
+import asyncio
+import os
+import random
+import time
+from datetime import timedelta
+
+from cachetools import LRUCache
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "5"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+EDIT_ENDPOINTS = frozenset({'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'})
+
+
+class TokenBucket:
+    """Balde de fichas assíncrono: `rate` fichas por segundo, até `capacity`."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _EditSlot:
+    """Edições pendentes de uma mesma mensagem; só a de `seq` mais alto é enviada."""
+    __slots__ = ('seq', 'future', 'waiters')
+
+    def __init__(self):
+        self.seq = 0
+        self.future = None
+        self.waiters = 0
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Rate limiter do bot com buckets por chat/global, retry e coalescência de edições."""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: float = TELEGRAM_CHAT_BURST, group_rate: float = TELEGRAM_GROUP_RATE,
+                 max_retries: int = TELEGRAM_MAX_RETRIES, max_chats: int = 4096):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = LRUCache(maxsize=max_chats)
+        # (endpoint, chat_id, message_id, inline_message_id) -> edições na fila
+        self._edits = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # IDs negativos são grupos/canais, com limite bem menor
+            if str(chat_id).startswith(('-', '@')):
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, max(1.0, self.chat_burst))
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        max_retries = (rate_limit_args or {}).get('max_retries', self.max_retries)
+        if endpoint not in EDIT_ENDPOINTS:
+            return await self._send(callback, args, kwargs, chat_id, max_retries)
+
+        key = (endpoint, chat_id, data.get('message_id'), data.get('inline_message_id'))
+        slot = self._edits.get(key)
+        if slot is None:
+            slot = self._edits[key] = _EditSlot()
+        slot.seq += 1
+        seq = slot.seq
+        future = slot.future = asyncio.get_running_loop().create_future()
+        slot.waiters += 1
+        try:
+            if chat_id is not None:
+                await self._chat_bucket(chat_id).acquire()
+            if slot.seq != seq:
+                # Uma edição mais nova da mesma mensagem chegou enquanto esta
+                # esperava: devolve a ficha e fica com o resultado da nova.
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).refund()
+                result = await asyncio.shield(slot.future)
+            else:
+                result = await self._send(callback, args, kwargs, chat_id, max_retries, chat_acquired=True)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # marca como lida: pode não haver edições antigas esperando
+            raise
+        finally:
+            slot.waiters -= 1
+            if not slot.waiters:
+                del self._edits[key]
+
+    async def _send(self, callback, args, kwargs, chat_id, max_retries, chat_acquired=False):
+        """Executa a chamada respeitando os buckets e repetindo em 429."""
+        for attempt in range(max_retries + 1):
+            if chat_id is not None and not (chat_acquired and attempt == 0):
+                await self._chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= max_retries:
+                    raise
+                delay = _retry_after_seconds(e) + random.uniform(0, 0.5 * (attempt + 1))
+                print(f"Telegram pediu para aguardar {delay:.1f}s (tentativa {attempt + 1}/{max_retries}).")
+                (self._chat_bucket(chat_id) if chat_id is not None else self._global).block(delay)
@@ -0,0 +1,189 @@
+# backend/profiling.py
+"""
+Profiler opcional por requisição.
+
+Ativado de duas formas:
+- `PROFILE_REQUESTS=1`: perfila todas as requisições das rotas decoradas;
+- cabeçalho `X-Profile: <PROFILE_SECRET>`: perfila só aquela requisição
+  (o segredo impede que qualquer um ligue o profiler em produção).
+
+Usa o `pyinstrument` (amostragem) se estiver instalado, senão o `cProfile`.
+O perfil e um resumo com as N funções mais caras vão para `PROFILE_DIR`,
+mantendo apenas os `PROFILE_KEEP` mais recentes.
+
+Os handlers do bot rodam na thread `telegram-loop` (ver `run_on_bot_loop`
+em telegram_client.py). O `pyinstrument`, e o `cProfile` até o Python 3.11,
+só amostram a thread em que foram ligados, então o perfil da thread do
+Flask em `/api/bot` só mostraria a espera pelo resultado. Por isso
+`run_on_bot_loop` passa a corrotina por `profile_on_loop`: numa requisição
+perfilada, uma segunda sessão é ligada dentro da corrotina, na thread do
+loop, e salva como `<perfil>-loop`. Como o loop é compartilhado, só uma
+sessão roda nele por vez (as outras requisições perfiladas ficam só com o
+perfil do Flask).
+
+A partir do 3.12 o `cProfile` usa `sys.monitoring`, que vale para todas as
+threads e aceita um só profiler ligado no processo: o perfil do Flask já
+inclui o loop (e o que mais rodou no intervalo), e não há segunda sessão.
+Se o profiler não puder ser ligado (outra requisição perfilada ao mesmo
+tempo), a requisição segue sem perfil.
+"""
+
+import contextvars
+import os
+import secrets
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import request
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "").lower() in ("1", "true", "yes")
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/oikonomos-profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+
+# Sessões do loop do bot da requisição perfilada atual (None = não perfilar o loop)
+_loop_sessions = contextvars.ContextVar('profile_loop_sessions', default=None)
+_loop_profiler = threading.Lock()
+
+
+def profiling_requested() -> bool:
+    if PROFILE_REQUESTS:
+        return True
+    header = request.headers.get('X-Profile')
+    return bool(PROFILE_SECRET and header and secrets.compare_digest(header, PROFILE_SECRET))
+
+
+def _rotate(directory: str, keep: int):
+    """Apaga os perfis mais antigos, mantendo os `keep` mais recentes (por requisição)."""
+    def request_stem(name):
+        return name.rsplit('.', 1)[0].split('-loop')[0]
+
+    names = os.listdir(directory)
+    stems = sorted({request_stem(name) for name in names})
+    expired = set(stems[:max(0, len(stems) - keep)])
+    for name in names:
+        if request_stem(name) in expired:
+            os.remove(os.path.join(directory, name))
+
+
+class _CProfileSession:
+    # sys.monitoring (3.12+): uma sessão vê todas as threads
+    all_threads = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def write(self, stem: str):
+        import pstats
+
+        self.profiler.dump_stats(f"{stem}.prof")
+        with open(f"{stem}.txt", 'w') as f:
+            pstats.Stats(self.profiler, stream=f).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+
+class _PyinstrumentSession:
+    all_threads = False
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def write(self, stem: str):
+        with open(f"{stem}.html", 'w') as f:
+            f.write(self.profiler.output_html())
+        with open(f"{stem}.txt", 'w') as f:
+            f.write(self.profiler.output_text(unicode=True, color=False))
+
+
+def _new_session():
+    try:
+        return _PyinstrumentSession()
+    except ImportError:
+        return _CProfileSession()
+
+
+def _start_session():
+    """Liga um profiler nesta thread. None se não for possível (ex.: outro já ligado)."""
+    try:
+        session = _new_session()
+        session.start()
+        return session
+    except Exception as e:
+        print(f"Profiler não iniciado: {e}")
+        return None
+
+
+def profile_on_loop(coro):
+    """
+    Chamado na thread da requisição. Se ela está sendo perfilada, devolve uma
+    corrotina que perfila `coro` na thread do loop; senão, a própria `coro`.
+    """
+    sessions = _loop_sessions.get()
+    if sessions is None:
+        return coro
+
+    async def run():
+        if not _loop_profiler.acquire(blocking=False):
+            return await coro
+        try:
+            session = _start_session()
+            if session is None:
+                return await coro
+            try:
+                return await coro
+            finally:
+                session.stop()
+                sessions.append(session)
+        finally:
+            _loop_profiler.release()
+
+    return run()
+
+
+def profiled(f):
+    """Decorador de rota: perfila a requisição quando `profiling_requested()`."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not profiling_requested():
+            return f(*args, **kwargs)
+
+        session = _start_session()
+        if session is None:
+            return f(*args, **kwargs)
+        loop_sessions = []
+        token = _loop_sessions.set(None if session.all_threads else loop_sessions)
+        started = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            session.stop()
+            _loop_sessions.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            try:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                route = request.path.strip('/').replace('/', '_') or 'index'
+                stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**6:06d}-{route}")
+                session.write(stem)
+                for i, loop_session in enumerate(loop_sessions):
+                    loop_session.write(f"{stem}-loop{i or ''}")
+                _rotate(PROFILE_DIR, PROFILE_KEEP)
+                print(f"Perfil de {request.path} ({elapsed_ms:.0f} ms) salvo em {stem}.txt")
+            except Exception as e:
+                print(f"Erro ao salvar perfil de {request.path}: {e}")
+    return decorated_function
@@ -0,0 +1,162 @@
+# backend/reconciliation.py
+"""
+Conciliação incremental dos saldos das contas com o livro-caixa.
+
+O saldo "verdadeiro" de uma conta é a soma das transações com o seu
+`accountId` (renda soma, despesa subtrai), como o dashboard calcula. O
+campo `balance` (mais os shards, ver balance_counters.py) é mantido por
+incrementos espalhados pelo bot e pelo dashboard e pode divergir.
+
+Para não reler o livro inteiro a cada execução, cada conta tem um checkpoint
+em `balance_checkpoints/{account_id}`:
+
+    {'userId': ..., 'until': <instante>, 'sum': <soma das transações com createdAt < until>}
+
+Cada execução lê só as transações com `createdAt >= until`. As anteriores a
+`agora - RECONCILE_SAFETY_LAG_SECONDS` entram na soma do checkpoint, que
+avança; as mais recentes (que ainda podem estar chegando fora de ordem)
+só entram na comparação. Na primeira execução de uma conta a soma parte
+dos resumos dos meses arquivados (ver archive.py) e do histórico completo.
+
+As contas são processadas em paralelo, em blocos. Com `repair=True` a
+diferença é corrigida com um `Increment` no `balance` da conta.
+
+Limitação: a soma do checkpoint só vê transações novas. Uma transação
+anterior a `until` apagada ou editada pelo dashboard (que não passa pelo
+backend) continua na soma, e a conciliação incremental acusa uma diferença
+que não existe. Por isso `repair` só é aceito com `full=True`, que relê
+o histórico inteiro e refaz o checkpoint; a execução incremental serve
+para detectar, não para corrigir.
+"""
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from archive import SUMMARIES_COLLECTION
+from clients import FieldFilter, firestore
+from tracing import span
+
+CHECKPOINTS_COLLECTION = 'balance_checkpoints'
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "50"))
+RECONCILE_SAFETY_LAG_SECONDS = float(os.getenv("RECONCILE_SAFETY_LAG_SECONDS", "300"))
+TOLERANCE = 0.005
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class Reconciliation:
+    account_id: str
+    user_id: str
+    account_name: str
+    expected: float
+    actual: float
+    scanned: int
+
+    @property
+    def discrepancy(self) -> float:
+        return round(self.actual - self.expected, 2)
+
+    @property
+    def ok(self) -> bool:
+        return abs(self.actual - self.expected) < TOLERANCE
+
+
+def _signed_sum(transactions: list[dict]) -> float:
+    return sum(t.get('amount', 0) if t.get('type') == 'income' else -t.get('amount', 0) for t in transactions)
+
+
+class BalanceReconciler:
+    def __init__(self, db, balances, workers: int = RECONCILE_WORKERS, chunk_size: int = RECONCILE_CHUNK_SIZE,
+                 safety_lag_seconds: float = RECONCILE_SAFETY_LAG_SECONDS):
+        self.db = db
+        self.balances = balances
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.safety_lag = timedelta(seconds=safety_lag_seconds)
+
+    def _archived_sum(self, firebase_uid: str, account_id: str) -> float:
+        q = self.db.collection(SUMMARIES_COLLECTION).where(filter=FieldFilter('userId', '==', firebase_uid))
+        with span('firestore.query', collection=SUMMARIES_COLLECTION):
+            return sum(doc.to_dict().get('byAccount', {}).get(account_id, 0) for doc in q.stream())
+
+    def reconcile_account(self, account_doc, cutoff: datetime, full: bool = False) -> tuple[Reconciliation, dict]:
+        """Concilia uma conta. Devolve o resultado e o novo checkpoint."""
+        account_id, account = account_doc.id, account_doc.to_dict()
+        firebase_uid = account.get('userId')
+
+        checkpoint = None
+        if not full:
+            with span('firestore.get', collection=CHECKPOINTS_COLLECTION):
+                checkpoint_doc = self.db.collection(CHECKPOINTS_COLLECTION).document(account_id).get()
+            checkpoint = checkpoint_doc.to_dict() if checkpoint_doc.exists else None
+        if checkpoint:
+            until, base_sum = checkpoint['until'], checkpoint['sum']
+        else:
+            until, base_sum = EPOCH, self._archived_sum(firebase_uid, account_id)
+
+        q = (self.db.collection('transactions')
+             .where(filter=FieldFilter('accountId', '==', account_id))
+             .where(filter=FieldFilter('createdAt', '>=', until)))
+        with span('firestore.query', collection='transactions', range='since_checkpoint'):
+            new_rows = [doc.to_dict() for doc in q.stream()]
+
+        settled = [t for t in new_rows if t['createdAt'] < cutoff]
+        recent = [t for t in new_rows if t['createdAt'] >= cutoff]
+        settled_sum = base_sum + _signed_sum(settled)
+
+        self.balances.invalidate(account_id)
+        result = Reconciliation(
+            account_id=account_id, user_id=firebase_uid, account_name=account.get('accountName', ''),
+            expected=round(settled_sum + _signed_sum(recent), 2),
+            actual=round(self.balances.read(account_id, account), 2),
+            scanned=len(new_rows),
+        )
+        new_checkpoint = {'userId': firebase_uid, 'until': max(until, cutoff), 'sum': settled_sum,
+                          'lastDiscrepancy': result.discrepancy, 'checkedAt': firestore.SERVER_TIMESTAMP}
+        return result, new_checkpoint
+
+    def run(self, repair: bool = False, full: bool = False, now: datetime | None = None) -> list[Reconciliation]:
+        """Concilia todas as contas. Devolve só as que divergem."""
+        if repair and not full:
+            raise ValueError("repair exige full: o checkpoint não vê transações apagadas ou editadas pelo dashboard")
+        cutoff = (now or datetime.now(timezone.utc)) - self.safety_lag
+        with span('firestore.query', collection='accounts'):
+            account_docs = list(self.db.collection('accounts').stream())
+
+        def reconcile(account_doc):
+            try:
+                return self.reconcile_account(account_doc, cutoff, full)
+            except Exception as e:
+                print(f"Erro ao conciliar a conta {account_doc.id}: {e}")
+                return None
+
+        discrepancies = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i in range(0, len(account_docs), self.chunk_size):
+                chunk = account_docs[i:i + self.chunk_size]
+                # copy_context: os spans das threads continuam no trace do cron
+                futures = [executor.submit(contextvars.copy_context().run, reconcile, doc) for doc in chunk]
+                batch = self.db.batch()
+                repaired = []
+                for future in futures:
+                    outcome = future.result()
+                    if outcome is None:
+                        continue
+                    result, checkpoint = outcome
+                    batch.set(self.db.collection(CHECKPOINTS_COLLECTION).document(result.account_id), checkpoint)
+                    if result.ok:
+                        continue
+                    discrepancies.append(result)
+                    if repair:
+                        batch.update(self.db.collection('accounts').document(result.account_id),
+                                     {'balance': firestore.firestore.Increment(result.expected - result.actual)})
+                        repaired.append(result.account_id)
+                with span('firestore.commit', collection=CHECKPOINTS_COLLECTION, writes=len(chunk), repairs=len(repaired)):
+                    batch.commit()
+                for account_id in repaired:
+                    self.balances.invalidate(account_id)
+        return discrepancies
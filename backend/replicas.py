@@ -0,0 +1,141 @@
+# backend/replicas.py
+"""
+Réplicas em memória das coleções pequenas de cada usuário, mantidas
+atualizadas por listeners `on_snapshot` do Firestore.
+
+Só faz sentido no deploy de longa duração (servidor Flask local ou gunicorn):
+os listeners vivem em threads do cliente gRPC e sobrevivem entre requisições.
+Em ambientes serverless a camada fica desligada e os handlers leem direto do
+Firestore, como antes.
+"""
+
+import threading
+import time
+
+from clients import FieldFilter
+
+# Coleção -> filtros de igualdade fixos da assinatura. Uma leitura só pode ser
+# servida pela réplica se pedir (pelo menos) esses mesmos filtros.
+REPLICATED_COLLECTIONS = {
+    'accounts': {},
+    'categories': {},
+    'budgets': {},
+    'goals': {},
+    'scheduled_transactions': {'status': 'pending'},
+}
+
+
+class CachedDoc:
+    """Imita a interface de leitura de um DocumentSnapshot (id, exists, to_dict)."""
+    __slots__ = ('id', '_data')
+    exists = True
+
+    def __init__(self, doc_id: str, data: dict):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self) -> dict:
+        return dict(self._data)
+
+    def get(self, field: str):
+        return self._data.get(field)
+
+
+class UserReplica:
+    """Visão em memória das coleções replicadas de um único usuário."""
+
+    def __init__(self, db, firebase_uid: str):
+        self.firebase_uid = firebase_uid
+        self.last_access = time.monotonic()
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._ready = {name: threading.Event() for name in REPLICATED_COLLECTIONS}
+        self._watches = []
+
+        for name, base_filters in REPLICATED_COLLECTIONS.items():
+            q = db.collection(name).where(filter=FieldFilter('userId', '==', firebase_uid))
+            for field, value in base_filters.items():
+                q = q.where(filter=FieldFilter(field, '==', value))
+            self._watches.append(q.on_snapshot(self._listener(name)))
+
+    def _listener(self, collection: str):
+        def on_snapshot(docs, changes, read_time):
+            # Cada snapshot traz o resultado completo da consulta: trocar a
+            # lista inteira de uma vez mantém a visão consistente.
+            snapshot = [CachedDoc(doc.id, doc.to_dict()) for doc in docs]
+            with self._lock:
+                self._docs[collection] = snapshot
+            self._ready[collection].set()
+        return on_snapshot
+
+    def wait_ready(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        return all(event.wait(max(0, deadline - time.monotonic())) for event in self._ready.values())
+
+    def docs(self, collection: str, filters: dict) -> list[CachedDoc] | None:
+        """
+        Devolve os documentos que atendem aos filtros de igualdade, ou None se
+        esta consulta não puder ser servida pela réplica.
+        """
+        base_filters = REPLICATED_COLLECTIONS.get(collection)
+        if base_filters is None or any(filters.get(k) != v for k, v in base_filters.items()):
+            return None
+        if not self._ready[collection].is_set():
+            return None
+        self.last_access = time.monotonic()
+        with self._lock:
+            snapshot = self._docs.get(collection, [])
+        return [doc for doc in snapshot if all(doc.get(k) == v for k, v in filters.items())]
+
+    def close(self):
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Erro ao encerrar listener do usuário {self.firebase_uid}: {e}")
+        self._watches = []
+
+
+class ReplicaManager:
+    """
+    Mantém uma `UserReplica` por usuário ativo e despeja as que ficarem
+    ociosas por mais de `ttl_seconds` (ou as mais antigas, acima de `max_users`).
+    """
+
+    def __init__(self, db, ttl_seconds: float = 900, max_users: int = 500, ready_timeout: float = 3.0):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.ready_timeout = ready_timeout
+        self._replicas = {}
+        self._lock = threading.Lock()
+
+    def get(self, firebase_uid: str) -> UserReplica | None:
+        """Devolve a réplica do usuário, criando os listeners no primeiro acesso."""
+        self.evict_idle()
+        with self._lock:
+            replica = self._replicas.get(firebase_uid)
+            if replica is None:
+                replica = UserReplica(self.db, firebase_uid)
+                self._replicas[firebase_uid] = replica
+        replica.last_access = time.monotonic()
+        # Na primeira vez esperamos o snapshot inicial; se demorar, o handler
+        # cai para a leitura direta e a réplica fica pronta para a próxima.
+        return replica if replica.wait_ready(self.ready_timeout) else None
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            by_age = sorted(self._replicas.values(), key=lambda r: r.last_access)
+            overflow = len(by_age) - self.max_users
+            evicted = [r for i, r in enumerate(by_age) if i < overflow or now - r.last_access > self.ttl_seconds]
+            for replica in evicted:
+                del self._replicas[replica.firebase_uid]
+        for replica in evicted:
+            replica.close()
+
+    def close(self):
+        with self._lock:
+            replicas, self._replicas = list(self._replicas.values()), {}
+        for replica in replicas:
+            replica.close()
@@ -0,0 +1,138 @@
+# backend/search_index.py
+"""
+Índice invertido das descrições (e categorias) das transações, por usuário.
+
+Um documento por usuário e mês, `search_postings/{uid}_{ano}_{mês}`:
+
+    {'userId': ..., 'year': 2026, 'month': 10,
+     'tokens': {'ifood': {'<transaction id>': -32.9, ...}, ...}}
+
+O valor de cada posting é o valor da transação com sinal (despesa negativa,
+renda positiva), o bastante para somar sem ler a transação. O índice é
+atualizado no mesmo lote de cada lançamento (hook do LedgerWriter) com
+`set(merge=True)`, que mescla os mapas aninhados sem reler o documento.
+
+Uma busca lê só os documentos dos meses pedidos e, dentro deles, só os
+campos `tokens.<termo>` dos termos buscados.
+
+Lançamentos feitos direto pelo dashboard não passam pelo LedgerWriter; para
+eles há `reindex_user` (ver tools/reindex_search.py).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from clients import FieldFilter
+from command_parser import search_terms
+from tracing import span
+
+POSTINGS_COLLECTION = 'search_postings'
+
+
+def postings_doc_id(firebase_uid: str, year: int, month: int) -> str:
+    return f"{firebase_uid}_{year}_{month:02d}"
+
+
+def _signed(entry_type: str, amount: float) -> float:
+    return amount if entry_type == 'income' else -amount
+
+
+def _add_postings(by_month: dict, when: datetime, text: str, transaction_id: str, signed_amount: float):
+    tokens = by_month.setdefault((when.year, when.month), {})
+    for term in search_terms(text):
+        tokens.setdefault(term, {})[transaction_id] = signed_amount
+
+
+class SearchIndex:
+    """Escrita incremental (hook do LedgerWriter) e consulta do índice."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def ledger_hook(self, batch, firebase_uid: str, entries: list, transaction_ids: list[str]):
+        by_month = {}
+        for entry, transaction_id in zip(entries, transaction_ids):
+            when = entry.created_at or datetime.now(timezone.utc)
+            _add_postings(by_month, when, f"{entry.description or ''} {entry.category}", transaction_id, _signed(entry.type, entry.amount))
+        for (year, month), tokens in by_month.items():
+            ref = self.db.collection(POSTINGS_COLLECTION).document(postings_doc_id(firebase_uid, year, month))
+            batch.set(ref, {'userId': firebase_uid, 'year': year, 'month': month, 'tokens': tokens}, merge=True)
+
+    def search(self, firebase_uid: str, query: str, months: list[tuple[int, int]]) -> 'SearchResult':
+        """
+        Transações cujo texto contém TODOS os termos de `query`, nos meses
+        (ano, mês) pedidos. Lê um documento por mês, projetado nos termos.
+        """
+        terms = search_terms(query)
+        result = SearchResult(query=query, terms=terms)
+        if not terms or not months:
+            return result
+
+        refs = [self.db.collection(POSTINGS_COLLECTION).document(postings_doc_id(firebase_uid, y, m)) for y, m in months]
+        field_paths = [f"tokens.`{term}`" for term in terms]
+        with span('firestore.get_all', collection=POSTINGS_COLLECTION, docs=len(refs), terms=len(terms)):
+            snapshots = list(self.db.get_all(refs, field_paths=field_paths))
+
+        for snapshot in snapshots:
+            if not snapshot.exists:
+                continue
+            tokens = (snapshot.to_dict() or {}).get('tokens', {})
+            postings = [tokens.get(term) or {} for term in terms]
+            matched = set(postings[0]).intersection(*postings[1:])
+            for transaction_id in matched:
+                result.add(transaction_id, postings[0][transaction_id])
+        return result
+
+
+@dataclass
+class SearchResult:
+    query: str
+    terms: list[str]
+    transaction_ids: list[str] = field(default_factory=list)
+    total_income: float = 0.0
+    total_expense: float = 0.0
+
+    def add(self, transaction_id: str, signed_amount: float):
+        self.transaction_ids.append(transaction_id)
+        if signed_amount >= 0:
+            self.total_income += signed_amount
+        else:
+            self.total_expense -= signed_amount
+
+    def to_dict(self) -> dict:
+        return {'query': self.query, 'terms': self.terms, 'count': len(self.transaction_ids),
+                'totalIncome': round(self.total_income, 2), 'totalExpense': round(self.total_expense, 2),
+                'transactionIds': self.transaction_ids}
+
+
+def months_back(now: datetime, count: int) -> list[tuple[int, int]]:
+    """Os `count` meses até `now` (inclusive), do mais recente ao mais antigo."""
+    year, month = now.year, now.month
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return months
+
+
+def reindex_user(db, firebase_uid: str) -> int:
+    """Reconstrói o índice de um usuário a partir de todas as suas transações."""
+    q = (db.collection('transactions')
+         .where(filter=FieldFilter('userId', '==', firebase_uid))
+         .select(['type', 'amount', 'category', 'description', 'createdAt']))
+    by_month = {}
+    count = 0
+    for doc in q.stream():
+        t = doc.to_dict()
+        if not t.get('createdAt'):
+            continue
+        _add_postings(by_month, t['createdAt'], f"{t.get('description') or ''} {t.get('category') or ''}", doc.id, _signed(t.get('type'), t.get('amount', 0)))
+        count += 1
+
+    # Substitui (sem merge) para descartar postings de transações apagadas
+    batch = db.batch()
+    for (year, month), tokens in by_month.items():
+        ref = db.collection(POSTINGS_COLLECTION).document(postings_doc_id(firebase_uid, year, month))
+        batch.set(ref, {'userId': firebase_uid, 'year': year, 'month': month, 'tokens': tokens})
+    batch.commit()
+    return count
@@ -0,0 +1,104 @@
+# backend/telegram_client.py
+"""
+Construção da Application do python-telegram-bot.
+
+Só é importado pelo webhook (ver `get_ptb_app` em bot.py), então pode
+importar o `telegram` no topo sem pesar no cold start das outras rotas.
+
+Os clientes HTTPX vivem num event loop próprio, numa thread de fundo que
+dura o processo inteiro: a Application é inicializada uma vez e as conexões
+(keep-alive / HTTP/2) com a API do Telegram são reaproveitadas entre
+invocações do webhook, em vez de abertas e fechadas a cada update.
+
+Configuração:
+- `TELEGRAM_POOL_SIZE`: conexões para as chamadas de saída (sendMessage, editMessageText...);
+- `TELEGRAM_UPDATES_POOL_SIZE`: conexões para o getUpdates (só no modo polling);
+- `TELEGRAM_KEEPALIVE_SECONDS`: tempo que uma conexão ociosa fica no pool;
+- `TELEGRAM_POOL_TIMEOUT`: espera máxima por uma conexão livre;
+- `TELEGRAM_HTTP2`: usa HTTP/2 (o pacote `h2` já está no requirements);
+- `TELEGRAM_API_URL`: base da API (ex.: um servidor falso no tools/soak.py).
+"""
+
+import asyncio
+import os
+import threading
+
+import httpx
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+from outbound import OutboundScheduler
+from profiling import profile_on_loop
+from tracing import span
+
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "16"))
+TELEGRAM_UPDATES_POOL_SIZE = int(os.getenv("TELEGRAM_UPDATES_POOL_SIZE", "1"))
+TELEGRAM_KEEPALIVE_SECONDS = float(os.getenv("TELEGRAM_KEEPALIVE_SECONDS", "30"))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+TELEGRAM_HTTP2 = os.getenv("TELEGRAM_HTTP2", "1").lower() in ("1", "true", "yes")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest que abre um span por chamada à API do Telegram."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        # Só o nome do método (sendMessage, editMessageText...): a URL contém o token
+        with span(f"telegram.{url.rsplit('/', 1)[-1]}", http_method=method):
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+def build_request(pool_size: int, keepalive_seconds: float = TELEGRAM_KEEPALIVE_SECONDS,
+                  http2: bool = TELEGRAM_HTTP2, pool_timeout: float = TELEGRAM_POOL_TIMEOUT) -> TracedHTTPXRequest:
+    """Cria um HTTPXRequest com pool próprio e keep-alive configurável."""
+    return TracedHTTPXRequest(
+        connection_pool_size=pool_size,
+        pool_timeout=pool_timeout,
+        http_version='2' if http2 else '1.1',
+        httpx_kwargs={'limits': httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive_seconds,
+        )},
+    )
+
+
+def build_application(token: str, handlers: list) -> Application:
+    # Pools separados: um update de polling pendurado nunca ocupa a conexão
+    # de uma resposta ao usuário. Toda chamada de saída passa pelo
+    # OutboundScheduler (limites de flood, retry em 429, edições coalescidas).
+    application = (
+        Application.builder()
+        .token(token)
+        .base_url(TELEGRAM_API_URL)
+        .request(build_request(TELEGRAM_POOL_SIZE))
+        .get_updates_request(build_request(TELEGRAM_UPDATES_POOL_SIZE))
+        .rate_limiter(OutboundScheduler())
+        .build()
+    )
+    for handler in handlers:
+        application.add_handler(handler)
+    return application
+
+
+# --- EVENT LOOP PERSISTENTE ---
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='telegram-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run_on_bot_loop(coro, timeout: float | None = None):
+    """
+    Executa a corrotina no loop do bot e espera o resultado.
+    O contexto (contextvars, ex.: o trace atual) de quem chama é propagado.
+    """
+    return asyncio.run_coroutine_threadsafe(profile_on_loop(coro), _get_loop()).result(timeout)
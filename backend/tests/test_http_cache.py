@@ -0,0 +1,47 @@
+# backend/tests/test_http_cache.py
+"""
+ETags das rotas de leitura (http_cache.py) contra o Firestore em memória.
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+from flask import Flask, jsonify
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'tools'))
+
+from data_versions import DataVersions, render_version  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+from http_cache import HTTPCache  # noqa: E402
+
+
+def test_route_body_is_read_under_the_etag_version():
+    versions = DataVersions(FakeFirestore(), max_age=0)
+    http_cache = HTTPCache(versions)
+    app = Flask(__name__)
+
+    @app.route('/api/categories')
+    def get_categories():
+        return read('user-1')
+
+    @http_cache.cached("private, no-cache")
+    def read(uid):
+        # fetch_user_docs inclui render_version() na chave do cache por usuário
+        return jsonify({'version': render_version()})
+
+    client = app.test_client()
+    first = client.get('/api/categories')
+    assert first.json == {'version': 0}
+
+    # Escrita do dashboard: só a versão muda
+    versions.bump('user-1')
+    second = client.get('/api/categories', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.json == {'version': 1}
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert render_version() is None
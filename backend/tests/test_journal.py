@@ -0,0 +1,198 @@
+# backend/tests/test_journal.py
+"""
+Journal do livro-caixa (journal.py) contra o Firestore em memória.
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'tools'))
+
+from balance_counters import BalanceCounters  # noqa: E402
+from data_versions import DataVersions  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+from journal import JOURNALS_COLLECTION, LedgerJournal  # noqa: E402
+from ledger import GoalChange, LedgerEntry, LedgerWriter  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+
+# O limite real do Firestore por lote
+FIRESTORE_MAX_WRITES = 500
+
+
+class CountingFirestore(FakeFirestore):
+    """Guarda o tamanho de cada lote gravado."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def counted():
+            self.batch_sizes.append(len(batch._writes))
+            commit()
+
+        batch.commit = counted
+        return batch
+
+
+def build_writer(db) -> LedgerWriter:
+    """O mesmo LedgerWriter do bot.py: índice de busca, versão dos dados e agregados."""
+    writer = LedgerWriter(db, BalanceCounters(db), rollups=True)
+    writer.hooks.append(SearchIndex(db).ledger_hook)
+    writer.hooks.append(DataVersions(db).ledger_hook)
+    return writer
+
+
+def build_journal(tmp_path, db, **kwargs) -> LedgerJournal:
+    journal = LedgerJournal(str(tmp_path / 'ledger.jsonl'), build_writer(db), journal_id='test', **kwargs)
+    journal._start = lambda: None  # o teste chama flush_once diretamente
+    journal.writer.journal = journal
+    return journal
+
+
+def seed_accounts(db, *account_ids: str):
+    for account_id in account_ids:
+        db.collection('accounts').document(account_id).set({'balance': 0})
+
+
+def expense(amount: float, account_id: str = 'acc-1') -> LedgerEntry:
+    return LedgerEntry('expense', amount, 'mercado', 'compra', account_id=account_id)
+
+
+def flush_all(journal: LedgerJournal, limit: int = 100) -> int:
+    flushed = 0
+    for _ in range(limit):
+        if not journal._pending:
+            return flushed
+        flushed += journal.flush_once()
+    raise AssertionError('o journal não esvaziou')
+
+
+def transactions(db) -> list[dict]:
+    return [doc.to_dict() for doc in db.collection('transactions').stream()]
+
+
+def test_chunk_counts_hook_and_marker_writes(tmp_path):
+    db = CountingFirestore()
+    seed_accounts(db, *(f'acc-{i}' for i in range(150)))
+    journal = build_journal(tmp_path, db, max_writes=FIRESTORE_MAX_WRITES)
+    # Um lançamento por usuário: cada um custa transação, conta, busca, versão e agregado
+    for i in range(150):
+        journal.writer.commit(f'user-{i:03d}', [expense(1.0, account_id=f'acc-{i}')])
+
+    assert flush_all(journal) == 150
+    assert len(db.batch_sizes) > 1
+    assert max(db.batch_sizes) <= FIRESTORE_MAX_WRITES
+    assert len(transactions(db)) == 150
+
+
+def test_replay_after_crash_applies_each_record_once(tmp_path):
+    db = CountingFirestore()
+    seed_accounts(db, 'acc-1')
+    journal = build_journal(tmp_path, db)
+    for amount in (10.0, 20.0, 30.0):
+        journal.writer.commit('user-1', [expense(amount)])
+
+    # Queda entre o commit no Firestore e o checkpoint no arquivo
+    journal._write_line = lambda data: None if 'flushed' in data else LedgerJournal._write_line(journal, data)
+    assert journal.flush_once() == 3
+    journal._file.close()
+
+    restarted = build_journal(tmp_path, db)
+    assert len(restarted._pending) == 3
+    restarted._recover()
+    assert restarted._pending == []
+    assert sorted(t['amount'] for t in transactions(db)) == [10.0, 20.0, 30.0]
+
+    # Um registro aceito e não gravado é reenviado depois de reiniciar
+    restarted.writer.commit('user-1', [expense(40.0)])
+    restarted._file.close()
+    again = build_journal(tmp_path, db)
+    assert [seq for seq, _ in again._pending] == [4]
+    assert flush_all(again) == 1
+    assert sorted(t['amount'] for t in transactions(db)) == [10.0, 20.0, 30.0, 40.0]
+    marker = db.collection(JOURNALS_COLLECTION).document('test').get().to_dict()
+    assert marker['lastSeq'] == 4
+
+
+def test_poison_record_goes_to_dead_letter(tmp_path):
+    db = CountingFirestore()
+    seed_accounts(db, 'acc-1')
+    db.collection('goals').document('goal-1').set({'userId': 'user-1', 'savedAmount': 0})
+    journal = build_journal(tmp_path, db)
+    for i in range(8):
+        uid = f'user-{i}'
+        if i == 5:
+            # Meta apagada pelo dashboard antes do flush: o update falharia para sempre
+            journal.writer.commit(uid, [expense(5.0)], goal_changes=[GoalChange('goal-deleted', 5.0)])
+        else:
+            journal.writer.commit(uid, [expense(1.0)], goal_changes=[GoalChange('goal-1', 1.0)] if i == 0 else ())
+
+    flush_all(journal)
+
+    assert journal._pending == []
+    assert sorted(t['userId'] for t in transactions(db)) == [f'user-{i}' for i in range(8) if i != 5]
+    assert db.collection('goals').document('goal-1').get().to_dict()['savedAmount'] == 1.0
+    with open(journal.dead_letter_path, encoding='utf-8') as f:
+        dead = [json.loads(line) for line in f]
+    assert [(line['seq'], line['uid']) for line in dead] == [(6, 'user-5')]
+    assert 'goal-deleted' in dead[0]['error']
+
+    # Depois de reiniciar, o registro descartado não volta para a fila
+    journal._file.close()
+    assert build_journal(tmp_path, db)._pending == []
+
+
+def test_transient_error_keeps_records_pending(tmp_path):
+    db = CountingFirestore()
+    seed_accounts(db, 'acc-1')
+    journal = build_journal(tmp_path, db)
+    journal.writer.commit('user-1', [expense(1.0)])
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('Firestore indisponível')
+
+    write_records = journal.writer.write_records
+    journal.writer.write_records = unavailable
+    with pytest.raises(ConnectionError):
+        journal.flush_once()
+    assert len(journal._pending) == 1
+    assert not os.path.exists(journal.dead_letter_path)
+
+    journal.writer.write_records = write_records
+    assert flush_all(journal) == 1
+
+
+def test_records_leave_the_queue_before_listeners_run(tmp_path):
+    db = CountingFirestore()
+    seed_accounts(db, 'acc-1')
+    journal = build_journal(tmp_path, db)
+    result = journal.writer.commit('user-1', [expense(7.0)])
+    assert [transaction_id for transaction_id, _ in journal.pending_entries('user-1')] == result.transaction_ids
+
+    seen = []
+
+    def listener(firebase_uid, entries, result, changed):
+        # Já gravado no Firestore: não pode mais ser somado pelo journal
+        seen.append((journal.pending_entries(firebase_uid), journal.pending_balance('acc-1')))
+        raise KeyError('cache indisponível')
+
+    journal.writer.listeners.append(listener)
+    assert journal.flush_once() == 1
+
+    assert seen == [([], 0)]
+    # O erro do listener não faz o lote ser regravado nem descartado
+    assert journal._pending == []
+    assert not os.path.exists(journal.dead_letter_path)
+    assert len(transactions(db)) == 1
@@ -0,0 +1,55 @@
+# backend/tests/test_ledger.py
+"""
+LedgerWriter (ledger.py) contra o Firestore em memória.
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'tools'))
+
+from balance_counters import BalanceCounters  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+from google.api_core.exceptions import AlreadyExists  # noqa: E402
+from ledger import ROLLUPS_COLLECTION, LedgerEntry, LedgerWriter, rollup_doc_id  # noqa: E402
+
+
+def test_fixed_transaction_ids_are_applied_once():
+    db = FakeFirestore()
+    writer = LedgerWriter(db, BalanceCounters(db), rollups=True)
+    when = datetime(2026, 8, 1, 12, tzinfo=timezone.utc)
+    closing = LedgerEntry('income', 150.0, 'saldo anterior', 'Saldo positivo de julho', created_at=when)
+
+    writer.commit('user-1', [closing], transaction_ids=['closing_user-1_2026_07'])
+    # Um worker que assume o shard depois de uma queda tenta lançar de novo
+    with pytest.raises(AlreadyExists):
+        writer.commit('user-1', [closing], transaction_ids=['closing_user-1_2026_07'])
+
+    assert db.collection('transactions').document('closing_user-1_2026_07').get().to_dict()['amount'] == 150.0
+    rollup = db.collection(ROLLUPS_COLLECTION).document(rollup_doc_id('user-1', when)).get().to_dict()
+    assert rollup['income'] == 150.0
+
+
+def test_rollup_category_keys_are_valid_field_names():
+    db = FakeFirestore()
+    writer = LedgerWriter(db, BalanceCounters(db), rollups=True)
+    when = datetime(2026, 9, 10, tzinfo=timezone.utc)
+    writer.commit('user-1', [
+        LedgerEntry('expense', 1.0, None, created_at=when),
+        LedgerEntry('expense', 2.0, '  ', created_at=when),
+        LedgerEntry('expense', 3.0, 'casa.aluguel', created_at=when),
+        LedgerEntry('expense', 4.0, 'luz/água `12`', created_at=when),
+        LedgerEntry('expense', 5.0, '__name__', created_at=when),
+    ])
+
+    rollup = db.collection(ROLLUPS_COLLECTION).document(rollup_doc_id('user-1', when)).get().to_dict()
+    assert rollup['expense'] == 15.0
+    assert rollup['expenseByCategory'] == {'Outros': 3.0, 'casa_aluguel': 3.0, 'luz_água _12_': 4.0, 'name': 5.0}
@@ -0,0 +1,90 @@
+# backend/tests/test_profiling.py
+"""
+Perfil por requisição (profiling.py) das rotas que rodam corrotinas no loop
+do bot (`run_on_bot_loop`).
+
+Uso (a partir de backend/):
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import profiling  # noqa: E402
+from telegram_client import run_on_bot_loop  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_REQUESTS', True)
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    app = Flask(__name__)
+    handled = []
+
+    async def handler():
+        handled.append(sum(i * i for i in range(10000)))
+        return 'ok'
+
+    @app.route('/api/bot', methods=['POST'])
+    @profiling.profiled
+    def bot():
+        return run_on_bot_loop(handler())
+
+    app.handled = handled
+    return app
+
+
+def profile_files(tmp_path) -> list[str]:
+    return sorted(name for name in os.listdir(tmp_path) if name.endswith('.txt'))
+
+
+def test_profiled_coroutine_runs_on_the_bot_loop(app, tmp_path):
+    response = app.test_client().post('/api/bot')
+
+    assert response.status_code == 200 and response.text == 'ok'
+    assert len(app.handled) == 1
+    files = profile_files(tmp_path)
+    if profiling._new_session().all_threads:
+        # O perfil do Flask já vê a thread do loop
+        assert len(files) == 1 and '-loop' not in files[0]
+    else:
+        assert len(files) == 2 and files[0].endswith('-loop.txt')
+
+
+def test_loop_profiler_that_cannot_start_still_runs_the_handler(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling._CProfileSession, 'all_threads', False)
+    new_session = profiling._new_session
+    sessions = []
+
+    def second_fails():
+        session = new_session()
+        if sessions:
+            # O que o Python 3.12 faz com dois cProfile ligados
+            def start():
+                raise ValueError('Another profiling tool is already active')
+            session.start = start
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(profiling, '_new_session', second_fails)
+    response = app.test_client().post('/api/bot')
+
+    assert response.status_code == 200 and response.text == 'ok'
+    assert len(app.handled) == 1
+    assert len(sessions) == 2
+    assert [name for name in profile_files(tmp_path) if '-loop' in name] == []
+
+
+def test_all_threads_profiler_skips_the_loop_session(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling._CProfileSession, 'all_threads', True)
+    response = app.test_client().post('/api/bot')
+
+    assert response.status_code == 200
+    assert len(app.handled) == 1
+    assert [name for name in profile_files(tmp_path) if '-loop' in name] == []
@@ -0,0 +1,388 @@
+# backend/tools/audit_indexes.py
+"""
+Auditoria das consultas ao Firestore e manifesto de índices compostos.
+
+Extrai estaticamente todas as consultas:
+- do backend (backend/*.py): cadeias `.collection(...).where(filter=FieldFilter(...))
+  .order_by(...)`, inclusive as montadas em variáveis (`q = q.where(...)`),
+  e as chamadas a `fetch_user_docs(coleção, uid, campo=valor)`;
+- do dashboard (oikonomos-dashboard/src): `query(collection(db, "x"), where(...),
+  orderBy(...))`, refinamentos `query(q, where(...))` e listas de filtros
+  montadas com `constraints.push(where(...))` (todas as combinações).
+
+Para cada consulta calcula o índice composto que ela exige (igualdades
+primeiro, depois o campo de desigualdade e os de ordenação) e aponta
+consultas que varrem a coleção inteira ou usam vários filtros de intervalo.
+
+Uso (a partir da raiz do repositório):
+    python backend/tools/audit_indexes.py            # confere firestore.indexes.json (CI)
+    python backend/tools/audit_indexes.py --write    # regrava o manifesto
+    python backend/tools/audit_indexes.py --strict   # também falha nos alertas de varredura
+
+Sai com código 1 se alguma consulta precisar de um índice que não está no
+manifesto.
+"""
+
+import argparse
+import ast
+import itertools
+import json
+import os
+import re
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+DASHBOARD_DIR = os.path.join(ROOT_DIR, 'oikonomos-dashboard', 'src')
+MANIFEST_PATH = os.path.join(ROOT_DIR, 'firestore.indexes.json')
+
+EQUALITY_OPS = {'==', 'in', 'array-contains', 'array-contains-any'}
+RANGE_OPS = {'<', '<=', '>', '>=', '!=', 'not-in'}
+QUERY_METHODS = {'where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select', 'start_at', 'start_after',
+                 'end_at', 'end_before', 'stream', 'get', 'on_snapshot'}
+TERMINAL_METHODS = {'stream', 'get', 'on_snapshot'}
+
+
+class Query:
+    """Uma variante de consulta: coleção, filtros [(campo, op)] e ordenações [(campo, direção)]."""
+
+    def __init__(self, collection, filters=(), orders=(), location=''):
+        self.collection = collection
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.location = location
+
+    def extend(self, filters=(), orders=()):
+        return Query(self.collection, self.filters + list(filters), self.orders + list(orders), self.location)
+
+    def key(self):
+        return (self.collection, tuple(sorted(set(self.filters))), tuple(self.orders))
+
+    def describe(self):
+        parts = [f"{f} {op}" for f, op in self.filters] + [f"order_by {f} {d}" for f, d in self.orders]
+        return f"{self.collection}: {', '.join(parts) or '(sem filtros)'}"
+
+
+# --- BACKEND (ast) ---
+def module_constants(trees) -> dict:
+    """Constantes de módulo (NOME = 'texto') de todos os arquivos, para resolver `SHARDS_FIELD` etc."""
+    constants = {}
+    for tree in trees.values():
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        constants[target.id] = node.value.value
+    return constants
+
+
+def _const(node, constants):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    return None
+
+
+def _where_filter(call, constants):
+    """(campo, op) de `.where(filter=FieldFilter(c, op, v))` ou `.where(c, op, v)`."""
+    args = call.args
+    for keyword in call.keywords:
+        if keyword.arg == 'filter' and isinstance(keyword.value, ast.Call):
+            args = keyword.value.args
+    if len(args) >= 2:
+        field, op = _const(args[0], constants), _const(args[1], constants)
+        if field and op:
+            return field, op
+    return None
+
+
+def _order(call, constants):
+    if not call.args:
+        return None
+    field = _const(call.args[0], constants)
+    direction = 'DESCENDING' if 'DESCENDING' in ast.unparse(call) else 'ASCENDING'
+    return (field, direction) if field else None
+
+
+def _chain(node, variables, constants, location):
+    """Variantes de consulta que uma expressão representa, ou None se não for consulta."""
+    if isinstance(node, ast.Name):
+        return variables.get(node.id)
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+        return None
+    method = node.func.attr
+    if method == 'collection':
+        name = _const(node.args[0], constants) if node.args else None
+        return [Query(name, location=location)] if name else None
+    if method not in QUERY_METHODS:
+        return None
+    inner = _chain(node.func.value, variables, constants, location)
+    if inner is None:
+        return None
+    if method == 'where':
+        flt = _where_filter(node, constants)
+        return [q.extend(filters=[flt]) for q in inner] if flt else inner
+    if method == 'order_by':
+        order = _order(node, constants)
+        return [q.extend(orders=[order]) for q in inner] if order else inner
+    return inner
+
+
+def _root_name(node):
+    while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        node = node.func.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def backend_queries(paths) -> list[Query]:
+    trees = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            trees[path] = ast.parse(f.read(), path)
+    constants = module_constants(trees)
+
+    queries = []
+    for path, tree in trees.items():
+        rel = os.path.relpath(path, ROOT_DIR)
+        scopes = [tree] + [n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        for scope in scopes:
+            variables = {}
+            nodes = sorted((n for n in ast.walk(scope) if isinstance(n, (ast.Assign, ast.Call))),
+                           key=lambda n: (n.lineno, n.col_offset))
+            for node in nodes:
+                location = f"{rel}:{node.lineno}"
+                if isinstance(node, ast.Assign):
+                    if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+                        continue
+                    name = node.targets[0].id
+                    variants = _chain(node.value, variables, constants, location)
+                    if variants is None:
+                        continue
+                    # `q = q.where(...)` (em if/for): a consulta pode sair com ou sem o refinamento
+                    previous = variables.get(name, []) if _root_name(node.value) == name else []
+                    variables[name] = previous + variants
+                    queries.extend(variants)
+                elif isinstance(node.func, ast.Attribute) and node.func.attr in TERMINAL_METHODS:
+                    queries.extend(_chain(node, variables, constants, location) or [])
+                elif isinstance(node.func, ast.Name) and node.func.id == 'fetch_user_docs' and node.args:
+                    collection = _const(node.args[0], constants)
+                    if collection:
+                        fields = [('userId', '==')] + [(kw.arg, '==') for kw in node.keywords if kw.arg]
+                        queries.append(Query(collection, fields, location=location))
+    return queries
+
+
+# --- DASHBOARD (texto) ---
+def _balanced(text, start):
+    """Conteúdo entre o '(' em `start` e o ')' correspondente."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] in '([{':
+            depth += 1
+        elif text[i] in ')]}':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i]
+    return text[start + 1:]
+
+
+def _split_args(text):
+    args, depth, current, quote = [], 0, '', None
+    for ch in text:
+        if quote:
+            current += ch
+            if ch == quote:
+                quote = None
+            continue
+        if ch in '"\'`':
+            quote = ch
+        elif ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        current += ch
+    if current.strip():
+        args.append(current.strip())
+    return args
+
+
+WHERE_JS = re.compile(r'^where\(\s*["\']([\w.]+)["\']\s*,\s*["\']([^"\']+)["\']')
+ORDER_JS = re.compile(r'^orderBy\(\s*["\']([\w.]+)["\'](?:\s*,\s*["\'](asc|desc)["\'])?')
+COLLECTION_JS = re.compile(r'^collection\(\s*\w+\s*,\s*["\']([\w-]+)["\']\s*\)$')
+
+
+def _constraint(arg):
+    m = WHERE_JS.match(arg)
+    if m:
+        return ('filter', (m.group(1), m.group(2)))
+    m = ORDER_JS.match(arg)
+    if m:
+        return ('order', (m.group(1), 'DESCENDING' if m.group(2) == 'desc' else 'ASCENDING'))
+    return None
+
+
+def _spread_variants(text, name):
+    """Combinações dos filtros de uma lista `const name = [...]` + `name.push(...)` condicionais."""
+    base = []
+    m = re.search(rf'\b{name}\s*=\s*\[', text)
+    if m:
+        base = [c for c in map(_constraint, _split_args(_balanced(text, m.end() - 1))) if c]
+    optional = [c for c in (_constraint(_balanced(text, m.end() - 1).strip())
+                            for m in re.finditer(rf'\b{name}\.push\(', text)) if c]
+    return [base + list(combo) for r in range(len(optional) + 1) for combo in itertools.combinations(optional, r)]
+
+
+def dashboard_queries(paths) -> list[Query]:
+    queries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        rel = os.path.relpath(path, ROOT_DIR)
+        named = {}
+        for m in re.finditer(r'(?:\b(\w+)\s*=\s*)?\bquery\(', text):
+            args = _split_args(_balanced(text, m.end() - 1))
+            if not args:
+                continue
+            location = f"{rel}:{text.count(chr(10), 0, m.start()) + 1}"
+            collection = COLLECTION_JS.match(args[0])
+            if collection:
+                bases = [Query(collection.group(1), location=location)]
+            elif args[0] in named:
+                bases = named[args[0]]
+            else:
+                continue
+
+            variants = [[]]
+            for arg in args[1:]:
+                if arg.startswith('...'):
+                    variants = [v + extra for v in variants for extra in _spread_variants(text, arg[3:])]
+                else:
+                    c = _constraint(arg)
+                    if c:
+                        variants = [v + [c] for v in variants]
+
+            results = []
+            for base in bases:
+                for variant in variants:
+                    results.append(base.extend(filters=[x for kind, x in variant if kind == 'filter'],
+                                               orders=[x for kind, x in variant if kind == 'order']))
+            target = m.group(1)
+            if target:
+                # `q = query(q, where(...))` dentro de um if: vale com e sem o refinamento
+                named[target] = (named.get(target, []) if args[0] == target else []) + results
+            queries.extend(results)
+    return queries
+
+
+# --- ANÁLISE ---
+def required_index(query: Query):
+    """Campos do índice composto exigido pela consulta, ou None se bastam os índices simples."""
+    eq = sorted({f for f, op in query.filters if op in EQUALITY_OPS})
+    ranged = list(dict.fromkeys(f for f, op in query.filters if op in RANGE_OPS))
+    order_fields = [f for f, _ in query.orders]
+    fields = set(eq) | set(ranged) | set(order_fields)
+    if not (ranged or query.orders) or len(fields) < 2:
+        return None
+
+    index = []
+    for field in eq:
+        op = next(op for f, op in query.filters if f == field)
+        index.append({'fieldPath': field, 'arrayConfig': 'CONTAINS'} if op.startswith('array-contains')
+                     else {'fieldPath': field, 'order': 'ASCENDING'})
+    direction = dict(query.orders)
+    for field in ranged:
+        if field not in direction:
+            index.append({'fieldPath': field, 'order': 'ASCENDING'})
+    for field, order in query.orders:
+        if field not in eq:
+            index.append({'fieldPath': field, 'order': order})
+    return {'collectionGroup': query.collection, 'queryScope': 'COLLECTION', 'fields': index}
+
+
+def scan_warnings(query: Query) -> list[str]:
+    warnings = []
+    ops = [op for _, op in query.filters]
+    ranged = {f for f, op in query.filters if op in RANGE_OPS}
+    if not query.filters and not query.orders:
+        warnings.append("lê a coleção inteira")
+    elif not any(op in EQUALITY_OPS for op in ops) and ranged:
+        warnings.append("filtro de intervalo sem igualdade: varre a faixa de TODOS os usuários")
+    if len(ranged) > 1:
+        warnings.append(f"desigualdade em vários campos ({', '.join(sorted(ranged))}): só o primeiro limita a leitura")
+    if any(op in ('!=', 'not-in') for op in ops):
+        warnings.append("filtro de negação (!= / not-in) lê quase todo o índice")
+    return warnings
+
+
+def index_key(index):
+    return json.dumps([index['collectionGroup'], index['fields']], sort_keys=True)
+
+
+def source_files():
+    backend = sorted(os.path.join(BACKEND_DIR, n) for n in os.listdir(BACKEND_DIR) if n.endswith('.py'))
+    dashboard = sorted(os.path.join(dirpath, n) for dirpath, _, names in os.walk(DASHBOARD_DIR)
+                       for n in names if n.endswith(('.js', '.jsx')))
+    return backend, dashboard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--write', action='store_true', help="regrava firestore.indexes.json com os índices exigidos")
+    parser.add_argument('--strict', action='store_true', help="falha também nos alertas de varredura larga")
+    args = parser.parse_args()
+
+    backend, dashboard = source_files()
+    queries = backend_queries(backend) + dashboard_queries(dashboard)
+
+    unique = {}
+    for query in queries:
+        unique.setdefault(query.key(), []).append(query)
+
+    required = {}
+    warnings = []
+    for variants in unique.values():
+        query = variants[0]
+        index = required_index(query)
+        if index:
+            required.setdefault(index_key(index), (index, []))[1].extend(q.location for q in variants)
+        for warning in scan_warnings(query):
+            warnings.append((query, warning, sorted({q.location for q in variants})))
+
+    manifest = {'indexes': [], 'fieldOverrides': []}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            manifest = json.load(f)
+    declared = {index_key(i) for i in manifest.get('indexes', [])}
+
+    print(f"{len(unique)} consultas distintas ({len(queries)} ocorrências); {len(required)} índices compostos exigidos.")
+    for query, warning, locations in warnings:
+        print(f"ALERTA {query.describe()} -> {warning}\n    em {', '.join(locations)}")
+
+    if args.write:
+        indexes = {index_key(i): i for i in manifest.get('indexes', [])}
+        indexes.update({key: index for key, (index, _) in required.items()})
+        manifest['indexes'] = [indexes[k] for k in sorted(indexes)]
+        with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"{os.path.relpath(MANIFEST_PATH, ROOT_DIR)} gravado com {len(manifest['indexes'])} índices.")
+        return
+
+    missing = [(index, locations) for key, (index, locations) in required.items() if key not in declared]
+    for index, locations in missing:
+        fields = ', '.join(f"{f['fieldPath']} {f.get('order', f.get('arrayConfig'))}" for f in index['fields'])
+        print(f"FALTA ÍNDICE {index['collectionGroup']} ({fields})\n    em {', '.join(sorted(set(locations)))}")
+
+    if missing or (args.strict and warnings):
+        print("FALHOU: rode com --write e faça o deploy com `firebase deploy --only firestore:indexes`.")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
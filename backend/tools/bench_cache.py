@@ -0,0 +1,101 @@
+# backend/tools/bench_cache.py
+"""
+Benchmark dos backends de cache (cache.py) com vários processos.
+
+Simula N workers lendo as categorias de um conjunto de usuários, com uma
+leitura "do Firestore" de latência fixa a cada miss, e intercala escritas
+que chamam `bump`. Mede, por backend, a taxa de acerto somando todos os
+workers (o que importa com vários processos), o tempo médio por leitura e
+as leituras obsoletas (valor anterior a uma escrita já concluída), que
+devem ser zero.
+
+Uso (a partir de backend/):
+    python tools/bench_cache.py [--workers 4] [--users 100] [--reads 2000]
+                                [--redis-url redis://127.0.0.1:6379/0]
+
+Sem `--redis-url` o backend Redis é pulado.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import UserCache, build_backend  # noqa: E402
+
+FIRESTORE_LATENCY = 0.004
+
+
+def worker(backend_name: str, url: str, users: int, reads: int, write_ratio: float, seed: int, results):
+    cache = UserCache(build_backend(backend_name, url), prefix=f"bench{os.getppid()}")
+    backend = cache.backend
+    rng = random.Random(seed)
+    stale = 0
+    started = time.perf_counter()
+    for _ in range(reads):
+        uid = f"user{rng.randrange(users)}"
+        if rng.random() < write_ratio:
+            # "Escrita": avança a verdade (guardada no próprio backend), invalida
+            # e só então marca a escrita como concluída
+            now = str(time.time_ns()).encode()
+            backend.set(f"truth:{uid}", now, 3600)
+            cache.bump(uid, 'categories')
+            backend.set(f"done:{uid}", now, 3600)
+            continue
+
+        def load():
+            time.sleep(FIRESTORE_LATENCY)
+            return {'truth': int(backend.get(f"truth:{uid}") or 0)}
+
+        # Obsoleta = mais antiga que uma escrita concluída antes da leitura começar
+        done = int(backend.get(f"done:{uid}") or 0)
+        if cache.get_or_load(uid, 'categories', 'type=expense', load)['truth'] < done:
+            stale += 1
+    results.put((cache.hits, cache.misses, stale, time.perf_counter() - started))
+
+
+def run(backend_name: str, url: str, args) -> dict:
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(backend_name, url, args.users, args.reads, args.write_ratio, seed, results))
+                 for seed in range(args.workers)]
+    for p in processes:
+        p.start()
+    outcomes = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    hits = sum(o[0] for o in outcomes)
+    misses = sum(o[1] for o in outcomes)
+    return {
+        'hit_rate': hits / max(1, hits + misses),
+        'ms_per_read': 1000 * sum(o[3] for o in outcomes) / max(1, hits + misses),
+        'stale': sum(o[2] for o in outcomes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--write-ratio', type=float, default=0.02)
+    parser.add_argument('--redis-url')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [('memory', ''), ('sqlite', os.path.join(tmp, 'cache.sqlite'))]
+        if args.redis_url:
+            backends.append(('redis', args.redis_url))
+        print(f"{args.workers} workers, {args.users} usuários, {args.reads} operações por worker, "
+              f"{args.write_ratio:.0%} escritas, Firestore simulado com {FIRESTORE_LATENCY * 1000:.0f} ms")
+        for name, url in backends:
+            stats = run(name, url, args)
+            print(f"{name:>7}: acerto {stats['hit_rate']:6.1%}  {stats['ms_per_read']:6.3f} ms/leitura  obsoletas {stats['stale']}")
+
+
+if __name__ == '__main__':
+    main()
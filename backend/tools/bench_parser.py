@@ -0,0 +1,130 @@
+# backend/tools/bench_parser.py
+"""
+Microbenchmark da gramática de comandos (command_parser.py).
+
+Compara o roteamento antigo (regex compilada a cada chamada, normalização sem
+cache e busca de categoria testando todos os prefixos) com o parser
+pré-compilado e a trie de categorias, usando um corpus com o formato real
+das mensagens.
+
+Uso (a partir de backend/):
+    python tools/bench_parser.py [--repeat 2000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_parser import CategoryIndex, parse_command, parse_quick_transaction, split_amount, tokenize  # noqa: E402
+
+CORPUS = [
+    "35 mercado",
+    "12,50 almoço restaurante do centro",
+    "89.90 farmácia remédio da vovó",
+    "+ 3500 salário",
+    "+150 freelance site do João",
+    "*+ 200 rendimentos poupança",
+    "*renda 1200 salário adiantamento",
+    "* 18 transporte uber para o trabalho",
+    "guardar 100 fundo de emergência",
+    "sacar 50 viagem para salário",
+    "pagar aluguel",
+    "transferir 300 da nubank para inter",
+    "ver orçamentos",
+    "ver gastos hoje categorizado",
+    "ver contas pendentes",
+    "?",
+]
+
+EXPENSE_CATEGORIES = ["Mercado", "Almoço", "Farmácia", "Transporte", "Lazer", "Contas de Casa", "Educação"]
+INCOME_CATEGORIES = ["Salário", "Freelance", "Rendimentos Poupança", "Vendas"]
+
+
+def legacy_normalize(text):
+    if not text: return ""
+    text = unicodedata.normalize('NFD', text)
+    text = text.encode('ascii', 'ignore')
+    text = text.decode("utf-8")
+    return text.lower()
+
+
+def legacy_route(text):
+    """Reproduz o caminho antigo de `handle_message` + validação de categoria."""
+    text = text.strip()
+    if text.startswith('*'):
+        rest = text[1:].lstrip()
+        if rest.startswith('+') or rest.lower().startswith('renda'):
+            return legacy_income(rest.lstrip('+').split()[1:] if rest.startswith('renda') else rest[1:].split())
+        return legacy_expense(rest)
+    parts = text.split()
+    command = parts[0].lower()
+    if command in ['?', 'ajuda', 'ver', 'guardar', 'sacar', 'pagar', 'transferir']:
+        return command
+    if command.startswith('+'):
+        return legacy_income(([command.lstrip('+')] if command != '+' else []) + parts[1:])
+    return legacy_expense(" ".join(parts))
+
+
+def legacy_expense(text):
+    original = [name.strip() for name in EXPENSE_CATEGORIES]
+    normalized = [legacy_normalize(name) for name in original]
+    match = re.match(r"^\s*(\d+[\.,]?\d*)\s+([\w\sáàâãéèêíïóôõöúçñ]+?)(?:\s+(.+))?$", text)
+    if not match:
+        return None
+    category = legacy_normalize(match.group(2).strip())
+    return original[normalized.index(category)] if category in normalized else None
+
+
+def legacy_income(parts):
+    original = [name.strip() for name in INCOME_CATEGORIES]
+    normalized = [legacy_normalize(name) for name in original]
+    words = parts[1:]
+    for i in range(len(words), 0, -1):
+        candidate = legacy_normalize(" ".join(words[:i]))
+        if candidate in normalized:
+            return original[normalized.index(candidate)]
+    return None
+
+
+EXPENSE_INDEX = CategoryIndex(EXPENSE_CATEGORIES)
+INCOME_INDEX = CategoryIndex(INCOME_CATEGORIES)
+
+
+def compiled_route(text):
+    """O mesmo trabalho usando o parser pré-compilado."""
+    command = parse_command(text)
+    if command.verb == '*':
+        is_income, parts = parse_quick_transaction(command.text)
+        if is_income:
+            return INCOME_INDEX.match_prefix(parts[1:])[0]
+        return compiled_expense(" ".join(parts))
+    if command.verb == '+':
+        return INCOME_INDEX.match_prefix(command.args[1:])[0]
+    if command.verb is None:
+        return compiled_expense(command.text)
+    return command.verb
+
+
+def compiled_expense(text):
+    match = split_amount(tokenize(text))
+    return EXPENSE_INDEX.resolve(match[1])[0] if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=2000, help="passagens pelo corpus por medição")
+    args = parser.parse_args()
+
+    messages = len(CORPUS) * args.repeat
+    for name, route in (("antigo", legacy_route), ("pré-compilado", compiled_route)):
+        seconds = min(timeit.repeat(lambda: [route(m) for m in CORPUS], number=args.repeat, repeat=5))
+        print(f"{name:>14}: {seconds / messages * 1e6:7.2f} µs/mensagem ({messages} mensagens)")
+
+
+if __name__ == '__main__':
+    main()
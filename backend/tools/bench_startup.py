@@ -0,0 +1,113 @@
+# backend/tools/bench_startup.py
+"""
+Mede o custo de cold start de bot.py e falha se passar do orçamento.
+
+1. `python -X importtime -c "import bot"` num processo novo: tempo total de
+   import e os módulos mais caros.
+2. Num outro processo novo, a primeira requisição a rotas que não deveriam
+   carregar o Telegram (/favicon.ico, /, /api/cron sem autorização).
+3. Verifica que `telegram` e `firebase_admin` não foram importados por
+   essas rotas.
+
+Uso (a partir de backend/):
+    python tools/bench_startup.py [--import-budget-ms 400] [--request-budget-ms 150] [--runs 1]
+
+Com `--runs N` cada medida é repetida em N processos novos e vale a menor
+(descarta ruído da máquina, não regressões). Sai com código 1 se algum
+orçamento for estourado; o CI roda assim em
+.github/workflows/startup-budget.yml.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que as rotas leves nunca devem carregar
+HEAVY_MODULES = ('telegram', 'telegram.ext', 'firebase_admin', 'google.cloud.firestore')
+
+FIRST_REQUEST_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import bot
+import_ms = (time.perf_counter() - t0) * 1000
+client = bot.app.test_client()
+timings = {}
+for path in ('/favicon.ico', '/', '/api/cron'):
+    t1 = time.perf_counter()
+    client.get(path)
+    timings[path] = (time.perf_counter() - t1) * 1000
+heavy = [m for m in %r if m in sys.modules]
+print(json.dumps({'import_ms': import_ms, 'requests_ms': timings, 'heavy_loaded': heavy}))
+"""
+
+
+def run_python(args, env=None):
+    return subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, capture_output=True, text=True, env=env)
+
+
+def measure_importtime(top: int):
+    """Devolve (total em ms, [(ms cumulativo, módulo)]) a partir de -X importtime."""
+    proc = run_python(['-X', 'importtime', '-c', 'import bot'])
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "falha ao importar bot.py")
+
+    # Formato: "import time: <self us> | <cumulative us> | <indentação><módulo>"
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us) / 1000, name.strip()))
+    total = next(ms for ms, name in rows if name == 'bot')
+    return total, sorted(rows, reverse=True)[:top]
+
+
+def measure_first_request():
+    env = dict(os.environ, CRON_SECRET=os.environ.get('CRON_SECRET', 'bench-secret'))
+    proc = run_python(['-c', FIRST_REQUEST_SCRIPT % (HEAVY_MODULES,)], env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "falha na primeira requisição")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--import-budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', 400)))
+    parser.add_argument('--request-budget-ms', type=float, default=float(os.getenv('FIRST_REQUEST_BUDGET_MS', 150)))
+    parser.add_argument('--top', type=int, default=10, help="quantos módulos mais caros listar")
+    parser.add_argument('--runs', type=int, default=1, help="repetições de cada medida (vale a menor)")
+    args = parser.parse_args()
+
+    failures = []
+
+    total_ms, slowest = min((measure_importtime(args.top) for _ in range(args.runs)), key=lambda m: m[0])
+    print(f"import bot: {total_ms:.1f} ms (orçamento {args.import_budget_ms:.0f} ms)")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+    if total_ms > args.import_budget_ms:
+        failures.append(f"import levou {total_ms:.1f} ms")
+
+    runs = [measure_first_request() for _ in range(args.runs)]
+    first = {
+        'requests_ms': {path: min(run['requests_ms'][path] for run in runs) for path in runs[0]['requests_ms']},
+        'heavy_loaded': sorted({module for run in runs for module in run['heavy_loaded']}),
+    }
+    for path, ms in first['requests_ms'].items():
+        print(f"primeira requisição {path}: {ms:.1f} ms (orçamento {args.request_budget_ms:.0f} ms)")
+        if ms > args.request_budget_ms:
+            failures.append(f"{path} levou {ms:.1f} ms")
+    if first['heavy_loaded']:
+        failures.append(f"módulos pesados carregados por rotas leves: {', '.join(first['heavy_loaded'])}")
+
+    if failures:
+        print("FALHOU: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
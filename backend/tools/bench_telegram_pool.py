@@ -0,0 +1,137 @@
+# backend/tools/bench_telegram_pool.py
+"""
+Mede a vazão de mensagens de saída do bot contra um servidor Telegram falso.
+
+O servidor local (HTTP/1.1 com keep-alive) responde getMe e sendMessage com
+uma latência artificial, simulando o RTT até a API. São comparados:
+
+1. `por-update`: o padrão antigo do webhook, com initialize()/shutdown() do
+   Bot a cada update num `asyncio.run` novo (pool recriado toda vez);
+2. `pool`: um Bot inicializado uma vez, com o pool de `build_request`
+   reaproveitado por todos os updates.
+
+Uso (a partir de backend/):
+    python tools/bench_telegram_pool.py [--updates 200] [--messages-per-update 2] [--latency-ms 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot  # noqa: E402
+
+from telegram_client import build_request  # noqa: E402
+
+FAKE_TOKEN = '123456:bench'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        method = self.path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = BOT_USER
+        else:
+            result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}, 'text': 'ok'}
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(latency_ms: float):
+    FakeTelegramHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/bot"
+
+
+def make_bot(base_url: str, pool_size: int) -> Bot:
+    # HTTP/2 exige TLS; o servidor falso é HTTP/1.1 puro
+    return Bot(FAKE_TOKEN, base_url=base_url, request=build_request(pool_size, http2=False))
+
+
+async def send_update(bot: Bot, messages: int):
+    for i in range(messages):
+        await bot.send_message(chat_id=1, text=f"mensagem {i}")
+
+
+def bench_per_update(base_url: str, updates: int, messages: int, pool_size: int) -> float:
+    async def one_update():
+        bot = make_bot(base_url, pool_size)
+        await bot.initialize()
+        await send_update(bot, messages)
+        await bot.shutdown()
+
+    started = time.perf_counter()
+    for _ in range(updates):
+        asyncio.run(one_update())
+    return time.perf_counter() - started
+
+
+def bench_pooled(base_url: str, updates: int, messages: int, pool_size: int, concurrency: int) -> float:
+    async def run():
+        bot = make_bot(base_url, pool_size)
+        await bot.initialize()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one_update():
+            async with semaphore:
+                await send_update(bot, messages)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_update() for _ in range(updates)))
+        elapsed = time.perf_counter() - started
+        await bot.shutdown()
+        return elapsed
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--messages-per-update', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--pool-size', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="updates simultâneos no modo pool (1 = igual ao webhook serial)")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.latency_ms)
+    total = args.updates * args.messages_per_update
+    try:
+        for label, bench in (
+            ('por-update', lambda: bench_per_update(base_url, args.updates, args.messages_per_update, args.pool_size)),
+            ('pool', lambda: bench_pooled(base_url, args.updates, args.messages_per_update, args.pool_size, args.concurrency)),
+        ):
+            FakeTelegramHandler.connections = set()
+            elapsed = bench()
+            print(f"{label:>10}: {total / elapsed:8.1f} msg/s  "
+                  f"{elapsed * 1000 / args.updates:7.2f} ms/update  "
+                  f"{len(FakeTelegramHandler.connections):4d} conexões TCP")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+# backend/tools/fake_firestore.py
+"""
+Firestore em memória para testes de carga locais (ver tools/soak.py).
+
+Implementa o subconjunto da API do cliente usado pelo backend:
+`collection().document()` com get/create/set(merge)/update/delete, subcoleções,
+`add`, consultas com `where(filter=FieldFilter(...))`, `order_by`, `limit`,
+`select` e `stream`, lotes (`batch`), `bulk_writer`, `get_all` com
+`field_paths` e as transformações `Increment`, `SERVER_TIMESTAMP` e
+`DELETE_FIELD`.
+
+Consultas com igualdade em `userId` usam um índice secundário, para que o
+custo não cresça com o número total de usuários. `latency_ms` adiciona um
+atraso artificial a cada ida ao "servidor".
+
+Os documentos ficam serializados (pickle): cada leitura devolve uma cópia,
+como no cliente real, e o volume de dados não aparece na contagem de objetos
+do `gc` (bytes não são rastreados). `stored_bytes` estima esse volume (documento,
+id e entradas nos dicionários), para o soak descontá-lo do crescimento da
+memória. Datas sem fuso nos filtros são
+tratadas como UTC, como faz o cliente real.
+"""
+
+import copy
+import itertools
+import pickle
+import random
+import string
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.transforms import Increment, Sentinel
+
+INDEXED_FIELD = 'userId'
+# Entrada no dicionário da coleção e no índice (e sobra do malloc), além do
+# documento e do id: calibrado contra o RSS com 100 mil documentos
+_ENTRY_OVERHEAD = 128
+_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def _new_id() -> str:
+    return ''.join(random.choices(_ID_ALPHABET, k=20))
+
+
+def _resolve(value, current):
+    """Aplica transformações (Increment, SERVER_TIMESTAMP) sobre o valor atual."""
+    if isinstance(value, Increment):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if isinstance(value, Sentinel) and 'server timestamp' in value.description:
+        return datetime.now(timezone.utc)
+    if isinstance(value, dict):
+        base = current if isinstance(current, dict) else {}
+        return {k: _resolve(v, base.get(k)) for k, v in value.items() if not _is_delete(v)}
+    return value
+
+
+def _is_delete(value) -> bool:
+    return isinstance(value, Sentinel) and 'delete' in value.description
+
+
+def _merge(target: dict, data: dict):
+    for key, value in data.items():
+        if _is_delete(value):
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = _resolve(value, target.get(key))
+
+
+def _split_path(field_path: str) -> list[str]:
+    """`tokens.\\`ifood\\`` -> ['tokens', 'ifood']"""
+    parts, current, quoted = [], '', False
+    for char in field_path:
+        if char == '`':
+            quoted = not quoted
+        elif char == '.' and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+def _get_path(data: dict, field_path: str):
+    value = data
+    for part in _split_path(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _set_path(data: dict, field_path: str, value):
+    parts = _split_path(field_path)
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if _is_delete(value):
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = _resolve(value, data.get(parts[-1]))
+
+
+def _project(data: dict, field_paths: list[str]) -> dict:
+    projected = {}
+    for field_path in field_paths:
+        value = _get_path(data, field_path)
+        if value is not None:
+            _set_path(projected, field_path, copy.deepcopy(value))
+    return projected
+
+
+def _as_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _comparable(a, b) -> bool:
+    return type(a) is type(b) or (isinstance(a, (int, float)) and isinstance(b, (int, float)))
+
+
+def _matches(data: dict, field_path: str, op: str, expected) -> bool:
+    value = _as_utc(_get_path(data, field_path))
+    expected = [_as_utc(v) for v in expected] if op in ('in', 'not-in') else _as_utc(expected)
+    if op == '==':
+        return value == expected
+    if op == '!=':
+        return value is not None and value != expected
+    if op == 'in':
+        return value in expected
+    if op == 'not-in':
+        return value is not None and value not in expected
+    if op == 'array_contains':
+        return isinstance(value, list) and expected in value
+    if value is None or not _comparable(value, expected):
+        return False
+    return {'<': value < expected, '<=': value <= expected, '>': value > expected, '>=': value >= expected}[op]
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data: dict | None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        return copy.deepcopy(_get_path(self._data or {}, field_path))
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path: tuple):
+        self._client = client
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name: str) -> 'FakeCollection':
+        return FakeCollection(self._client, self.path + (name,))
+
+    def get(self, field_paths=None) -> FakeSnapshot:
+        self._client._round_trip()
+        data = self._client._read(self.path)
+        if data is not None and field_paths:
+            data = _project(data, field_paths)
+        return FakeSnapshot(self, data)
+
+    def create(self, data: dict):
+        self._client._round_trip()
+        self._client._apply([('create', self.path, data, False)])
+
+    def set(self, data: dict, merge: bool = False):
+        self._client._round_trip()
+        self._client._apply([('set', self.path, data, merge)])
+
+    def update(self, data: dict):
+        self._client._round_trip()
+        self._client._apply([('update', self.path, data, False)])
+
+    def delete(self):
+        self._client._round_trip()
+        self._client._apply([('delete', self.path, None, False)])
+
+
+class FakeQuery:
+    def __init__(self, client, path: tuple, filters=(), order=(), limit_count=None, fields=None):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit_count
+        self._fields = fields
+
+    def _copy(self, **changes) -> 'FakeQuery':
+        state = {'filters': self._filters, 'order': self._order, 'limit_count': self._limit, 'fields': self._fields}
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None) -> 'FakeQuery':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING') -> 'FakeQuery':
+        return self._copy(order=self._order + [(field_path, direction)])
+
+    def limit(self, count: int) -> 'FakeQuery':
+        return self._copy(limit_count=count)
+
+    def select(self, field_paths) -> 'FakeQuery':
+        return self._copy(fields=list(field_paths))
+
+    def stream(self):
+        self._client._round_trip()
+        rows = self._client._scan(self._path, self._filters)
+        for field_path, direction in reversed(self._order):
+            rows.sort(key=lambda row: (_get_path(row[1], field_path) is None, _get_path(row[1], field_path)),
+                      reverse=str(direction).upper().startswith('DESC'))
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            ref = FakeDocumentReference(self._client, self._path + (doc_id,))
+            yield FakeSnapshot(ref, _project(data, self._fields) if self._fields is not None else data)
+
+    def get(self) -> list[FakeSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path: tuple):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    def document(self, doc_id: str | None = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._path + (doc_id or _new_id(),))
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+    def stream(self):
+        yield from FakeQuery(self._client, self._path, self._filters, self._order, self._limit, self._fields).stream()
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def create(self, ref, data: dict):
+        self._writes.append(('create', ref.path, data, False))
+
+    def set(self, ref, data: dict, merge: bool = False):
+        self._writes.append(('set', ref.path, data, merge))
+
+    def update(self, ref, data: dict):
+        self._writes.append(('update', ref.path, data, False))
+
+    def delete(self, ref):
+        self._writes.append(('delete', ref.path, None, False))
+
+    def commit(self):
+        self._client._round_trip()
+        self._client._apply(self._writes)
+        self._writes = []
+
+
+class FakeBulkWriter(FakeWriteBatch):
+    """Aplica as escritas em lotes ao chamar `flush`/`close`."""
+
+    def flush(self):
+        self.commit()
+
+    def close(self):
+        self.commit()
+
+
+class FakeFirestore:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self._lock = threading.RLock()
+        # caminho da coleção -> {doc_id: dados serializados}
+        self._collections = {}
+        self.stored_bytes = 0
+        # caminho da coleção -> {valor de userId: {doc_id}}
+        self._index = {}
+        self.reads = 0
+        self.writes = 0
+        self._op_counter = itertools.count()
+
+    # --- API pública (a do cliente real) ---
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, (name,))
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def bulk_writer(self) -> FakeBulkWriter:
+        return FakeBulkWriter(self)
+
+    def get_all(self, refs, field_paths=None):
+        self._round_trip()
+        for ref in refs:
+            data = self._read(ref.path)
+            if data is not None and field_paths:
+                data = _project(data, field_paths)
+            yield FakeSnapshot(ref, data)
+
+    # --- introspecção para o harness ---
+    def size(self) -> dict[str, int]:
+        with self._lock:
+            return {'/'.join(path): len(docs) for path, docs in self._collections.items()}
+
+    # --- internos ---
+    def _round_trip(self):
+        next(self._op_counter)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _read(self, path: tuple) -> dict | None:
+        with self._lock:
+            self.reads += 1
+            data = self._collections.get(path[:-1], {}).get(path[-1])
+        return pickle.loads(data) if data is not None else None
+
+    def _scan(self, path: tuple, filters: list) -> list[tuple[str, dict]]:
+        with self._lock:
+            docs = self._collections.get(path, {})
+            candidates = docs.keys()
+            for field_path, op, value in filters:
+                if field_path == INDEXED_FIELD and op == '==':
+                    candidates = self._index.get(path, {}).get(value, set())
+                    break
+            candidates = [(doc_id, docs[doc_id]) for doc_id in candidates if doc_id in docs]
+        rows = []
+        for doc_id, raw in candidates:
+            data = pickle.loads(raw)
+            if all(_matches(data, f, op, v) for f, op, v in filters):
+                rows.append((doc_id, data))
+        self.reads += max(1, len(rows))
+        return rows
+
+    def _reindex(self, collection: tuple, doc_id: str, old: dict | None, new: dict | None):
+        index = self._index.setdefault(collection, {})
+        old_key, new_key = (old or {}).get(INDEXED_FIELD), (new or {}).get(INDEXED_FIELD)
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            index.get(old_key, set()).discard(doc_id)
+        if new_key is not None:
+            index.setdefault(new_key, set()).add(doc_id)
+
+    def _apply(self, writes: list):
+        """Aplica as escritas de forma atômica (todas sob o mesmo lock)."""
+        with self._lock:
+            for op, path, data, merge in writes:
+                if op == 'update' and path[-1] not in self._collections.get(path[:-1], {}):
+                    raise KeyError(f"documento não encontrado: {'/'.join(path)}")
+                if op == 'create' and path[-1] in self._collections.get(path[:-1], {}):
+                    raise AlreadyExists(f"documento já existe: {'/'.join(path)}")
+            for op, path, data, merge in writes:
+                self.writes += 1
+                collection, doc_id = path[:-1], path[-1]
+                docs = self._collections.setdefault(collection, {})
+                raw = docs.pop(doc_id, None)
+                old = pickle.loads(raw) if raw is not None else None
+                if raw is not None:
+                    self.stored_bytes -= sys.getsizeof(raw) + sys.getsizeof(doc_id) + _ENTRY_OVERHEAD
+                if op == 'delete':
+                    new = None
+                elif op in ('create', 'set') and not merge:
+                    new = _resolve(data, None)
+                elif op == 'set':
+                    new = copy.deepcopy(old) if old is not None else {}
+                    _merge(new, data)
+                else:
+                    new = copy.deepcopy(old)
+                    for field_path, value in data.items():
+                        _set_path(new, field_path, value)
+                if new is not None:
+                    raw = pickle.dumps(new, protocol=pickle.HIGHEST_PROTOCOL)
+                    docs[doc_id] = raw
+                    self.stored_bytes += sys.getsizeof(raw) + sys.getsizeof(doc_id) + _ENTRY_OVERHEAD
+                self._reindex(collection, doc_id, old, new)
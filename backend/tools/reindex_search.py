@@ -0,0 +1,32 @@
+# backend/tools/reindex_search.py
+"""
+Reconstrói o índice de busca (`search_postings`) a partir das transações.
+
+Necessário uma vez, para indexar o histórico, e sempre que lançamentos
+feitos fora do backend (pelo dashboard) precisarem aparecer no `buscar`.
+
+Uso (a partir de backend/):
+    python tools/reindex_search.py [firebase_uid ...]
+
+Sem argumentos, reindexa todos os usuários vinculados em `telegram_users`.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clients import db  # noqa: E402
+from notifications import chats_by_user  # noqa: E402
+from search_index import reindex_user  # noqa: E402
+
+
+def main():
+    firebase_uids = sys.argv[1:] or sorted(chats_by_user())
+    for firebase_uid in firebase_uids:
+        count = reindex_user(db, firebase_uid)
+        print(f"{firebase_uid}: {count} transações indexadas")
+
+
+if __name__ == '__main__':
+    main()
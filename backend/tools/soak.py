@@ -0,0 +1,537 @@
+# backend/tools/soak.py
+"""
+Teste de carga e de longa duração (soak) do webhook e da API, todo local.
+
+Sobe um servidor Telegram falso (HTTP/1.1) e um Firestore em memória
+(tools/fake_firestore.py), cria milhares de usuários sintéticos (chat
+vinculado, contas, categorias, orçamentos do mês, metas, contas a pagar,
+chave de API) e dispara, de N threads, uma mistura de tráfego:
+
+- despesas e rendas com o clique no botão da conta (callback_query);
+- transações rápidas (`*`), consultas `ver ...`, `buscar` e o manual;
+- chats novos que nunca concluem o registro (ficam em `awaiting_email`);
+- `POST /api/transaction`, `GET /api/categories` e `GET /api/bootstrap`;
+- `/api/cron` e `/api/reminders` a cada `--cron-every` segundos (cada
+  rodada com um `run_key` novo; os leases ficam em arquivos, ver jobs.py).
+
+A cada `--sample-every` segundos imprime vazão, p50/p99 por rota, o RSS do
+processo, a contagem de objetos do `gc` e o tamanho de `user_data` do PTB.
+No fim, ajusta uma reta (mínimos quadrados) ao RSS e aos objetos em função
+das requisições feitas, só com as amostras depois do aquecimento, e sai com
+código 1 se o crescimento por 1000 requisições passar dos limites. Do RSS é
+descontado o volume de dados gravado no Firestore falso, que cresce por
+definição.
+
+O RSS só pega vazamentos grandes (o alocador segura memória dos picos) e o
+`gc` não vê ints, strings e bytes. Com `--tracemalloc` o heap do Python
+(menos o volume de dados do Firestore falso) também é medido e verificado,
+e saem os pontos de alocação que mais cresceram depois do aquecimento — foi assim que apareceram as filas de
+persistence do PTB (ver `prune_conversation_state` em bot.py). Os caches
+com limite (LRU) crescem até encher: rode o bastante para o aquecimento
+cobrir isso.
+
+Uso (a partir de backend/):
+    python tools/soak.py [--users 2000] [--threads 16] [--duration 120]
+                         [--firestore-latency-ms 0] [--telegram-latency-ms 0]
+                         [--max-rss-kb-per-1k 512] [--max-objects-per-1k 200]
+                         [--tracemalloc [QUADROS]] [--max-heap-kb-per-1k 32]
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_TOKEN = '123456:soak'
+CRON_SECRET = 'soak-cron'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Soak', 'username': 'soak_bot'}
+FIRST_CHAT_ID = 100_000
+FIRST_CHURN_CHAT_ID = 900_000_000
+# Histograma de latências em baldes geométricos de 5%: memória constante
+HISTOGRAM_BASE = 1.05
+
+EXPENSE_CATEGORIES = ['alimentação', 'transporte', 'mercado', 'lazer', 'saúde']
+INCOME_CATEGORIES = ['salário', 'freelance']
+BUDGETED = {'alimentação': 900.0, 'transporte': 300.0, 'mercado': 1200.0}
+VIEWS = ['ver orçamentos', 'ver categorias', 'ver gastos hoje', 'ver contas', 'ver hoje']
+SEARCHES = ['buscar mercado', 'buscar uber', 'buscar almoço']
+
+# (ação, peso)
+TRAFFIC_MIX = [
+    ('despesa', 25), ('renda', 4), ('rapida', 10), ('ver', 25), ('buscar', 4), ('manual', 2),
+    ('novo_chat', 10), ('api_transacao', 12), ('api_categorias', 4), ('api_bootstrap', 4),
+]
+
+
+# --- TELEGRAM FALSO ---
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """
+    Responde os métodos da Bot API usados pelo bot. Guarda o `callback_data`
+    do primeiro botão do último teclado enviado a cada chat, para o gerador
+    simular o clique.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em writes separados: sem isso o Nagle + ACK
+    # atrasado somam ~40 ms a cada chamada
+    disable_nagle_algorithm = True
+    latency = 0.0
+    calls = Counter()
+    keyboards = {}
+    message_ids = itertools.count(1)
+
+    def log_message(self, *args):
+        pass
+
+    def _params(self) -> dict:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if 'json' in self.headers.get('Content-Type', ''):
+            return json.loads(body or b'{}')
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    def do_POST(self):
+        params = self._params()
+        method = self.path.rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        chat_id = int(params.get('chat_id', 0) or 0)
+        markup = params.get('reply_markup')
+        if markup:
+            markup = json.loads(markup) if isinstance(markup, str) else markup
+            buttons = [b for row in markup.get('inline_keyboard', []) for b in row if b.get('callback_data')]
+            if buttons:
+                self.keyboards[chat_id] = buttons[0]['callback_data']
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in ('sendMessage', 'editMessageText'):
+            result = {'message_id': int(params.get('message_id') or next(self.message_ids)), 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        else:
+            result = True
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_telegram(latency_ms: float):
+    FakeTelegramHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/bot"
+
+
+# --- AUTH FALSO ---
+class FakeAuth:
+    """`firebase_admin.auth` com e-mails conhecidos; o ID token é o próprio uid."""
+
+    class UserNotFoundError(Exception):
+        pass
+
+    class InvalidIdTokenError(Exception):
+        pass
+
+    def __init__(self, uids_by_email: dict[str, str]):
+        self.uids_by_email = uids_by_email
+        self.uids = set(uids_by_email.values())
+
+    def get_user_by_email(self, email: str):
+        if email not in self.uids_by_email:
+            raise self.UserNotFoundError(email)
+        return SimpleNamespace(uid=self.uids_by_email[email], email=email)
+
+    def verify_id_token(self, token: str) -> dict:
+        if token not in self.uids:
+            raise self.InvalidIdTokenError(token)
+        return {'uid': token}
+
+
+# --- DADOS SINTÉTICOS ---
+def user_uid(i: int) -> str:
+    return f"soak-user-{i:06d}"
+
+
+def api_key(i: int) -> str:
+    return f"soak-key-{i:06d}"
+
+
+def seed(db, users: int, now: datetime) -> dict[str, str]:
+    """Cria os usuários sintéticos e devolve {e-mail: uid}."""
+    uids_by_email = {}
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for i in range(users):
+        uid, email = user_uid(i), f"user{i}@soak.test"
+        uids_by_email[email] = uid
+        batch = db.batch()
+        batch.set(db.collection('telegram_users').document(str(FIRST_CHAT_ID + i)),
+                  {'firebase_uid': uid, 'user_email': email, 'createdAt': now})
+        batch.set(db.collection('users').document(uid), {'email': email, 'apiKey': api_key(i)})
+        batch.set(db.collection('accounts').document(f"{uid}-carteira"),
+                  {'userId': uid, 'accountName': 'Carteira', 'balance': 1000.0, 'isDefault': True})
+        batch.set(db.collection('accounts').document(f"{uid}-banco"),
+                  {'userId': uid, 'accountName': 'Banco', 'balance': 5000.0, 'isDefault': False})
+        for name in EXPENSE_CATEGORIES:
+            batch.set(db.collection('categories').document(), {'userId': uid, 'name': name, 'type': 'expense'})
+        for name in INCOME_CATEGORIES:
+            batch.set(db.collection('categories').document(), {'userId': uid, 'name': name, 'type': 'income'})
+        for name, amount in BUDGETED.items():
+            batch.set(db.collection('budgets').document(), {'userId': uid, 'categoryName': name, 'amount': amount,
+                                                            'month': now.month, 'year': now.year})
+        batch.set(db.collection('goals').document(), {'userId': uid, 'goalName': 'Viagem', 'targetAmount': 5000.0,
+                                                      'savedAmount': 0.0, 'status': 'active'})
+        batch.set(db.collection('scheduled_transactions').document(),
+                  {'userId': uid, 'description': 'Internet', 'amount': 100.0, 'categoryName': 'lazer',
+                   'dueDate': now + timedelta(days=1 + i % 5), 'status': 'pending', 'isRecurring': False})
+        batch.set(db.collection('scheduled_transactions').document(),
+                  {'userId': uid, 'description': 'Aluguel', 'amount': 1500.0, 'categoryName': 'mercado',
+                   'dueDate': month_start - timedelta(days=20), 'status': 'paid', 'isRecurring': True})
+        for day in range(min(now.day, 10)):
+            category = EXPENSE_CATEGORIES[day % len(EXPENSE_CATEGORIES)]
+            batch.set(db.collection('transactions').document(),
+                      {'userId': uid, 'type': 'expense', 'amount': 20.0 + day, 'category': category,
+                       'description': 'seed', 'accountId': f"{uid}-carteira", 'createdAt': month_start + timedelta(days=day)})
+        batch.commit()
+    return uids_by_email
+
+
+# --- GERADOR DE TRÁFEGO ---
+class Histogram:
+    """Contagens por balde geométrico de latência (a partir de 1 µs)."""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.buckets[int(math.log(max(seconds * 1e6, 1), HISTOGRAM_BASE))] += 1
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """Limite superior (em segundos) do balde que contém o quantil `q`."""
+        target, seen = q * self.count, 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return HISTOGRAM_BASE ** (bucket + 1) / 1e6
+        return 0.0
+
+
+class Stats:
+    """Latências por rota (janela atual e total), com lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = Counter()
+        self.window = Histogram()
+        self.routes = {}
+
+    def record(self, label: str, elapsed: float, ok: bool):
+        with self.lock:
+            self.requests += 1
+            if not ok:
+                self.errors[label] += 1
+            self.window.add(elapsed)
+            self.routes.setdefault(label, Histogram()).add(elapsed)
+
+    def take_window(self) -> Histogram:
+        with self.lock:
+            window, self.window = self.window, Histogram()
+        return window
+
+
+class Driver:
+    def __init__(self, app, users: int, stats: Stats):
+        self.app = app
+        self.users = users
+        self.stats = stats
+        self.update_ids = itertools.count(1)
+        self.churn_ids = itertools.count(FIRST_CHURN_CHAT_ID)
+        self.actions, self.weights = zip(*TRAFFIC_MIX)
+
+    def _timed(self, label: str, call) -> object:
+        started = time.perf_counter()
+        try:
+            response = call()
+            ok = response.status_code < 500
+        except Exception as e:
+            print(f"[{label}] {e}")
+            response, ok = None, False
+        self.stats.record(label, time.perf_counter() - started, ok)
+        return response
+
+    def _send_update(self, client, label: str, update: dict):
+        update['update_id'] = next(self.update_ids)
+        self._timed(label, lambda: client.post('/api/bot', json=update))
+
+    def message(self, client, label: str, chat_id: int, text: str):
+        self._send_update(client, label, {'message': {
+            'message_id': next(self.update_ids), 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Soak'},
+        }})
+
+    def click(self, client, chat_id: int):
+        data = FakeTelegramHandler.keyboards.pop(chat_id, None)
+        if not data:
+            return
+        self._send_update(client, 'bot:callback', {'callback_query': {
+            'id': str(next(self.update_ids)), 'chat_instance': str(chat_id), 'data': data,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Soak'},
+            'message': {'message_id': next(self.update_ids), 'date': int(time.time()), 'text': '...',
+                        'chat': {'id': chat_id, 'type': 'private'}},
+        }})
+
+    def step(self, client):
+        action = random.choices(self.actions, self.weights)[0]
+        i = random.randrange(self.users)
+        chat_id = FIRST_CHAT_ID + i
+        amount = f"{random.randint(1, 200)},{random.randint(0, 99):02d}"
+        if action == 'despesa':
+            self.message(client, 'bot:despesa', chat_id, f"{amount} {random.choice(EXPENSE_CATEGORIES)} almoço")
+            self.click(client, chat_id)
+        elif action == 'renda':
+            self.message(client, 'bot:renda', chat_id, f"+ {amount} {random.choice(INCOME_CATEGORIES)}")
+            self.click(client, chat_id)
+        elif action == 'rapida':
+            self.message(client, 'bot:rapida', chat_id, f"* {amount} {random.choice(EXPENSE_CATEGORIES)}")
+        elif action == 'ver':
+            self.message(client, 'bot:ver', chat_id, random.choice(VIEWS))
+        elif action == 'buscar':
+            self.message(client, 'bot:buscar', chat_id, random.choice(SEARCHES))
+        elif action == 'manual':
+            self.message(client, 'bot:manual', chat_id, '?')
+        elif action == 'novo_chat':
+            # Chat novo que recebe o pedido de e-mail e manda um e-mail desconhecido
+            churn_id = next(self.churn_ids)
+            self.message(client, 'bot:novo_chat', churn_id, 'oi')
+            self.message(client, 'bot:novo_chat', churn_id, f"ninguem{churn_id}@soak.test")
+        elif action == 'api_transacao':
+            self._timed('api:transaction', lambda: client.post(
+                '/api/transaction', headers={'X-API-Key': api_key(i)},
+                json={'amount': random.randint(1, 100), 'category': random.choice(EXPENSE_CATEGORIES)}))
+        elif action == 'api_categorias':
+            self._timed('api:categories', lambda: client.get('/api/categories', headers={'X-API-Key': api_key(i)}))
+        elif action == 'api_bootstrap':
+            self._timed('api:bootstrap', lambda: client.get(
+                '/api/bootstrap', headers={'Authorization': f"Bearer {user_uid(i)}"}))
+
+    def run_worker(self, stop: threading.Event):
+        client = self.app.test_client()
+        while not stop.is_set():
+            self.step(client)
+
+    def run_crons(self, stop: threading.Event, every: float):
+        client = self.app.test_client()
+        headers = {'Authorization': f"Bearer {CRON_SECRET}"}
+        for round_number in itertools.count(1):
+            if stop.wait(every):
+                return
+            url = f'/api/cron?run_key=soak-{round_number}'
+            self._timed('cron:recurrence', lambda: client.get(url, headers=headers))
+            self._timed('cron:reminders', lambda: client.get('/api/reminders', headers=headers))
+
+
+# --- MEMÓRIA ---
+def rss_kb() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def object_types() -> Counter:
+    # Raro: gc.get_objects() pode expor uma tupla ainda em construção noutra
+    # thread, que então falha com SystemError ("bad argument to internal function")
+    gc.collect()
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def heap_snapshot() -> tracemalloc.Snapshot:
+    """Alocações do Python vivas, menos os dados guardados no Firestore falso."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, '*fake_firestore.py'), tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+
+
+def slope(points: list[tuple[float, float]]) -> float:
+    """Inclinação da reta de mínimos quadrados por `points` (x, y)."""
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x if var_x else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=120, help="segundos de tráfego")
+    parser.add_argument('--warmup', type=float, default=None,
+                        help="segundos ignorados na análise de crescimento (padrão: metade da duração)")
+    parser.add_argument('--sample-every', type=float, default=5)
+    parser.add_argument('--cron-every', type=float, default=30, help="segundos entre execuções dos crons (0 = sem crons)")
+    parser.add_argument('--firestore-latency-ms', type=float, default=0)
+    parser.add_argument('--telegram-latency-ms', type=float, default=0)
+    parser.add_argument('--state-ttl', type=float, default=30,
+                        help="CONVERSATION_STATE_TTL_SECONDS do bot durante o soak")
+    parser.add_argument('--prune-every', type=float, default=5,
+                        help="CONVERSATION_PRUNE_INTERVAL_SECONDS do bot durante o soak")
+    parser.add_argument('--max-rss-kb-per-1k', type=float, default=512,
+                        help="crescimento máximo do RSS (KiB) a cada 1000 requisições")
+    parser.add_argument('--max-objects-per-1k', type=float, default=200,
+                        help="crescimento máximo de objetos do gc a cada 1000 requisições")
+    parser.add_argument('--tracemalloc', type=int, nargs='?', const=1, default=0, metavar='QUADROS',
+                        help="mede o heap do Python, guardando QUADROS níveis de pilha por alocação (mais lento)")
+    parser.add_argument('--max-heap-kb-per-1k', type=float, default=32,
+                        help="crescimento máximo do heap (KiB) a cada 1000 requisições, com --tracemalloc")
+    args = parser.parse_args()
+    warmup = args.duration / 2 if args.warmup is None else args.warmup
+
+    telegram_server, telegram_url = start_telegram(args.telegram_latency_ms)
+    # Configuração lida na importação dos módulos do bot
+    os.environ.update({
+        'TELEGRAM_TOKEN': FAKE_TOKEN,
+        'TELEGRAM_API_URL': telegram_url,
+        'TELEGRAM_HTTP2': '0',
+        'TELEGRAM_GLOBAL_RATE': '1000000',
+        'TELEGRAM_CHAT_RATE': '1000000',
+        'TELEGRAM_CHAT_BURST': '1000000',
+        'CRON_SECRET': CRON_SECRET,
+        'CONVERSATION_STATE_TTL_SECONDS': str(args.state_ttl),
+        'CONVERSATION_PRUNE_INTERVAL_SECONDS': str(args.prune_every),
+        'JOB_LEASE_BACKEND': 'file',
+        'JOB_LEASE_DIR': tempfile.mkdtemp(prefix='soak-leases-'),
+    })
+
+    import clients
+    from fake_firestore import FakeFirestore
+
+    fake_db = FakeFirestore(latency_ms=args.firestore_latency_ms)
+    clients._db = fake_db
+
+    import bot
+
+    started = time.perf_counter()
+    uids_by_email = seed(fake_db, args.users, datetime.now(timezone.utc))
+    bot.auth = FakeAuth(uids_by_email)
+    print(f"{args.users} usuários criados em {time.perf_counter() - started:.1f}s; "
+          f"{args.threads} threads por {args.duration:.0f}s")
+
+    stats = Stats()
+    driver = Driver(bot.app, args.users, stats)
+    stop = threading.Event()
+    threads = [threading.Thread(target=driver.run_worker, args=(stop,), daemon=True) for _ in range(args.threads)]
+    if args.cron_every > 0:
+        threads.append(threading.Thread(target=driver.run_crons, args=(stop, args.cron_every), daemon=True))
+
+    samples = []
+    baseline_types = baseline_heap = latest_heap = None
+    if args.tracemalloc:
+        tracemalloc.start(args.tracemalloc)
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    print(f"{'t(s)':>6} {'reqs':>8} {'req/s':>7} {'p50ms':>7} {'p99ms':>7} {'rss(MiB)':>9} {'dados(MiB)':>10} "
+          f"{'objetos':>9} {'user_data':>9} {'erros':>6}")
+    try:
+        while (elapsed := time.perf_counter() - started) < args.duration:
+            time.sleep(min(args.sample_every, args.duration - elapsed))
+            elapsed = time.perf_counter() - started
+            window = stats.take_window()
+            types = object_types()
+            ptb_app = bot._ptb_app
+            if baseline_types is None and elapsed >= warmup and args.tracemalloc:
+                # Antes da medição: a própria cópia do heap entra em todas as amostras seguintes
+                baseline_heap = heap_snapshot()
+            sample = {
+                't': elapsed, 'requests': stats.requests, 'data_kb': fake_db.stored_bytes / 1024,
+                'rss_kb': rss_kb() - (tracemalloc.get_tracemalloc_memory() / 1024 if args.tracemalloc else 0),
+                'objects': sum(types.values()), 'user_data': len(ptb_app.user_data) if ptb_app else 0,
+            }
+            if args.tracemalloc:
+                sample['heap_kb'] = tracemalloc.get_traced_memory()[0] / 1024 - sample['data_kb']
+            if baseline_types is None and elapsed >= warmup:
+                baseline_types = types
+            latest_types = types
+            samples.append(sample)
+            print(f"{elapsed:6.0f} {sample['requests']:8d} {window.count / args.sample_every:7.1f} "
+                  f"{window.percentile(0.5) * 1000:7.1f} {window.percentile(0.99) * 1000:7.1f} "
+                  f"{sample['rss_kb'] / 1024:9.1f} {sample['data_kb'] / 1024:10.1f} {sample['objects']:9d} "
+                  f"{sample['user_data']:9d} {sum(stats.errors.values()):6d}")
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=30)
+        telegram_server.shutdown()
+    if baseline_heap is not None:
+        latest_heap = heap_snapshot()
+
+    total = time.perf_counter() - started
+    print(f"\n{stats.requests} requisições em {total:.1f}s ({stats.requests / total:.1f} req/s); "
+          f"chamadas ao Telegram: {dict(FakeTelegramHandler.calls)}")
+    print(f"{'rota':<18} {'n':>7} {'p50ms':>8} {'p99ms':>8} {'erros':>6}")
+    for label, histogram in sorted(stats.routes.items()):
+        print(f"{label:<18} {histogram.count:7d} {histogram.percentile(0.5) * 1000:8.1f} "
+              f"{histogram.percentile(0.99) * 1000:8.1f} {stats.errors[label]:6d}")
+
+    steady = [s for s in samples if s['t'] >= warmup]
+    rss_growth = slope([(s['requests'] / 1000, s['rss_kb'] - s['data_kb']) for s in steady])
+    object_growth = slope([(s['requests'] / 1000, s['objects']) for s in steady])
+    print(f"\nCrescimento após {warmup:.0f}s ({len(steady)} amostras): "
+          f"RSS {rss_growth:.1f} KiB/1k req (limite {args.max_rss_kb_per_1k:.0f}), "
+          f"objetos {object_growth:.1f}/1k req (limite {args.max_objects_per_1k:.0f})")
+    if baseline_types is not None:
+        growing = (latest_types - baseline_types).most_common(10)
+        if growing:
+            print("Tipos que mais cresceram: " + ", ".join(f"{name} +{count}" for name, count in growing))
+    heap_growth = 0.0
+    if args.tracemalloc:
+        heap_growth = slope([(s['requests'] / 1000, s['heap_kb']) for s in steady])
+        print(f"Heap do Python: {heap_growth:.1f} KiB/1k req (limite {args.max_heap_kb_per_1k:.0f})")
+        if baseline_heap is not None:
+            for stat in latest_heap.compare_to(baseline_heap, 'traceback')[:8]:
+                if stat.size_diff <= 0:
+                    break
+                frames = " <- ".join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in reversed(stat.traceback))
+                print(f"  +{stat.size_diff / 1024:.1f} KiB ({stat.count_diff:+d}) {frames}")
+
+    failed = []
+    if len(steady) < 3:
+        failed.append("amostras insuficientes depois do aquecimento (aumente --duration)")
+    if rss_growth > args.max_rss_kb_per_1k:
+        failed.append("RSS crescendo sem limite")
+    if object_growth > args.max_objects_per_1k:
+        failed.append("objetos crescendo sem limite")
+    if heap_growth > args.max_heap_kb_per_1k:
+        failed.append("heap do Python crescendo sem limite")
+    if failed:
+        print("FALHOU: " + "; ".join(failed))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# backend/tracing.py
+"""
+Spans leves por requisição, exportados como JSON estruturado.
+
+Cada requisição amostrada recebe um trace ID guardado num `contextvars`
+(que o `run_on_bot_loop` do webhook propaga para os handlers). Dentro dela,
+`span("firestore.query", collection="budgets")` mede um trecho e, ao fechar,
+imprime uma linha JSON no formato de span do OTLP (traceId, spanId,
+parentSpanId, nanossegundos Unix, atributos), que um OpenTelemetry
+collector consegue ingerir com o receiver `filelog`.
+
+Com a amostragem desligada `span()` devolve um objeto no-op compartilhado:
+o custo é uma leitura de ContextVar por chamada.
+
+Configuração:
+- `TRACE_SAMPLE_RATE` (0.0 a 1.0, padrão 0): fração das requisições amostradas;
+- um cabeçalho W3C `traceparent` com a flag "sampled" força a amostragem e
+  reaproveita o trace ID de quem chamou. Qualquer um pode mandar esse
+  cabeçalho (o trace abre antes da autenticação da rota), então ele só vale
+  sem limite com `Authorization: Bearer <CRON_SECRET>`; para os demais, no
+  máximo `TRACE_FORCED_PER_MINUTE` por minuto (0 = nunca) em cada processo.
+"""
+
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "oikonomos-bot")
+TRACE_FORCED_PER_MINUTE = int(os.getenv("TRACE_FORCED_PER_MINUTE", "10"))
+CRON_SECRET = os.getenv("CRON_SECRET")
+
+# (trace_id, span_id do span atual) ou None quando a requisição não é amostrada
+_current = ContextVar('trace_context', default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, 'big').hex()
+
+
+def current_trace_id() -> str | None:
+    ctx = _current.get()
+    return ctx[0] if ctx else None
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current.set((self.trace_id, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.time_ns()
+        _current.reset(self._token)
+        record = {
+            'resource': {'service.name': SERVICE_NAME},
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': end_ns,
+            'attributes': self.attributes,
+            'status': {'code': 'ERROR', 'message': repr(exc)} if exc_type else {'code': 'OK'},
+        }
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+def span(name: str, **attributes):
+    """Mede um trecho dentro do trace atual (no-op se não houver trace amostrado)."""
+    ctx = _current.get()
+    if ctx is None:
+        return _NOOP
+    return Span(name, ctx[0], ctx[1], attributes)
+
+
+class _ForcedSamples:
+    """Janela fixa de um minuto para as amostragens forçadas sem autenticação."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        window = int(time.monotonic() // 60)
+        with self._lock:
+            if window != self._window:
+                self._window, self._count = window, 0
+            if self._count >= self.per_minute:
+                return False
+            self._count += 1
+            return True
+
+
+_forced_samples = _ForcedSamples(TRACE_FORCED_PER_MINUTE)
+
+
+def start_trace(name: str, traceparent: str | None = None, trusted: bool = False, **attributes):
+    """
+    Abre o span raiz de uma requisição, decidindo a amostragem aqui.
+    Devolve um no-op quando a requisição não é amostrada. `trusted` indica
+    quem chamou autenticado; sem isso a amostragem forçada pelo
+    `traceparent` é limitada.
+    """
+    trace_id, parent_id = None, None
+    if traceparent:
+        # version-traceid-parentid-flags
+        parts = traceparent.split('-')
+        try:
+            if len(parts) == 4 and int(parts[3], 16) & 1 and (trusted or _forced_samples.allow()):
+                trace_id, parent_id = parts[1], parts[2]
+        except ValueError:
+            pass
+    if trace_id is None:
+        if not TRACE_SAMPLE_RATE or random.random() >= TRACE_SAMPLE_RATE:
+            return _NOOP
+        trace_id = _new_id(16)
+    return Span(name, trace_id, parent_id, attributes)
+
+
+def traced(f):
+    """Decorador de rota: abre o trace da requisição Flask."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from flask import request
+        authorization = request.headers.get('Authorization') or ''
+        trusted = bool(CRON_SECRET) and secrets.compare_digest(authorization.encode(), f'Bearer {CRON_SECRET}'.encode())
+        with start_trace(f"{request.method} {request.path}", request.headers.get('traceparent'), trusted, route=request.path):
+            return f(*args, **kwargs)
+    return decorated_function
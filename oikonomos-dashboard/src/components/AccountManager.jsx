@@ -5,6 +5,7 @@ import { db, auth } from '../../firebaseClient';
 import { collection, query, where, getDocs, addDoc, doc, updateDoc, deleteDoc, Timestamp, writeBatch } from 'firebase/firestore';
 import toast from 'react-hot-toast';
 import { showConfirmationToast } from '../utils/toastUtils.jsx';
+import { bumpDataVersion, addDataVersionBump } from '../utils/dataVersion';
 import styles from './AccountManager.module.css';
 import EditAccountModal from './EditAccountModal';
 
@@ -33,6 +34,7 @@ function AccountManager({ onDataChanged, accounts = [] }) {
         isDefault: false, // <-- NOVO: Contas novas nunca são padrão
         createdAt: Timestamp.now(),
       });
+      await bumpDataVersion(user.uid);
       toast.success(`Conta '${newAccountName}' criada com sucesso!`);
       setNewAccountName('');
       setIsReserve(false);
@@ -64,6 +66,7 @@ function AccountManager({ onDataChanged, accounts = [] }) {
             const newDefaultRef = doc(db, "accounts", accountToSet.id);
             batch.update(newDefaultRef, { isDefault: true });
 
+            addDataVersionBump(batch, user.uid);
             await batch.commit();
             if (onDataChanged) onDataChanged();
             resolve();
@@ -94,6 +97,7 @@ function AccountManager({ onDataChanged, accounts = [] }) {
     try {
       const accountDocRef = doc(db, "accounts", accountId);
       await updateDoc(accountDocRef, updatedData);
+      await bumpDataVersion(user.uid);
       toast.success("Conta atualizada!");
       handleCloseEditModal();
       if (onDataChanged) onDataChanged();
@@ -109,6 +113,7 @@ function AccountManager({ onDataChanged, accounts = [] }) {
     }
     const deleteAction = async () => {
       await deleteDoc(doc(db, "accounts", account.id));
+      await bumpDataVersion(user.uid);
       toast.success(`Conta '${account.accountName}' excluída!`);
       if (onDataChanged) onDataChanged();
     };
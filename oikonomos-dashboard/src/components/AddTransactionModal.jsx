@@ -2,6 +2,7 @@ import React, { useState, useMemo, useEffect } from 'react';
 import { db, auth } from '../../firebaseClient';
 import { collection, doc, writeBatch, Timestamp, increment } from 'firebase/firestore';
 import toast from 'react-hot-toast';
+import { addDataVersionBump } from '../utils/dataVersion';
 import styles from './EditModal.module.css';
 
 function AddTransactionModal({ onCancel, onSave, categories, accounts }) {
@@ -118,6 +119,7 @@ function AddTransactionModal({ onCancel, onSave, categories, accounts }) {
                 });
             }
 
+            addDataVersionBump(batch, user.uid);
             await batch.commit();
             resolve();
         } catch(error) { reject(error); }
@@ -141,6 +143,7 @@ function AddTransactionModal({ onCancel, onSave, categories, accounts }) {
             const accountDocRef = doc(db, "accounts", selectedAccount);
             const amountToUpdate = type === 'income' ? parseFloat(amount) : -parseFloat(amount);
             batch.update(accountDocRef, { balance: increment(amountToUpdate) });
+            addDataVersionBump(batch, user.uid);
             await batch.commit();
             resolve();
         } catch (error) { reject(error); }
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { db, auth } from '../../firebaseClient';
 import { collection, query, where, getDocs, setDoc, doc } from 'firebase/firestore';
 import toast from 'react-hot-toast';
+import { bumpDataVersion } from '../utils/dataVersion';
 import styles from './BudgetManager.module.css';
 
 // <<< 1. RECEBE 'onDataChanged' EM VEZ DE 'fetchData'
@@ -72,6 +73,7 @@ const [searchTerm, setSearchTerm] = useState('');
         });
         try {
             await Promise.all(savePromises);
+            await bumpDataVersion(user.uid);
             resolve();
         } catch (error) {
             reject(error);
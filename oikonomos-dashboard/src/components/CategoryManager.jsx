@@ -3,6 +3,7 @@ import { db, auth } from '../../firebaseClient';
 import { collection, query, where, orderBy, getDocs, addDoc, deleteDoc, doc, updateDoc } from 'firebase/firestore';
 import toast from 'react-hot-toast';
 import { showConfirmationToast } from '../utils/toastUtils.jsx';
+import { bumpDataVersion } from '../utils/dataVersion';
 import styles from './CategoryManager.module.css';
 import EditCategoryModal from './EditCategoryModal';
 
@@ -44,6 +45,7 @@ function CategoryManager({ onDataChanged }) {
         type: newCategoryType,
         userId: user.uid,
       });
+      await bumpDataVersion(user.uid);
       setNewCategoryName('');
       toast.success("Categoria adicionada!");
       fetchCategories();
@@ -58,6 +60,7 @@ function CategoryManager({ onDataChanged }) {
     const deleteAction = async () => {
       try {
         await deleteDoc(doc(db, "categories", categoryId));
+        await bumpDataVersion(user.uid);
         toast.success("Categoria excluída!");
         fetchCategories();
         if (onDataChanged) onDataChanged();
@@ -84,6 +87,7 @@ function CategoryManager({ onDataChanged }) {
     try {
       const categoryDocRef = doc(db, "categories", categoryId);
       await updateDoc(categoryDocRef, updatedData);
+      await bumpDataVersion(user.uid);
       toast.success("Categoria atualizada com sucesso!");
       handleCloseEditModal();
       fetchCategories();
@@ -13,6 +13,7 @@ import CategoryFilter from './CategoryFilter';
 import AccountFilter from './AccountFilter';
 import HelpModal from './HelpModal';
 import { parseCSVAndValidate } from '../utils/importUtils';
+import { bumpDataVersion, addDataVersionBump } from '../utils/dataVersion';
 // Estilos
 import styles from './Dashboard.module.css';
 
@@ -213,6 +214,7 @@ function Dashboard({ user, userProfile }) {
           batch.update(accountDocRef, { balance: increment(amountToUpdate) });
         });
 
+        addDataVersionBump(batch, user.uid);
         await batch.commit();
 
         toast.success(`${validTransactions.length} transações importadas com sucesso!`, { id: toastId });
@@ -245,6 +247,7 @@ function Dashboard({ user, userProfile }) {
     const deleteAction = async () => {
       try {
         await deleteDoc(doc(db, "transactions", transactionId));
+        await bumpDataVersion(user.uid);
         triggerRefresh();
         toast.success("Transação excluída!");
       } catch (error) {
@@ -261,6 +264,7 @@ function Dashboard({ user, userProfile }) {
         batch.delete(doc(db, "transactions", transactionId));
       });
       try {
+        addDataVersionBump(batch, user.uid);
         await batch.commit();
         toast.success(`${selectedTransactions.size} transação(ões) excluída(s)!`);
         toggleSelectionMode(); // Sai do modo de seleção
@@ -297,7 +301,7 @@ function Dashboard({ user, userProfile }) {
   const handleSetTodayFilter = () => setFilterDateRange(new Date(), new Date());
   const handleSetYearlyFilter = () => { const t = new Date(); setFilterDateRange(new Date(t.getFullYear(), 0, 1), new Date(t.getFullYear(), 11, 31)); };
   const handleOpenEditModal = (transaction) => { setEditingTransaction(transaction); setIsModalOpen(true); };
-  const handleSaveTransaction = async (updatedData) => { if (!editingTransaction) return; await updateDoc(doc(db, "transactions", editingTransaction.id), updatedData); setIsModalOpen(false); setEditingTransaction(null); triggerRefresh(); toast.success("Transação atualizada!"); };
+  const handleSaveTransaction = async (updatedData) => { if (!editingTransaction) return; await updateDoc(doc(db, "transactions", editingTransaction.id), updatedData); await bumpDataVersion(user.uid); setIsModalOpen(false); setEditingTransaction(null); triggerRefresh(); toast.success("Transação atualizada!"); };
 
   if (loading) return <div>Carregando suas finanças...</div>;
 
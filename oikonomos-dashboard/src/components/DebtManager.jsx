@@ -3,6 +3,7 @@ import { db, auth } from '../../firebaseClient';
 import { collection, query, where, orderBy, getDocs, addDoc, deleteDoc, updateDoc, doc, Timestamp, writeBatch, increment } from 'firebase/firestore';
 import toast from 'react-hot-toast';
 import { showConfirmationToast } from '../utils/toastUtils.jsx';
+import { bumpDataVersion, addDataVersionBump } from '../utils/dataVersion';
 import styles from './DebtManager.module.css';
 import EditDebtModal from './EditDebtModal';
 import SelectAccountModal from './SelectAccountModal';
@@ -75,6 +76,7 @@ function DebtManager({ expenseCategories, accounts, onDataChanged }) {
           status: 'pending',
           isRecurring: isRecurring,
         });
+        await bumpDataVersion(user.uid);
         
         setNewDesc('');
         setNewAmount('');
@@ -137,6 +139,7 @@ function DebtManager({ expenseCategories, accounts, onDataChanged }) {
             });
         }
 
+        addDataVersionBump(batch, user.uid);
         await batch.commit();
         if (onDataChanged) onDataChanged();
         toast.success(`'${debtToPay.description}' foi paga e registada!`);
@@ -151,6 +154,7 @@ function DebtManager({ expenseCategories, accounts, onDataChanged }) {
     const deleteAction = async () => {
         try {
             await deleteDoc(doc(db, "scheduled_transactions", debtId));
+            await bumpDataVersion(user.uid);
             await fetchDebts();
             if (onDataChanged) onDataChanged();
             toast.success("Conta agendada excluída!");
@@ -173,6 +177,7 @@ function DebtManager({ expenseCategories, accounts, onDataChanged }) {
     try {
         const debtDocRef = doc(db, "scheduled_transactions", debtId);
         await updateDoc(debtDocRef, updatedData);
+        await bumpDataVersion(user.uid);
         toast.success("Conta atualizada!");
         handleCloseEditModal();
         await fetchDebts();
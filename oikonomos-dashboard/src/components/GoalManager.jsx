@@ -3,6 +3,7 @@ import { db, auth } from '../../firebaseClient';
 import { collection, query, where, getDocs, addDoc, deleteDoc, updateDoc, doc, increment, Timestamp, writeBatch } from 'firebase/firestore';
 import toast from 'react-hot-toast';
 import { showConfirmationToast } from '../utils/toastUtils.jsx';
+import { bumpDataVersion, addDataVersionBump } from '../utils/dataVersion';
 import CompleteGoalModal from './CompleteGoalModal';
 // Componentes Filhos
 import EditGoalModal from './EditGoalModal';
@@ -57,6 +58,7 @@ function GoalManager({ onDataChanged, accounts = [] }) {
         createdAt: new Date(),
         status: 'active',
       });
+      await bumpDataVersion(user.uid);
       setNewGoalName('');
       setNewTargetAmount('');
       setNewTargetDate(''); // <<< LIMPA O CAMPO DE DATA
@@ -116,6 +118,7 @@ function GoalManager({ onDataChanged, accounts = [] }) {
         const goalDocRef = doc(db, "goals", goal.id);
         batch.delete(goalDocRef); // Apaga a meta da coleção 'goals'
 
+        addDataVersionBump(batch, user.uid);
         await batch.commit();
         resolve();
       } catch (error) {
@@ -175,6 +178,7 @@ function GoalManager({ onDataChanged, accounts = [] }) {
             const accountDocRef = doc(db, "accounts", selectedAccountId);
             batch.update(accountDocRef, { balance: increment(-amount) });
             
+            addDataVersionBump(batch, user.uid);
             await batch.commit();
             if (onDataChanged) onDataChanged();
             resolve();
@@ -206,6 +210,7 @@ function GoalManager({ onDataChanged, accounts = [] }) {
     try {
       const goalDocRef = doc(db, "goals", goalId);
       await updateDoc(goalDocRef, updatedData);
+      await bumpDataVersion(user.uid);
       toast.success("Meta atualizada com sucesso!");
       handleCloseEditModal();
       fetchGoals();
@@ -220,6 +225,7 @@ function GoalManager({ onDataChanged, accounts = [] }) {
     const deleteAction = async () => {
       try {
         await deleteDoc(doc(db, "goals", goalId));
+        await bumpDataVersion(user.uid);
         fetchGoals();
         toast.success("Meta excluída!");
       } catch (error) {
@@ -0,0 +1,16 @@
+// src/utils/dataVersion.js
+// Contador de versão dos dados do usuário (data_versions/{uid}).
+// O backend usa a versão como chave dos relatórios do bot em cache: toda
+// escrita em transações, categorias, orçamentos, contas, metas ou contas a
+// pagar precisa incrementá-la, senão o bot responde com dados antigos.
+import { db } from '../../firebaseClient';
+import { doc, setDoc, increment } from 'firebase/firestore';
+
+const versionRef = (uid) => doc(db, 'data_versions', uid);
+const versionBump = (uid) => ({ userId: uid, version: increment(1) });
+
+// Dentro de um writeBatch: o incremento entra no mesmo commit atômico
+export const addDataVersionBump = (batch, uid) => batch.set(versionRef(uid), versionBump(uid), { merge: true });
+
+// Depois de uma escrita avulsa (addDoc, updateDoc, deleteDoc, setDoc)
+export const bumpDataVersion = (uid) => setDoc(versionRef(uid), versionBump(uid), { merge: true });